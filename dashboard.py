@@ -1,41 +1,25 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
-import warnings
 import io
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
 from datetime import datetime
-import os
-import re # Pour le parsing (bien que nous le remplacions)
-
-# --- NOUVEAU: Import de Scipy pour l'optimisation ---
-try:
-    import scipy.optimize as sco
-    SCIPY_AVAILABLE = True
-except ImportError:
-    SCIPY_AVAILABLE = False
-    st.warning("Module 'scipy' non trouvé. L'optimisation automatique est désactivée. Passage en mode manuel.")
-# --- FIN NOUVEAU ---
+
+import engine
+from engine import (
+    ASSET_WEIGHT_LIMIT, ATTRIBUTION_EFFECTS, BENCHMARK_WEIGHTS, BOOTSTRAP_BLOCK_LENGTH, BOOTSTRAP_CONFIDENCE, BOOTSTRAP_RESAMPLES, CALENDAR_DAYS, CASH_RATE_ANNUAL, CASH_TICKER_NAME, CORRELATION_CLUSTERS, COVARIANCE_METHODS,
+    FRONTIER_POINTS, MANAGEMENT_FEE_ANNUAL, MC_HORIZONS, MC_PATHS, PERIOD_WINDOWS, REBALANCE_PERIODS, RISK_FREE_RATE_ANNUAL, ROLLING_METRICS,
+    ROLLING_WINDOW_DEFAULT, ROLLING_WINDOWS, SCIPY_AVAILABLE, START_DATE_SIMULATION, TRADING_DAYS, TRANSACTION_FEE_RATE, WALK_FORWARD_LOOKBACKS,
+    benchmark_composition, calculate_benchmark_returns, calculate_daily_rates, covariance_frame, get_tickers_by_class, portfolio_point,
+    random_capped_weights, simulate_portfolios_batch,
+)
 
 
 # --- Configuration & CSS ---
 st.set_page_config(layout="wide", page_title="M2 MBFA Terminal", page_icon="📊", initial_sidebar_state="expanded")
-
-# --- Constantes (Mises à jour avec les règles du mandat) ---
-EXCEL_URL = "https://docs.google.com/spreadsheets/d/1VqgRMRJJ3DaCYKJ1OT77LFn9ExUUifO7x3Zzqq6fmwQ/export?format=xlsx"
-MANAGEMENT_FEE_ANNUAL = 0.01 # 1% [Source: PDF page 3]
-CASH_RATE_ANNUAL = 0.015 # 1.5% [Source: PDF page 3]
-TRANSACTION_FEE_RATE = 0.001 # 0.10% [Source: PDF page 3]
-RISK_FREE_RATE_ANNUAL = 0.015 # Supposons égal au taux cash pour Sharpe
-TRADING_DAYS = 252 # Pour annualisation du risque (Vol, Sharpe, TE)
-CALENDAR_DAYS = 365 # Pour annualisation/journalisation des frais et taux cash
-BENCHMARK_WEIGHTS = {'Action': 0.60, 'Gov bond': 0.20, 'Commodities': 0.15, 'Cash': 0.05} # [Source: PDF page 2]
-START_DATE_SIMULATION = pd.to_datetime('2025-10-06') # [Source: PDF page 4]
-INITIAL_NAV_EUR = 100_000_000 # 100M € [Source: PDF page 1]
-CASH_TICKER_NAME = "CASH EUR" # [Source: PDF page 2]
-ASSET_WEIGHT_LIMIT = 0.10 # Limite de 10% par actif
+if not SCIPY_AVAILABLE:
+    st.warning("Module 'scipy' non trouvé. L'optimisation automatique est désactivée. Passage en mode manuel.")
 
 # Palette Bloomberg authentique
 COLORS = {
@@ -153,53 +137,6 @@ custom_css = f"""
 """
 st.markdown(custom_css, unsafe_allow_html=True)
 
-# --- Fonctions Utilitaires ---
-
-def calculate_daily_rates():
-    """Calcule les taux journaliers en base 365."""
-    cash_daily = (1 + CASH_RATE_ANNUAL) ** (1/CALENDAR_DAYS) - 1
-    rf_daily = (1 + RISK_FREE_RATE_ANNUAL) ** (1/TRADING_DAYS) - 1
-    mgmt_fee_daily = MANAGEMENT_FEE_ANNUAL / CALENDAR_DAYS
-    return cash_daily, rf_daily, mgmt_fee_daily
-
-def get_tickers_by_class(benchmark_df, available_columns):
-    """Retourne les tickers par classe d'actif."""
-    if 'BBG Ticker' not in benchmark_df.columns or 'Asset Class' not in benchmark_df.columns:
-        st.error("Colonnes 'BBG Ticker' ou 'Asset Class' manquantes dans 'Benchmark'.")
-        return {'action': [], 'bond': [], 'commodity': []}
-    benchmark_df['BBG Ticker'] = benchmark_df['BBG Ticker'].astype(str).str.strip()
-    asset_class_map = benchmark_df.set_index('BBG Ticker').loc[:, 'Asset Class']
-    available_columns_str = [str(col).strip() for col in available_columns]
-    return {
-        'action': [t for t in asset_class_map[asset_class_map == 'Action'].index if t in available_columns_str],
-        'bond': [t for t in asset_class_map[asset_class_map == 'Gov bond'].index if t in available_columns_str],
-        'commodity': [t for t in asset_class_map[asset_class_map == 'Commodities'].index if t in available_columns_str]
-    }
-
-def calculate_indicators(returns, rf_daily_for_sharpe):
-    """Calcule volatilité (annu TRADING_DAYS), Sharpe (annu TRADING_DAYS) et VaR."""
-    if returns is None or returns.empty or len(returns) < 2: return {'Volatilité': np.nan, 'Sharpe': np.nan, 'VaR 99%': np.nan}
-    vol = returns.std() * np.sqrt(TRADING_DAYS)
-    var = returns.quantile(0.01); sharpe = np.nan
-    std_dev = returns.std()
-    if std_dev != 0 and np.isfinite(std_dev):
-        excess = returns - rf_daily_for_sharpe
-        sharpe = (excess.mean() / std_dev) * np.sqrt(TRADING_DAYS)
-    return {'Volatilité': vol, 'Sharpe': sharpe, 'VaR 99%': var}
-
-def calculate_benchmark_returns(returns_period, tickers, cash_daily_rate):
-    """Calcule les rendements BRUTS quotidiens du benchmark."""
-    returns_by_class = {
-        'Action': returns_period[tickers['action']].mean(axis=1) if tickers['action'] else pd.Series(0, index=returns_period.index),
-        'Gov bond': returns_period[tickers['bond']].mean(axis=1) if tickers['bond'] else pd.Series(0, index=returns_period.index),
-        'Commodities': returns_period[tickers['commodity']].mean(axis=1) if tickers['commodity'] else pd.Series(0, index=returns_period.index),
-        'Cash': pd.Series(cash_daily_rate, index=returns_period.index)
-    }
-    common_index = returns_period.index; weighted_sum = pd.Series(0.0, index=common_index)
-    for k, weight in BENCHMARK_WEIGHTS.items():
-         if k in returns_by_class and not returns_by_class[k].empty: weighted_sum = weighted_sum.add(returns_by_class[k].reindex(common_index).fillna(0) * weight, fill_value=0)
-    return weighted_sum
-
 # --- Barre de progression HTML personnalisée ---
 def create_progress_bar(label, value, color):
     """Crée une barre de progression HTML."""
@@ -216,471 +153,6 @@ def create_progress_bar(label, value, color):
     </div>
     """
 
-# --- Fonctions de Chargement --- (Inchangées)
-@st.cache_data(ttl=3600)
-def load_data():
-    """Charge les données depuis Google Drive."""
-    try:
-        benchmark_df = pd.read_excel(EXCEL_URL, sheet_name="Benchmark"); required_cols = ['BBG Ticker', 'Asset Class']
-        if not all(col in benchmark_df.columns for col in required_cols): st.error(f"Colonnes manquantes dans 'Benchmark': {required_cols}"); return None, None, None
-        benchmark_df['BBG Ticker'] = benchmark_df['BBG Ticker'].astype(str).str.strip(); benchmark_df = benchmark_df.dropna(subset=['BBG Ticker'])
-
-        prices_df_raw = pd.read_excel(EXCEL_URL, sheet_name="Historique Prix", header=3)
-
-        portfolio_df = pd.read_excel(EXCEL_URL, sheet_name="Portefeuille", skiprows=1)
-        if len(portfolio_df.columns) < 6: st.error("'Portefeuille' sheet must have >= 6 columns."); return None, None, None
-        ticker_col = portfolio_df.columns[2]; weight_col = portfolio_df.columns[5] # Col C, Col F
-        portfolio_df = portfolio_df[[ticker_col, weight_col]].copy(); portfolio_df.columns = ['BBG Ticker', 'Weight']
-        portfolio_df['BBG Ticker'] = portfolio_df['BBG Ticker'].astype(str).str.strip(); portfolio_df = portfolio_df.dropna(subset=['BBG Ticker'])
-        portfolio_df['Weight'] = pd.to_numeric(portfolio_df['Weight'], errors='coerce'); portfolio_df = portfolio_df.dropna(subset=['Weight'])
-
-        total = portfolio_df['Weight'].sum()
-        if total <= 0: st.error("Sum of portfolio weights <= 0."); return None, None, None
-
-        if np.isclose(total, 100.0, atol=1.0): portfolio_df['Weight'] /= 100.0
-        elif not np.isclose(total, 1.0, atol=0.01): st.warning(f"Sum of weights ({total:.2f}) != 1 or 100. Normalizing..."); portfolio_df['Weight'] /= total
-
-        final_sum = portfolio_df['Weight'].sum()
-        if not np.isclose(final_sum, 1.0, atol=0.01): st.error(f"Weight normalization failed. Sum: {final_sum:.4f}"); return None, None, None
-
-        return benchmark_df, prices_df_raw, portfolio_df
-
-    except Exception as e: st.error(f"Error loading data: {e}"); return None, None, None
-
-@st.cache_data
-def process_prices(prices_df_raw):
-    """Traite les données de prix."""
-    if prices_df_raw is None: return None, None
-    original_cols = prices_df_raw.columns.tolist(); date_col = original_cols[0]
-    if len(prices_df_raw.index) > 1 and not pd.isna(prices_df_raw.iloc[1, 0]):
-        candidate = prices_df_raw.iloc[1, 0]
-        if isinstance(candidate, str) and 'date' in candidate.lower(): date_col = candidate; new_cols = original_cols.copy(); new_cols[0] = date_col; prices_df_raw.columns = new_cols
-    prices_df = prices_df_raw.iloc[2:].copy()
-    try: prices_df[date_col] = pd.to_datetime(prices_df[date_col]); prices_df = prices_df.set_index(date_col)
-    except Exception as e: st.error(f"Date conversion error: {e}"); return None, None
-    prices_numeric = prices_df.apply(pd.to_numeric, errors='coerce'); prices_clean = prices_numeric.copy().ffill().bfill()
-    prices_clean.columns = prices_clean.columns.astype(str).str.strip()
-    returns = prices_clean.pct_change().iloc[1:]
-    return prices_clean, returns
-
-# --- MODIFIED: Ajout Optimisation ---
-@st.cache_data
-def calculate_full_period_indicators(benchmark_df, prices_hist, returns_full):
-    """Calcule les indicateurs sur toute la période et effectue l'optimisation."""
-    optimal_weights = None # Initialiser
-    if benchmark_df is None or prices_hist is None or returns_full is None: return None, None, None, None, None, None, None
-    if returns_full.empty: st.error("No return data."); return None, None, None, None, None, None, None
-
-    cash_daily_365, rf_daily_365, _ = calculate_daily_rates()
-    tickers = get_tickers_by_class(benchmark_df, prices_hist.columns)
-    all_tickers = tickers['action'] + tickers['bond'] + tickers['commodity']
-    if not all_tickers: st.error("No valid asset tickers found."); return None, None, None, None, None, None, None
-
-    try:
-        benchmark_df_indexed = benchmark_df.set_index(benchmark_df['BBG Ticker'].astype(str))
-        asset_class_map = benchmark_df_indexed['Asset Class']
-    except Exception as e:
-        st.error(f"Error creating asset class map: {e}")
-        return None, None, None, None, None, None, None
-
-    bench_returns = calculate_benchmark_returns(returns_full, tickers, cash_daily_365).fillna(0)
-    bench_returns.name = "Benchmark_Returns"
-    if bench_returns.empty: st.error("Benchmark returns calculation failed."); return None, None, None, None, None, None, None
-
-    bench_ind_calc = calculate_indicators(bench_returns, rf_daily_365)
-    bench_indicators_full = {
-        'Volatilité Annuelle': bench_ind_calc['Volatilité'],
-        'Ratio de Sharpe Annuel': bench_ind_calc['Sharpe'],
-        'VaR 99% (1 jour)': bench_ind_calc['VaR 99%']
-    }
-
-    # --- Préparation des données pour optimisation ---
-    returns_universe_opt = returns_full[[col for col in all_tickers if col in returns_full.columns]].copy()
-    if not returns_universe_opt.empty:
-        if CASH_TICKER_NAME not in returns_universe_opt.columns:
-            returns_universe_opt[CASH_TICKER_NAME] = cash_daily_365
-        else:
-             returns_universe_opt[CASH_TICKER_NAME] = cash_daily_365
-
-        mean_daily_returns_opt = returns_universe_opt.mean()
-        cov_matrix_opt = returns_universe_opt.cov()
-    else:
-        st.warning("No asset returns found for optimization data.")
-        mean_daily_returns_opt = None
-        cov_matrix_opt = None
-    # --- FIN Préparation ---
-
-    # --- NOUVEAU: Exécution de l'optimisation ---
-    if SCIPY_AVAILABLE and mean_daily_returns_opt is not None and cov_matrix_opt is not None:
-        try:
-            # Fonction objectif: -Sharpe Ratio
-            def negative_sharpe_ratio(weights, mu, S, rf):
-                portfolio_return = np.sum(mu * weights)
-                portfolio_volatility = np.sqrt(np.dot(weights.T, np.dot(S, weights)))
-                if portfolio_volatility == 0:
-                    return 0 # Éviter division par zéro
-                sharpe = (portfolio_return - rf) / portfolio_volatility
-                return -sharpe # On minimise le négatif du Sharpe
-
-            num_assets = len(mean_daily_returns_opt)
-            # Contraintes
-            constraints = ({'type': 'eq', 'fun': lambda w: np.sum(w) - 1}) # Sum(w) = 1
-            # Bornes: 0 <= w <= 0.10 pour TOUS les actifs (y compris cash)
-            bounds = tuple((0.0, ASSET_WEIGHT_LIMIT) for _ in range(num_assets))
-            # Guess initial: équipondéré (plafonné à 10%)
-            init_guess = np.array([min(1.0/num_assets, ASSET_WEIGHT_LIMIT) for _ in range(num_assets)])
-            # Renormaliser le guess initial pour qu'il somme à 1
-            init_guess /= np.sum(init_guess)
-
-            opt_result = sco.minimize(
-                negative_sharpe_ratio,
-                init_guess,
-                args=(mean_daily_returns_opt, cov_matrix_opt, rf_daily_365),
-                method='SLSQP',
-                bounds=bounds,
-                constraints=constraints,
-                options={'disp': False, 'ftol': 1e-9, 'maxiter': 500}
-            )
-
-            if opt_result.success:
-                # Récupérer les poids et les nettoyer (mettre les très petites valeurs à 0)
-                optimal_weights_array = opt_result.x
-                optimal_weights_array[optimal_weights_array < 1e-6] = 0 # Seuil
-                optimal_weights_array /= np.sum(optimal_weights_array) # Renormaliser
-                optimal_weights = pd.DataFrame(optimal_weights_array, index=mean_daily_returns_opt.index, columns=['Weight'])
-                optimal_weights = optimal_weights[optimal_weights['Weight'] > 1e-6] # Filtrer les poids nuls
-                st.session_state['optim_success'] = True # Marqueur de succès
-            else:
-                st.session_state['optim_success'] = False
-                st.session_state['optim_error'] = opt_result.message
-                optimal_weights = None
-
-        except Exception as e:
-            st.session_state['optim_success'] = False
-            st.session_state['optim_error'] = str(e)
-            optimal_weights = None
-    else:
-         optimal_weights = None # Scipy non dispo ou données manquantes
-    # --- FIN NOUVEAU ---
-
-    # ... (Calcul des indicateurs 'indicators_df' inchangé) ...
-    returns_aligned = returns_full[[str(t) for t in all_tickers]].loc[bench_returns.index]
-    indicators_list = []
-    for ticker_str in returns_aligned.columns:
-        ticker = ticker_str
-        Y = returns_aligned[ticker_str]
-        common_idx = bench_returns.index.intersection(Y.dropna().index)
-        if len(common_idx) < 2: continue
-        Y_aligned = Y.loc[common_idx]; X_aligned = bench_returns.loc[common_idx].values.reshape(-1, 1)
-        ind = calculate_indicators(Y_aligned, rf_daily_365);
-        vol = ind['Volatilité']; var = ind['VaR 99%']; sharpe = ind['Sharpe']
-        corr = np.nan; beta = np.nan; bench_vals = bench_returns.loc[common_idx]
-        if np.isfinite(bench_vals).all() and np.isfinite(Y_aligned).all():
-            if bench_vals.std(ddof=0) != 0 and Y_aligned.std(ddof=0) != 0:
-                 with warnings.catch_warnings(): warnings.simplefilter("ignore"); corr = np.corrcoef(bench_vals, Y_aligned)[0, 1]
-            if X_aligned.std(ddof=0) != 0:
-                try: model = LinearRegression(); model.fit(X_aligned, Y_aligned); beta = model.coef_[0]
-                except ValueError: beta = 0.0
-
-        asset_class = asset_class_map.get(ticker, 'N/A')
-        indicators_list.append({'Ticker': ticker, 'Asset Class': asset_class, 'Volatilite Annuelle': vol, 'Beta (vs Benchmark)': beta, 'Correlation (vs Benchmark)': corr, 'VaR 99% (1 jour)': var, 'Sharpe Ratio Annuel': sharpe})
-
-    indicators_df = pd.DataFrame(indicators_list); corr_matrix = returns_aligned.corr()
-    
-    # Retourne aussi les données pour l'optimisation ET les poids optimaux
-    return indicators_df, corr_matrix, bench_indicators_full, asset_class_map, mean_daily_returns_opt, cov_matrix_opt, optimal_weights
-
-
-#@st.cache_data # Cache peut être problématique ici
-def calculate_active_weights(portfolio_weights_df, benchmark_df, prices_hist):
-    """Calcule les poids courants du portefeuille et les poids actifs par rapport au benchmark."""
-    # ... (fonction inchangée depuis v2.8) ...
-    if portfolio_weights_df is None or benchmark_df is None or prices_hist is None or prices_hist.empty:
-        return None
-
-    try:
-        if START_DATE_SIMULATION not in prices_hist.index:
-            actual_start_prices_date = prices_hist[prices_hist.index >= START_DATE_SIMULATION].index.min()
-            if pd.isna(actual_start_prices_date):
-                 st.error(f"Cannot find prices at or after simulation start date {START_DATE_SIMULATION.strftime('%Y-%m-%d')}")
-                 return None
-            start_prices = prices_hist.loc[actual_start_prices_date]
-        else:
-             start_prices = prices_hist.loc[START_DATE_SIMULATION]
-
-        latest_prices = prices_hist.iloc[-1]
-
-        portfolio_weights_df['BBG Ticker'] = portfolio_weights_df['BBG Ticker'].astype(str)
-        benchmark_df['BBG Ticker'] = benchmark_df['BBG Ticker'].astype(str)
-
-        # 1. Calculer les poids benchmark théoriques
-        benchmark_composition = {}
-        tickers_by_class = get_tickers_by_class(benchmark_df, benchmark_df['BBG Ticker'].unique())
-        for class_name, weight_total in BENCHMARK_WEIGHTS.items():
-             if class_name.lower() == 'cash':
-                 benchmark_composition[CASH_TICKER_NAME] = weight_total
-             else:
-                 class_key = 'action' if class_name == 'Action' else \
-                             'bond' if class_name == 'Gov bond' else \
-                             'commodity' if class_name == 'Commodities' else None
-                 if class_key and tickers_by_class.get(class_key):
-                     num_assets = len(tickers_by_class[class_key])
-                     weight_per_asset = weight_total / num_assets if num_assets > 0 else 0
-                     for ticker in tickers_by_class[class_key]:
-                         benchmark_composition[ticker] = weight_per_asset
-        benchmark_weights_series = pd.Series(benchmark_composition, name="Benchmark Weight")
-
-        # 2. Calculer les poids courants du portefeuille
-        weights_with_class = portfolio_weights_df.merge(
-            benchmark_df[['BBG Ticker', 'Asset Class']], on='BBG Ticker', how='left'
-        )
-
-        active_weight_data = []
-        total_current_value = 0
-        start_fx = start_prices.get('EURUSD Curncy', np.nan)
-        latest_fx = latest_prices.get('EURUSD Curncy', np.nan)
-
-        for _, row in weights_with_class.iterrows():
-            ticker = str(row['BBG Ticker'])
-            initial_weight = row['Weight'] # Poids initial du PORTEFEUILLE
-            asset_class = row['Asset Class'] if pd.notna(row['Asset Class']) else ('Cash' if CASH_TICKER_NAME.lower() == ticker.lower() else 'Unknown')
-
-            initial_alloc_eur = initial_weight * INITIAL_NAV_EUR
-
-            if ticker.lower() == CASH_TICKER_NAME.lower():
-                init_qty = initial_alloc_eur
-                current_value = initial_alloc_eur
-            elif ticker in start_prices.index.astype(str) and ticker in latest_prices.index.astype(str) and pd.notna(start_prices[ticker]) and start_prices[ticker] != 0:
-                start_price = start_prices[ticker]
-                latest_price = latest_prices[ticker]
-                if asset_class == 'Commodities' and pd.notna(start_fx) and start_fx != 0 and pd.notna(latest_fx):
-                     initial_alloc_usd = initial_alloc_eur / start_fx
-                     init_qty = initial_alloc_usd / start_price if start_price != 0 else 0
-                     current_value_usd = init_qty * latest_price
-                     current_value = current_value_usd * latest_fx
-                else:
-                    init_qty = initial_alloc_eur / start_price if start_price != 0 else 0
-                    current_value = init_qty * latest_price
-            else:
-                current_value = 0
-
-            if pd.notna(current_value):
-                 total_current_value += current_value
-
-            active_weight_data.append({
-                'Asset Class': asset_class, 'BBG Ticker': ticker,
-                'Current Value (EUR)': current_value
-            })
-
-        active_weight_df = pd.DataFrame(active_weight_data)
-
-        if total_current_value != 0:
-            active_weight_df['Current Weight'] = active_weight_df['Current Value (EUR)'] / total_current_value
-        else:
-            active_weight_df['Current Weight'] = 0.0
-
-        # 3. Fusionner avec les poids benchmark et calculer poids actif
-        active_weight_df = active_weight_df.set_index('BBG Ticker')
-        benchmark_weights_series.index = benchmark_weights_series.index.astype(str)
-        combined_df = pd.concat([benchmark_weights_series, active_weight_df[['Asset Class', 'Current Weight']]], axis=1)
-
-        combined_df['Benchmark Weight'] = combined_df['Benchmark Weight'].fillna(0)
-        combined_df['Current Weight'] = combined_df['Current Weight'].fillna(0)
-        if not isinstance(benchmark_df.index, pd.Index) or benchmark_df.index.name != 'BBG Ticker':
-             benchmark_df_indexed_active = benchmark_df.set_index(benchmark_df['BBG Ticker'].astype(str))
-        else:
-             benchmark_df_indexed_active = benchmark_df.copy()
-             benchmark_df_indexed_active.index = benchmark_df_indexed_active.index.astype(str)
-
-        combined_df['Asset Class'] = combined_df['Asset Class'].fillna(benchmark_df_indexed_active['Asset Class'])
-        combined_df['Asset Class'] = combined_df['Asset Class'].fillna('Unknown') # Fallback
-
-        combined_df['Active Weight'] = combined_df['Current Weight'] - combined_df['Benchmark Weight']
-
-        active_weight_final = combined_df[[
-            'Asset Class', 'Benchmark Weight', 'Current Weight', 'Active Weight'
-        ]].reset_index().rename(columns={'index': 'BBG Ticker'}).copy()
-        active_weight_final.loc[active_weight_final['BBG Ticker'].str.lower() == CASH_TICKER_NAME.lower(), 'Asset Class'] = 'Cash'
-
-        return active_weight_final
-
-    except KeyError as e:
-         st.error(f"Error calculating active weights: Missing data for ticker {e} on start or latest date.")
-         return None
-    except Exception as e:
-        st.error(f"Error calculating active weights: {e}")
-        return None
-
-def calculate_simulation_performance(portfolio_df, benchmark_df, returns_all, start_date):
-    """Calcule les performances de simulation, gérant le cash explicite ET les frais, ET la contribution."""
-    # ... (fonction inchangée depuis v2.5) ...
-    if portfolio_df is None or benchmark_df is None or returns_all is None: return None, None, None, None, None
-    returns_sim = returns_all[returns_all.index >= start_date].copy()
-    if returns_sim.empty: st.warning(f"No data since {start_date.strftime('%Y-%m-%d')}."); return None, None, None, None, None
-
-    cash_daily_365, rf_daily_365, mgmt_fee_daily_365 = calculate_daily_rates()
-    tickers = get_tickers_by_class(benchmark_df, returns_sim.columns)
-
-    # --- Benchmark Returns & NAV (Brut) ---
-    bench_returns_gross = calculate_benchmark_returns(returns_sim, tickers, cash_daily_365).fillna(0)
-    actual_start_brut = bench_returns_gross.index.min()
-    actual_start = start_date
-    if start_date not in bench_returns_gross.index:
-         bench_returns_gross.loc[start_date] = 0.0
-         bench_returns_gross = bench_returns_gross.sort_index()
-
-    nav_bench_raw = (1 + bench_returns_gross).cumprod(); nav_bench = nav_bench_raw * 100; nav_bench.name = "Benchmark"
-
-    # --- Portfolio Returns (Brut) & NAV (Net de frais) ---
-    weights_dict = portfolio_df.set_index('BBG Ticker')['Weight'].to_dict()
-
-    cash_weight_explicit = 0.0; cash_ticker_found = None
-    for ticker, weight in weights_dict.items():
-        if CASH_TICKER_NAME.lower() == str(ticker).lower():
-            cash_weight_explicit = weight; cash_ticker_found = ticker; break
-
-    portfolio_asset_tickers = [t for t in weights_dict.keys() if str(t) in returns_sim.columns and (cash_ticker_found is None or str(t).lower() != str(cash_ticker_found).lower())]
-    portfolio_returns_raw = returns_sim[[str(t) for t in portfolio_asset_tickers]]
-    aligned_weights = pd.Series({t: weights_dict[t] for t in portfolio_asset_tickers})
-    weighted_asset_returns = portfolio_returns_raw.multiply(aligned_weights, axis=1).sum(axis=1).fillna(0)
-    portfolio_returns_gross = weighted_asset_returns + (cash_weight_explicit * cash_daily_365)
-
-    if start_date not in portfolio_returns_gross.index:
-        portfolio_returns_gross.loc[start_date] = 0.0
-        portfolio_returns_gross = portfolio_returns_gross.sort_index()
-
-    nav_portfolio = pd.Series(index=portfolio_returns_gross.index, dtype=float)
-    nav_portfolio.loc[start_date] = 100.0
-    start_loc = portfolio_returns_gross.index.get_loc(start_date)
-    for i in range(start_loc + 1, len(portfolio_returns_gross)):
-         current_date = portfolio_returns_gross.index[i]
-         previous_date = portfolio_returns_gross.index[i-1]
-         prev_nav = nav_portfolio.loc[previous_date] if previous_date in nav_portfolio.index else nav_portfolio.iloc[i-1]
-         daily_gross_return = portfolio_returns_gross.loc[current_date]
-         current_nav = prev_nav * (1 + daily_gross_return) * (1 - mgmt_fee_daily_365)
-         nav_portfolio.loc[current_date] = current_nav
-    nav_portfolio.name = "Votre Fonds (Net)"
-    nav_portfolio = nav_portfolio.ffill()
-
-    # --- Calcul Contribution P&L (Brut) ---
-    pnl_contributions = []
-    if not isinstance(benchmark_df.index, pd.Index) or benchmark_df.index.name != 'BBG Ticker':
-         benchmark_df_indexed_contrib = benchmark_df.set_index(benchmark_df['BBG Ticker'].astype(str))
-    else: benchmark_df_indexed_contrib = benchmark_df
-    asset_class_map_contrib = benchmark_df_indexed_contrib['Asset Class']
-    sim_period_returns_contrib = returns_sim[returns_sim.index >= start_date]
-
-    for ticker, initial_weight in weights_dict.items():
-        ticker_str = str(ticker)
-        asset_class = asset_class_map_contrib.get(ticker_str, 'Cash' if CASH_TICKER_NAME.lower() == ticker_str.lower() else 'Unknown')
-        initial_value = initial_weight * 100
-
-        if ticker_str == cash_ticker_found:
-             relevant_dates = returns_all[returns_all.index >= start_date].index
-             num_days = len(relevant_dates)
-             cash_nav = pd.Series(index=relevant_dates, dtype=float)
-             if not relevant_dates.empty:
-                 cash_nav.iloc[0] = initial_value
-                 for d in range(1, num_days):
-                     cash_nav.iloc[d] = cash_nav.iloc[d-1] * (1 + cash_daily_365)
-                 final_value = cash_nav.iloc[-1]
-             else: final_value = initial_value
-             pnl = final_value - initial_value
-
-        elif ticker_str in sim_period_returns_contrib.columns:
-             cum_ret_asset = (1 + sim_period_returns_contrib[ticker_str]).prod() - 1
-             final_value = initial_value * (1 + cum_ret_asset)
-             pnl = final_value - initial_value
-        else: pnl = 0
-
-        pnl_contributions.append({'Asset Class': asset_class, 'P&L Contribution (Base 100)': pnl})
-
-    contribution_df = pd.DataFrame(pnl_contributions)
-    if 'Asset Class' in contribution_df.columns:
-        contribution_by_class = contribution_df.groupby('Asset Class')['P&L Contribution (Base 100)'].sum().reset_index()
-    else:
-        contribution_by_class = pd.DataFrame(columns=['Asset Class', 'P&L Contribution (Base 100)'])
-
-    # --- Indicateurs & TE ---
-    portfolio_returns_net = nav_portfolio.pct_change().fillna(0)
-    sim_indicators = {"benchmark": {}, "portfolio": {}}; te_series = None; avg_te = np.nan
-    bench_rets_stats = bench_returns_gross[bench_returns_gross.index > start_date]
-    port_rets_stats = portfolio_returns_net[portfolio_returns_net.index > start_date]
-
-    if len(bench_rets_stats) >= 1:
-        sim_indicators['benchmark'] = calculate_indicators(bench_rets_stats, rf_daily_365)
-        sim_indicators['portfolio'] = calculate_indicators(port_rets_stats, rf_daily_365)
-        if len(bench_rets_stats) >= 2:
-            common_te_index = bench_rets_stats.index.intersection(port_rets_stats.index)
-            if not common_te_index.empty:
-                diff = port_rets_stats.loc[common_te_index] - bench_rets_stats.loc[common_te_index]
-                if len(diff) >= 2:
-                    avg_te = diff.std() * np.sqrt(TRADING_DAYS)
-                    window = 60
-                    if len(diff) >= window:
-                        te_series = diff.rolling(window=window).std() * np.sqrt(TRADING_DAYS)
-                        te_series = te_series.dropna(); te_series.name = "Tracking Error (60j)"
-                        if not te_series.empty: avg_te = te_series.mean()
-
-    comparison = pd.DataFrame({'Benchmark': nav_bench, 'Votre Fonds (Net)': nav_portfolio})
-    if start_date in comparison.index: comparison.loc[start_date] = 100.0
-    else: comparison.loc[start_date] = 100.0; comparison = comparison.sort_index()
-    comparison = comparison.ffill()
-
-    return comparison, sim_indicators, te_series, avg_te, contribution_by_class
-
-# --- Fonction Simulation Performance Spécifique ---
-def simulate_portfolio_performance(portfolio_weights_dict, returns_all, start_date):
-    """Calcule la performance simulée NETTE pour une allocation donnée."""
-    # ... (fonction inchangée depuis v2.9) ...
-    if not portfolio_weights_dict or returns_all is None: return None, None
-    returns_sim = returns_all[returns_all.index >= start_date].copy()
-    if returns_sim.empty: return None, None
-
-    cash_daily_365, rf_daily_365, mgmt_fee_daily_365 = calculate_daily_rates()
-
-    portfolio_returns_gross_sim = pd.Series(0.0, index=returns_sim.index)
-    cash_weight_sim = 0.0
-
-    for ticker, weight in portfolio_weights_dict.items():
-        ticker_str = str(ticker)
-        if CASH_TICKER_NAME.lower() == ticker_str.lower():
-            cash_weight_sim = weight
-        elif ticker_str in returns_sim.columns:
-             valid_returns = returns_sim[ticker_str].fillna(0)
-             if pd.notna(weight): portfolio_returns_gross_sim += valid_returns * weight
-
-    portfolio_returns_gross_sim += cash_weight_sim * cash_daily_365
-
-    if start_date not in portfolio_returns_gross_sim.index:
-        portfolio_returns_gross_sim.loc[start_date] = 0.0
-        portfolio_returns_gross_sim = portfolio_returns_gross_sim.sort_index()
-
-    nav_portfolio_sim = pd.Series(index=portfolio_returns_gross_sim.index, dtype=float)
-    nav_portfolio_sim.loc[start_date] = 100.0
-    start_loc = portfolio_returns_gross_sim.index.get_loc(start_date)
-    for i in range(start_loc + 1, len(portfolio_returns_gross_sim)):
-        current_date = portfolio_returns_gross_sim.index[i]
-        previous_date = portfolio_returns_gross_sim.index[i-1]
-        prev_nav = nav_portfolio_sim.loc[previous_date] if previous_date in nav_portfolio_sim.index else nav_portfolio_sim.iloc[i-1]
-        daily_gross_return = portfolio_returns_gross_sim.loc[current_date]
-        current_nav = prev_nav * (1 + daily_gross_return) * (1 - mgmt_fee_daily_365)
-        nav_portfolio_sim.loc[current_date] = current_nav
-    nav_portfolio_sim.name = "Simulated Portfolio (Net)"
-    nav_portfolio_sim = nav_portfolio_sim.ffill()
-
-    portfolio_returns_net_sim = nav_portfolio_sim.pct_change().fillna(0)
-    port_rets_stats_sim = portfolio_returns_net_sim[portfolio_returns_net_sim.index > start_date]
-
-    sim_indicators_opt = {}
-    if len(port_rets_stats_sim) >= 1:
-        sim_indicators_opt = calculate_indicators(port_rets_stats_sim, rf_daily_365)
-    else:
-        sim_indicators_opt = {'Volatilité': np.nan, 'Sharpe': np.nan, 'VaR 99%': np.nan}
-
-    return nav_portfolio_sim, sim_indicators_opt
-
-
 # --- Interface ---
 
 st.markdown(f"""
@@ -690,24 +162,142 @@ st.markdown(f"""
 </div>
 """, unsafe_allow_html=True)
 
+# --- Couche graphique: rendu PNG mémoïsé, figures fermées après rendu ---
+CHART_CACHE_ENTRIES = 64 # Graphiques (version des données, sélection) gardés en mémoire
+CHART_DPI = 200 # Même résolution que st.pyplot
+
+@st.cache_resource(show_spinner=False, max_entries=CHART_CACHE_ENTRIES)
+def render_chart(key, _draw):
+    """PNG d'un graphique, rendu une seule fois par clé; la figure est fermée aussitôt (registre pyplot vide entre deux reruns)."""
+    fig = _draw()
+    try:
+        buffer = io.BytesIO(); fig.savefig(buffer, format='png', dpi=CHART_DPI, bbox_inches='tight', facecolor=fig.get_facecolor())
+        return buffer.getvalue()
+    finally: plt.close(fig)
+
+def show_chart(key, draw):
+    """Affiche le graphique 'key' (tuple version des données + sélection); draw() -> Figure n'est appelé qu'au premier affichage."""
+    st.image(render_chart(key, draw), width='stretch')
+
 # --- Data Loading & Processing ---
-# Initialisation des variables
-benchmark_df, prices_raw, portfolio_df = None, None, None
-prices_hist, returns_all = None, None
-indicators_full, corr_matrix, bench_indicators_full, asset_map = None, None, None, None
-mean_returns_opt, cov_matrix_opt, optimal_weights = None, None, None # Ajout optimal_weights
-active_weight_df = None
+DERIVED_CACHE_ENTRIES = 32 # Résultats dérivés (version des données, paramètres) gardés en mémoire, partagés entre sessions
+
+@st.cache_resource(ttl=3600, show_spinner=False)
+def load_results():
+    """Lit les résultats précalculés (python engine.py precompute); sinon exécute le pipeline et les enregistre.
+    Un seul exemplaire en lecture seule par processus serveur, partagé sans copie par toutes les sessions."""
+    results = engine.load_latest_results()
+    if results is None:
+        results = engine.run_pipeline(with_optimization=False) # Optimiseur calculé à la demande (onglet OPTIMIZATION): ne retarde pas le premier affichage
+        engine.save_results(results)
+    return engine.freeze(results)
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_efficient_frontier(_mean_returns, _cov_matrix, data_version, cov_method, cap, n_points):
+    """Frontière efficiente mémoïsée par (version des données, estimateur, contraintes)."""
+    return engine.freeze(engine.compute_efficient_frontier(_mean_returns, _cov_matrix, cap, n_points))
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_rolling_analytics(_portfolio_df, _benchmark_df, _returns_all, data_version, window):
+    """Séries glissantes mémoïsées par (version des données, fenêtre): changer métrique ou séries ne relance pas le calcul."""
+    return engine.freeze(engine.rolling_analytics(*engine.rolling_inputs(_portfolio_df, _benchmark_df, _returns_all), window))
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_return_store(_returns_all, _comparison, data_version):
+    """Sommes préfixées des rendements (actifs, portefeuille, benchmark), construites une fois par version des données."""
+    return engine.build_return_store(_returns_all, _comparison)
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_attribution(_portfolio_df, _benchmark_df, _returns_all, data_version):
+    """Attribution Brinson (effets quotidiens cumulés), construite une fois par version des données: chaque fenêtre est une lecture."""
+    return engine.brinson_attribution(_portfolio_df, _benchmark_df, _returns_all)
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_bootstrap_intervals(_sim_returns, data_version):
+    """Intervalles bootstrap des indicateurs de simulation, calculés une fois par version des données (BOOTSTRAP_MAX_WORKERS processus)."""
+    return engine.bootstrap_confidence_intervals(_sim_returns, workers=engine.BOOTSTRAP_MAX_WORKERS)
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_correlation_clusters(_corr_matrix, _asset_map, data_version, n_clusters):
+    """Ordre, groupes et résumé de la classification hiérarchique des corrélations, mémoïsés par (version des données, nombre de groupes)."""
+    order, clusters = engine.cluster_correlation(_corr_matrix, n_clusters)
+    return engine.freeze((order, clusters, engine.cluster_summary(_corr_matrix, clusters, _asset_map)))
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_what_if(_portfolio_df, _benchmark_df, _returns_all, data_version):
+    """Éditeur what-if de référence (rendements, covariances précalculés) partagé; chaque session modifie sa propre copie."""
+    return engine.what_if_portfolio(_portfolio_df, _benchmark_df, _returns_all)
+
+def reset_what_if():
+    """Revient aux poids de la feuille (copie de session et saisies de l'éditeur effacées)."""
+    for key in ('what_if', 'what_if_editor'): st.session_state.pop(key, None)
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_backtest(_portfolio_df, _benchmark_df, _returns_all, data_version, strategies, start_date):
+    """Backtest de rebalancement de la feuille mémoïsé par (version des données, stratégies, date de départ)."""
+    bench_returns = calculate_benchmark_returns(_returns_all, get_tickers_by_class(_benchmark_df, _returns_all.columns), calculate_daily_rates()[0]).fillna(0)
+    return engine.freeze(engine.backtest_rebalancing(_portfolio_df.set_index('BBG Ticker')['Weight'], _returns_all, start_date, list(strategies), bench_returns=bench_returns))
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_rebalancing_sweep(_portfolio_df, _returns_all, data_version, start_date):
+    """Balayage fréquences/seuils mémoïsé par (version des données, date de départ)."""
+    return engine.freeze(engine.rebalancing_sweep(_portfolio_df.set_index('BBG Ticker')['Weight'], _returns_all, start_date))
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_monte_carlo(_portfolio_df, _benchmark_df, _returns_all, _mean_returns, _cov_matrix, data_version, cov_method, method, n_paths, confidence):
+    """VaR/CVaR Monte Carlo de la feuille et du benchmark mémoïsés par (version des données, estimateur, méthode, trajectoires, confiance)."""
+    if _mean_returns is None: return None, None
+    weights = engine.risk_weights(_portfolio_df, _benchmark_df, _mean_returns.index)
+    returns_hist = engine.optimization_universe(_benchmark_df, _returns_all) if method == 'bootstrap' else None
+    return engine.freeze(engine.monte_carlo_var(weights, _mean_returns, _cov_matrix, returns_hist, method, n_paths, confidence=confidence, workers=engine.MC_MAX_WORKERS))
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_allocators(_mean_returns, _cov_matrix, data_version, cov_method):
+    """Allocations du registre (poids, synthèse ex ante, erreurs) mémoïsées par (version des données, estimateur)."""
+    return engine.freeze(engine.compare_allocators(_mean_returns, _cov_matrix))
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_walk_forward(_benchmark_df, _returns_all, _in_sample_weights, data_version, cov_method, period, lookback):
+    """Walk-forward hors échantillon (solves parallèles) et, pour comparaison, l'optimum plein historique rebalancé aux mêmes dates,
+    mémoïsés par (version des données, estimateur, fréquence, fenêtre)."""
+    navs, weights, summary = engine.walk_forward_backtest(_benchmark_df, _returns_all, period, lookback, cov_method=cov_method, workers=engine.WALK_FORWARD_MAX_WORKERS)
+    if navs is not None and _in_sample_weights is not None:
+        bench_returns = calculate_benchmark_returns(_returns_all, get_tickers_by_class(_benchmark_df, _returns_all.columns), calculate_daily_rates()[0]).fillna(0)
+        in_sample_navs, in_sample_summary = engine.backtest_rebalancing(_in_sample_weights, _returns_all, navs.index[0], [{'label': 'In-Sample Max Sharpe (Net)', 'period': period}], bench_returns=bench_returns)
+        if in_sample_navs is not None: navs = navs.join(in_sample_navs); summary = pd.concat([summary.iloc[:1], in_sample_summary, summary.iloc[1:]])
+    return engine.freeze((navs, weights, summary))
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_optimization_inputs(_benchmark_df, _returns_all, data_version, cov_method):
+    """(mu, S) de l'optimiseur mémoïsés par (version des données, estimateur), sans lancer SLSQP."""
+    return engine.freeze(engine.optimization_inputs(_benchmark_df, _returns_all, cov_method))
+
+@st.cache_resource(show_spinner=False, max_entries=DERIVED_CACHE_ENTRIES)
+def cached_optimization(_benchmark_df, _returns_all, data_version, cov_method):
+    """Résultats de engine.run_optimization mémoïsés par (version des données, estimateur).
+    Seul l'estimateur par défaut alimente le warm start du pipeline (data_version transmise)."""
+    return engine.freeze(engine.run_optimization(_benchmark_df, _returns_all, data_version if cov_method == engine.COVARIANCE_METHOD else None, cov_method))
 
 with st.spinner("LOADING MARKET DATA... PLEASE WAIT..."):
-    benchmark_df, prices_raw, portfolio_df = load_data()
-    if benchmark_df is None or prices_raw is None or portfolio_df is None: st.error("Critical data loading failed."); st.stop()
-    prices_hist, returns_all = process_prices(prices_raw)
-    if prices_hist is None or returns_all is None: st.error("Failed to process price data."); st.stop()
-    # --- MODIFIED: Récupération des 7 variables ---
-    indicators_full, corr_matrix, bench_indicators_full, asset_map, mean_returns_opt, cov_matrix_opt, optimal_weights = calculate_full_period_indicators(benchmark_df, prices_hist, returns_all)
-    # --- FIN MODIFICATION ---
-    if indicators_full is None: st.error("Failed to calculate full period indicators."); st.stop()
-    active_weight_df = calculate_active_weights(portfolio_df, benchmark_df, prices_hist)
+    results = load_results()
+for level, message in results['notices']: (st.error if level == 'error' else st.warning)(message)
+if results['error']: st.error(results['error']); st.stop()
+
+benchmark_df, portfolio_df, data_version = results['benchmark_df'], results['portfolio_df'], results['data_version']
+prices_hist, returns_all = results['prices_hist'], results['returns_all']
+indicators_full, corr_matrix, bench_indicators_full, asset_map = results['indicators_full'], results['corr_matrix'], results['bench_indicators_full'], results['asset_map']
+active_weight_df = results['active_weight_df']
+results_cov_method = results.get('cov_method', 'sample') # Résultats antérieurs: estimateur échantillon
+
+def optimization_results(cov_method):
+    """Résultats d'optimisation pour cov_method: ceux du pipeline s'il les a calculés, sinon calculés à la demande (mémoïsés)."""
+    if results.get('optimized', True) and cov_method == results_cov_method: return results
+    with st.spinner("RUNNING OPTIMIZATION..."): return cached_optimization(benchmark_df, returns_all, data_version, cov_method)
+
+def optimization_inputs_for(cov_method):
+    """(mu, S) de l'optimiseur pour cov_method, sans déclencher l'optimisation si elle n'a pas encore eu lieu."""
+    if results.get('optimized', True) and cov_method == results_cov_method: return results['mean_returns_opt'], results['cov_matrix_opt']
+    return cached_optimization_inputs(benchmark_df, returns_all, data_version, cov_method)
 
 
 # --- Market Movers Ticker HTML Generation --- (Inchangé)
@@ -757,9 +347,7 @@ if returns_all is not None and not returns_all.empty:
 # --- Calcul des poids du portefeuille pour la barre latérale --- (Inchangé)
 portfolio_class_weights = {}
 if portfolio_df is not None and benchmark_df is not None:
-    # ... (code inchangé) ...
-    portfolio_df['BBG Ticker'] = portfolio_df['BBG Ticker'].astype(str)
-    benchmark_df['BBG Ticker'] = benchmark_df['BBG Ticker'].astype(str)
+    # Tickers déjà normalisés (str) au chargement: les DataFrames partagés ne sont jamais modifiés en place
     display_weights_sidebar = portfolio_df.merge(benchmark_df[['BBG Ticker', 'Asset Class']], on='BBG Ticker', how='left')
     cash_row_sidebar = display_weights_sidebar[display_weights_sidebar['BBG Ticker'].str.contains(CASH_TICKER_NAME, case=False, na=False)]
     explicit_cash_weight_sidebar = cash_row_sidebar['Weight'].sum() if not cash_row_sidebar.empty else 0.0
@@ -796,7 +384,7 @@ with st.sidebar.expander("RISK-FREE & CASH RATE", expanded=True):
 
 with st.sidebar.expander("FEES", expanded=True):
      st.metric("MANAGEMENT (ANNUAL)", f"{MANAGEMENT_FEE_ANNUAL:.2%}", help=f"Deducted daily from portfolio NAV based on {CALENDAR_DAYS} days.")
-     st.metric("TRANSACTION (PER TRADE)", f"{TRANSACTION_FEE_RATE:.2%}", help="Applied on buy/sell nominal. Not applied in current simulation.")
+     st.metric("TRANSACTION (PER TRADE)", f"{TRANSACTION_FEE_RATE:.2%}", help="Applied on buy/sell nominal. Not applied in the MONITOR NAV (see HOLDINGS > TRANSACTION SIMULATOR).")
 
 with st.sidebar.expander("DATA SOURCE", expanded=True):
     st.info("**SOURCE**: Google Sheets\n\n**PORTFOLIO**: Col C (Ticker) & F (Weight)")
@@ -804,13 +392,16 @@ with st.sidebar.expander("DATA SOURCE", expanded=True):
 
 
 # --- Main Tabs ---
-tab1, tab2, tab3, tab4 = st.tabs(["MONITOR", "HOLDINGS", "ANALYTICS", "OPTIMIZATION"])
+# Exécution paresseuse: seul l'onglet sélectionné est calculé (changer d'onglet relance le script), et chaque onglet est
+# un fragment: un filtre ne relance que le code de son onglet.
+tab1, tab2, tab3, tab4 = st.tabs(["MONITOR", "HOLDINGS", "ANALYTICS", "OPTIMIZATION"], on_change="rerun", key="main_tab")
 
 # --- TAB 1: MONITOR --- (Inchangé)
-with tab1:
+@st.fragment
+def monitor_tab():
     # ... (code inchangé pour Quick Stats, Perf Contrib, KPIs, Bmk Ref, Chart Perf/TE) ...
     st.markdown(f"## PERFORMANCE ANALYSIS: {START_DATE_SIMULATION.strftime('%d/%b/%Y')} - PRESENT")
-    comparison, sim_ind, te_series, avg_te, contribution_by_class = calculate_simulation_performance(portfolio_df, benchmark_df, returns_all, START_DATE_SIMULATION)
+    comparison, sim_ind, te_series, avg_te, contribution_by_class = results['comparison'], results['sim_ind'], results['te_series'], results['avg_te'], results['contribution_by_class']
 
     st.markdown("### QUICK STATS")
     if comparison is not None and not comparison.empty:
@@ -837,6 +428,32 @@ with tab1:
         st.warning("Quick Stats unavailable (no simulation data).")
     st.markdown("---")
 
+    # --- Performances par période (sommes préfixées: chaque fenêtre en O(1) par ligne) ---
+    st.markdown("### PERIOD RETURNS")
+    return_store = cached_return_store(returns_all, comparison, data_version) if comparison is not None and not comparison.empty else None
+    if return_store is not None:
+        end_date = comparison.index[-1]
+        for col, period in zip(st.columns(len(PERIOD_WINDOWS)), PERIOD_WINDOWS):
+            period_perf = return_store.cumulative_return(engine.period_start(period, end_date), end_date)
+            col.metric(f"{period} (NET)", f"{period_perf['Portfolio']:+.2%}", delta=f"{period_perf['Portfolio'] - period_perf['Benchmark']:+.2%} vs BMK")
+        with st.expander("CUSTOM ANALYSIS WINDOW"):
+            st.caption(f"Performance de la clôture du premier jour à celle du dernier jour; holdings en buy & hold depuis le début de la fenêtre (brut). Portfolio/Benchmark simulés depuis le {START_DATE_SIMULATION.strftime('%d/%m/%Y')}.")
+            window = st.date_input("WINDOW", value=(START_DATE_SIMULATION.date(), end_date.date()), min_value=returns_all.index.min().date(), max_value=end_date.date(), key="analysis_window")
+            if len(window) == 2:
+                window_start, window_end = pd.Timestamp(window[0]), pd.Timestamp(window[1])
+                window_stats = return_store.window_stats(window_start, window_end)
+                wcol1, wcol2, wcol3, wcol4 = st.columns(4)
+                window_perf = lambda name: f"{window_stats.loc[name, 'Performance']:+.2%}" if window_stats.loc[name, 'Observations'] > 0 else "N/A" # Simulation démarrée après la fenêtre
+                wcol1.metric("PORTFOLIO (NET)", window_perf('Portfolio')); wcol2.metric("BENCHMARK (GROSS)", window_perf('Benchmark'))
+                wcol3.metric("VOL PORT. (ANN.)", f"{window_stats.loc['Portfolio', 'Volatilité']:.2%}" if pd.notna(window_stats.loc['Portfolio', 'Volatilité']) else "N/A"); wcol4.metric("VOL BMK (ANN.)", f"{window_stats.loc['Benchmark', 'Volatilité']:.2%}" if pd.notna(window_stats.loc['Benchmark', 'Volatilité']) else "N/A")
+                sheet_weights = portfolio_df.groupby('BBG Ticker')['Weight'].sum()
+                holdings_window = window_stats.reindex(sheet_weights.index).assign(Weight=sheet_weights, **{'Contribution (Base 100)': return_store.contribution(sheet_weights, window_start, window_end)})
+                holdings_window.insert(0, 'Asset Class', benchmark_df.drop_duplicates('BBG Ticker').set_index('BBG Ticker')['Asset Class'].reindex(holdings_window.index).fillna('Cash'))
+                st.dataframe(holdings_window[['Asset Class', 'Weight', 'Performance', 'Volatilité', 'Contribution (Base 100)']].style.format({'Weight': '{:.2%}', 'Performance': '{:+.2%}', 'Volatilité': '{:.2%}', 'Contribution (Base 100)': '{:+.2f}'}, na_rep='N/A'), use_container_width=True)
+            else: st.info("Select a start and an end date.")
+    else: st.warning("Period returns unavailable (no simulation data).")
+    st.markdown("---")
+
     st.markdown("### PERFORMANCE CONTRIBUTION (GROSS, BASE 100)")
     if contribution_by_class is not None and not contribution_by_class.empty:
          if 'Asset Class' in contribution_by_class.columns and 'P&L Contribution (Base 100)' in contribution_by_class.columns:
@@ -851,6 +468,27 @@ with tab1:
          st.warning("Performance contribution data unavailable.")
     st.markdown("---")
 
+    # --- Attribution Brinson (effets quotidiens liés; une fenêtre = deux lectures des sommes cumulées) ---
+    st.markdown("### PERFORMANCE ATTRIBUTION (BRINSON, GROSS)")
+    attribution = cached_attribution(portfolio_df, benchmark_df, returns_all, data_version)
+    if attribution is not None and len(attribution.index) > 0:
+        st.caption("Brinson-Fachler vs poids de classe du benchmark, effets quotidiens liés (Carino). Portefeuille en buy & hold depuis le départ, frais exclus.")
+        attribution_window = st.date_input("WINDOW", value=(START_DATE_SIMULATION.date(), attribution.index[-1].date()), min_value=START_DATE_SIMULATION.date(), max_value=attribution.index[-1].date(), key="attribution_window")
+        if len(attribution_window) == 2:
+            attr_start, attr_end = pd.Timestamp(attribution_window[0]), pd.Timestamp(attribution_window[1])
+            attr_returns, attr_df = attribution.returns(attr_start, attr_end), attribution.attribution(attr_start, attr_end)
+            acol1, acol2, acol3 = st.columns(3)
+            acol1.metric("PORTFOLIO (B&H GROSS)", f"{attr_returns['Portfolio']:+.2%}"); acol2.metric("BENCHMARK (GROSS)", f"{attr_returns['Benchmark']:+.2%}"); acol3.metric("ACTIVE", f"{attr_returns['Active']:+.2%}")
+            st.bar_chart(attr_df[list(ATTRIBUTION_EFFECTS)])
+            attr_table = pd.concat([attr_df, attr_df.sum().to_frame('Total').T])
+            st.dataframe(attr_table.style.format('{:+.2%}'), use_container_width=True)
+            attr_cumulative = attribution.cumulative(attr_start, attr_end)
+            if not attr_cumulative.empty: st.line_chart(attr_cumulative)
+        else: st.info("Select a start and an end date.")
+    else:
+        st.warning("Performance attribution unavailable (no simulation data).")
+    st.markdown("---")
+
     if sim_ind:
         st.markdown("### KEY PERFORMANCE INDICATORS (SIMULATION PERIOD)")
         col1, col2 = st.columns(2)
@@ -866,51 +504,80 @@ with tab1:
             subcol1.metric("VOL (ANN.)", f"{sim_ind['portfolio']['Volatilité']:.2%}" if pd.notna(sim_ind['portfolio']['Volatilité']) else "N/A", help=f"Annualized on {TRADING_DAYS} days")
             subcol2.metric("SHARPE (ANN.)", f"{sim_ind['portfolio']['Sharpe']:.3f}" if pd.notna(sim_ind['portfolio']['Sharpe']) else "N/A", help=f"Annualized on {TRADING_DAYS} days vs {RISK_FREE_RATE_ANNUAL:.1%} Rf")
             subcol3.metric("VAR 99% (1D)", f"{sim_ind['portfolio']['VaR 99%']:.2%}" if pd.notna(sim_ind['portfolio']['VaR 99%']) else "N/A")
+        with st.spinner("BOOTSTRAPPING..."): bootstrap_ci = cached_bootstrap_intervals(results.get('sim_returns'), data_version)
+        if bootstrap_ci is not None:
+            st.markdown(f"#### CONFIDENCE INTERVALS ({BOOTSTRAP_CONFIDENCE:.0%}, STATIONARY BOOTSTRAP)")
+            st.caption(f"{BOOTSTRAP_RESAMPLES:,} tirages de jours par blocs de longueur moyenne {BOOTSTRAP_BLOCK_LENGTH}j (portefeuille et benchmark tirés ensemble). TE: moyenne des TE glissantes 60j (ou globale).")
+            ci_table = bootstrap_ci.set_index(['Series', 'Metric'])
+            sharpe_rows = [row for row in ci_table.index if row[1] == 'Sharpe']
+            st.dataframe(ci_table.style.format('{:.2%}', na_rep='N/A').format('{:.3f}', subset=pd.IndexSlice[sharpe_rows, :], na_rep='N/A'), use_container_width=True)
     st.markdown("---")
 
     st.markdown("### BENCHMARK REFERENCE (FULL PERIOD, GROSS)")
     if bench_indicators_full:
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
         col1.metric("VOLATILITY", f"{bench_indicators_full['Volatilité Annuelle']:.2%}" if pd.notna(bench_indicators_full['Volatilité Annuelle']) else "N/A")
         col2.metric("SHARPE RATIO", f"{bench_indicators_full['Ratio de Sharpe Annuel']:.3f}" if pd.notna(bench_indicators_full['Ratio de Sharpe Annuel']) else "N/A")
         col3.metric("VAR 99% (1D)", f"{bench_indicators_full['VaR 99% (1 jour)']:.2%}" if pd.notna(bench_indicators_full['VaR 99% (1 jour)']) else "N/A")
+        col4.metric("MAX DRAWDOWN", f"{bench_indicators_full['Max Drawdown']:.2%}" if pd.notna(bench_indicators_full.get('Max Drawdown', np.nan)) else "N/A")
     st.markdown("---")
 
     st.markdown("### PERFORMANCE CHART & TRACKING ERROR")
     if comparison is not None:
-        fig, ax1 = plt.subplots(figsize=(14, 7)); fig.patch.set_facecolor(COLORS['bg_dark']); ax1.set_facecolor(COLORS['bg_panel'])
-        ax1.plot(comparison.index, comparison['Benchmark'], color=COLORS['blue_bright'], linewidth=2.5, linestyle='--', label='BENCHMARK (GROSS)', alpha=0.9)
-        ax1.plot(comparison.index, comparison['Votre Fonds (Net)'], color=COLORS['accent_orange'], linewidth=2.5, label='PORTFOLIO (NET)', alpha=0.9)
-        ax1.set_ylabel("NAV (BASE 100)", fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax1.set_xlabel("DATE", fontsize=10, fontweight='500', color=COLORS['text_secondary']); ax1.tick_params(axis='y', labelcolor=COLORS['text_primary'], colors=COLORS['text_primary']); ax1.tick_params(axis='x', labelcolor=COLORS['text_secondary'], colors=COLORS['text_secondary'])
-        min_val = comparison.min().min() if not comparison.empty else 90
-        max_val = comparison.max().max() if not comparison.empty else 110
-        ax1.set_ylim(bottom=max(80, min_val - 2), top=min(120, max_val + 2))
-
-        ax1.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax1.spines['bottom'].set_color(COLORS['border']); ax1.spines['top'].set_color(COLORS['border']); ax1.spines['left'].set_color(COLORS['border']); ax1.spines['right'].set_color(COLORS['border'])
-        ax2 = ax1.twinx(); ax2.set_ylabel('TRACKING ERROR (ANN %)', fontsize=11, fontweight='600', color=COLORS['accent_yellow'], fontfamily='monospace'); ax2.tick_params(axis='y', labelcolor=COLORS['accent_yellow'], colors=COLORS['accent_yellow']); ax2.yaxis.set_major_formatter(mtick.PercentFormatter(xmax=1.0))
-        lines = []; labels = []; lines1, labels1 = ax1.get_legend_handles_labels(); lines.extend(lines1); labels.extend(labels1)
-        if te_series is not None and not te_series.empty:
-            te_plot = te_series
-            line_te, = ax2.plot(te_plot.index, te_plot, color=COLORS['accent_yellow'], linewidth=2, label='TE 60D', alpha=0.8)
-            lines.append(line_te); labels.append(f'TE {TRADING_DAYS}D ANN. (60D ROLL)'); max_te_val = te_plot.max(); ax2.set_ylim(0, max(0.05, np.ceil((max_te_val if pd.notna(max_te_val) else 0)*100)/100 + 0.01))
-        elif not np.isnan(avg_te) and avg_te >= 0:
-            line_te = ax2.axhline(avg_te, color=COLORS['accent_yellow'], linestyle=':', linewidth=2, label=f'AVG TE ({avg_te:.2%})', alpha=0.8)
-            lines.append(line_te); labels.append(f'AVG TE ({avg_te:.2%})'); ax2.set_ylim(0, max(0.05, np.ceil(avg_te*100)/100 + 0.01))
-        else: ax2.set_yticks([])
-        ax1.legend(lines, labels, loc='upper left', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary'])
-        plt.title("PERFORMANCE MONITOR (PORTFOLIO NET vs BENCHMARK GROSS)", fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); plt.xticks(rotation=45, fontsize=8); fig.tight_layout(); st.pyplot(fig)
+        def draw_performance_monitor():
+            fig, ax1 = plt.subplots(figsize=(14, 7)); fig.patch.set_facecolor(COLORS['bg_dark']); ax1.set_facecolor(COLORS['bg_panel'])
+            ax1.plot(comparison.index, comparison['Benchmark'], color=COLORS['blue_bright'], linewidth=2.5, linestyle='--', label='BENCHMARK (GROSS)', alpha=0.9)
+            ax1.plot(comparison.index, comparison['Votre Fonds (Net)'], color=COLORS['accent_orange'], linewidth=2.5, label='PORTFOLIO (NET)', alpha=0.9)
+            ax1.set_ylabel("NAV (BASE 100)", fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax1.set_xlabel("DATE", fontsize=10, fontweight='500', color=COLORS['text_secondary']); ax1.tick_params(axis='y', labelcolor=COLORS['text_primary'], colors=COLORS['text_primary']); ax1.tick_params(axis='x', labelcolor=COLORS['text_secondary'], colors=COLORS['text_secondary'])
+            min_val = comparison.min().min() if not comparison.empty else 90
+            max_val = comparison.max().max() if not comparison.empty else 110
+            ax1.set_ylim(bottom=max(80, min_val - 2), top=min(120, max_val + 2))
+
+            ax1.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax1.spines['bottom'].set_color(COLORS['border']); ax1.spines['top'].set_color(COLORS['border']); ax1.spines['left'].set_color(COLORS['border']); ax1.spines['right'].set_color(COLORS['border'])
+            ax2 = ax1.twinx(); ax2.set_ylabel('TRACKING ERROR (ANN %)', fontsize=11, fontweight='600', color=COLORS['accent_yellow'], fontfamily='monospace'); ax2.tick_params(axis='y', labelcolor=COLORS['accent_yellow'], colors=COLORS['accent_yellow']); ax2.yaxis.set_major_formatter(mtick.PercentFormatter(xmax=1.0))
+            lines = []; labels = []; lines1, labels1 = ax1.get_legend_handles_labels(); lines.extend(lines1); labels.extend(labels1)
+            if te_series is not None and not te_series.empty:
+                te_plot = te_series
+                line_te, = ax2.plot(te_plot.index, te_plot, color=COLORS['accent_yellow'], linewidth=2, label='TE 60D', alpha=0.8)
+                lines.append(line_te); labels.append(f'TE {TRADING_DAYS}D ANN. (60D ROLL)'); max_te_val = te_plot.max(); ax2.set_ylim(0, max(0.05, np.ceil((max_te_val if pd.notna(max_te_val) else 0)*100)/100 + 0.01))
+            elif not np.isnan(avg_te) and avg_te >= 0:
+                line_te = ax2.axhline(avg_te, color=COLORS['accent_yellow'], linestyle=':', linewidth=2, label=f'AVG TE ({avg_te:.2%})', alpha=0.8)
+                lines.append(line_te); labels.append(f'AVG TE ({avg_te:.2%})'); ax2.set_ylim(0, max(0.05, np.ceil(avg_te*100)/100 + 0.01))
+            else: ax2.set_yticks([])
+            ax1.legend(lines, labels, loc='upper left', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary'])
+            ax1.set_title("PERFORMANCE MONITOR (PORTFOLIO NET vs BENCHMARK GROSS)", fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax1.tick_params(axis='x', labelrotation=45, labelsize=8); fig.tight_layout()
+            return fig
+        show_chart(('performance_monitor', data_version), draw_performance_monitor)
         if not np.isnan(avg_te):
             col1, col2, col3 = st.columns([1, 1, 1]);
             with col2: st.metric("AVG TRACKING ERROR", f"{avg_te:.2%}", help=f"Rolling 60d (or overall) annualized ({TRADING_DAYS}d) TE of Net Portfolio vs Gross Benchmark")
     else: st.warning("SIMULATION DATA UNAVAILABLE")
+    st.markdown("---")
+
+    # --- Drawdowns de la simulation ---
+    st.markdown("### DRAWDOWNS (SIMULATION PERIOD)")
+    drawdown_series, drawdown_summary = results.get('drawdown_series'), results.get('drawdown_summary')
+    if drawdown_summary is not None:
+        dd_cols = st.columns(4)
+        for col, name in zip((dd_cols[:2], dd_cols[2:]), drawdown_summary.index):
+            row = drawdown_summary.loc[name]
+            col[0].metric(f"MAX DD {name.upper()}", f"{row['Max Drawdown']:.2%}", help=f"Pic {row['Peak Date']:%d/%m/%Y}, creux {row['Trough Date']:%d/%m/%Y}")
+            col[1].metric("RECOVERY (DAYS)", f"{row['Time to Recovery (days)']:.0f}" if pd.notna(row['Time to Recovery (days)']) else "NOT RECOVERED", help=f"Plus longue période sous un plus-haut: {row['Drawdown Duration (days)']:.0f} jours de bourse")
+        def draw_drawdowns():
+            fig_dd, ax_dd = plt.subplots(figsize=(14, 4)); fig_dd.patch.set_facecolor(COLORS['bg_dark']); ax_dd.set_facecolor(COLORS['bg_panel'])
+            for name, color in zip(drawdown_series.columns, [COLORS['blue_bright'], COLORS['accent_orange']]): ax_dd.fill_between(drawdown_series.index, drawdown_series[name], 0, color=color, alpha=0.35, label=name.upper()); ax_dd.plot(drawdown_series.index, drawdown_series[name], color=color, linewidth=1.5)
+            ax_dd.yaxis.set_major_formatter(mtick.PercentFormatter(xmax=1.0)); ax_dd.set_title('UNDERWATER CURVE (DRAWDOWN FROM RUNNING PEAK)', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_dd.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_dd.tick_params(colors=COLORS['text_secondary']); ax_dd.spines['bottom'].set_color(COLORS['border']); ax_dd.spines['top'].set_color(COLORS['border']); ax_dd.spines['left'].set_color(COLORS['border']); ax_dd.spines['right'].set_color(COLORS['border'])
+            ax_dd.legend(loc='lower left', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary']); ax_dd.tick_params(axis='x', labelrotation=45, labelsize=8); fig_dd.tight_layout()
+            return fig_dd
+        show_chart(('drawdowns', data_version), draw_drawdowns)
+    else: st.info("Drawdowns unavailable (recompute results with the current engine).")
 
 # --- TAB 2: HOLDINGS --- (Inchangé)
-with tab2:
+@st.fragment
+def holdings_tab():
     st.markdown("## PORTFOLIO HOLDINGS")
     if portfolio_df is not None and benchmark_df is not None:
         st.markdown("### PORTFOLIO SUMMARY")
-        portfolio_df['BBG Ticker'] = portfolio_df['BBG Ticker'].astype(str)
-        benchmark_df['BBG Ticker'] = benchmark_df['BBG Ticker'].astype(str)
         display_weights = portfolio_df.merge(benchmark_df[['BBG Ticker', 'Asset Class']], on='BBG Ticker', how='left'); display_weights = display_weights[['Asset Class', 'BBG Ticker', 'Weight']]
 
         cash_row = display_weights[display_weights['BBG Ticker'].str.contains(CASH_TICKER_NAME, case=False, na=False)]
@@ -976,6 +643,32 @@ with tab2:
         st.markdown("---")
         # --- FIN Section Active Weight ---
 
+        # --- Dérive des poids depuis le départ ---
+        st.markdown("### WEIGHT DRIFT SINCE START")
+        holdings_weights = results.get('holdings_weights')
+        if holdings_weights is not None and not holdings_weights.empty and active_weight_df is not None:
+            st.caption(f"Quantités fixées au {holdings_weights.index[0].strftime('%d %b %Y')}, sans rebalancement (valorisation EUR, fixings FX quotidiens pour les lignes en devise).")
+            drift_view = st.radio("VIEW", ["ASSET CLASS", "ACTIVE WEIGHT (TOP 10)"], horizontal=True, key="drift_view")
+            def draw_weight_drift():
+                fig_drift, ax_drift = plt.subplots(figsize=(14, 6)); fig_drift.patch.set_facecolor(COLORS['bg_dark']); ax_drift.set_facecolor(COLORS['bg_panel'])
+                if drift_view == "ASSET CLASS":
+                    class_of = active_weight_df.drop_duplicates('BBG Ticker').set_index('BBG Ticker')['Asset Class']
+                    class_drift = holdings_weights.T.groupby(class_of.reindex(holdings_weights.columns).fillna('Unknown').to_numpy()).sum().T
+                    ax_drift.stackplot(class_drift.index, class_drift.T.to_numpy(), labels=[c.upper() for c in class_drift.columns], colors=[COLORS['danger'], COLORS['blue_bright'], COLORS['accent_orange'], COLORS['success'], COLORS['accent_yellow']][:class_drift.shape[1]], alpha=0.85)
+                    ax_drift.set_ylim(0, 1); ax_drift.set_title('ASSET CLASS WEIGHTS (DRIFT)', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace')
+                else:
+                    active_drift = engine.active_weights_history(holdings_weights, benchmark_df)
+                    top_active = active_drift.iloc[-1].abs().sort_values(ascending=False).index[:10]
+                    for ticker in top_active: ax_drift.plot(active_drift.index, active_drift[ticker], linewidth=1.8, label=ticker)
+                    ax_drift.axhline(0, color=COLORS['text_secondary'], linestyle='--', alpha=0.5, linewidth=1.5); ax_drift.set_title('ACTIVE WEIGHTS (DRIFT, TOP 10 |ACTIVE|)', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace')
+                ax_drift.yaxis.set_major_formatter(mtick.PercentFormatter(xmax=1.0)); ax_drift.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_drift.tick_params(colors=COLORS['text_secondary']); ax_drift.spines['bottom'].set_color(COLORS['border']); ax_drift.spines['top'].set_color(COLORS['border']); ax_drift.spines['left'].set_color(COLORS['border']); ax_drift.spines['right'].set_color(COLORS['border'])
+                ax_drift.legend(loc='upper left', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary']); ax_drift.tick_params(axis='x', labelrotation=45, labelsize=8); fig_drift.tight_layout()
+                return fig_drift
+            show_chart(('weight_drift', data_version, drift_view), draw_weight_drift)
+        else:
+            st.info("Weight drift unavailable.")
+        st.markdown("---")
+
 
         st.markdown("### ALLOCATION VISUALIZATION (Current)")
         if 'Asset Class' in display_weights.columns:
@@ -984,13 +677,46 @@ with tab2:
             class_data_pie = current_class_weights[current_class_weights > 0]
 
             if not class_data_pie.empty:
-                fig_pie, ax_pie = plt.subplots(figsize=(10, 6)); fig_pie.patch.set_facecolor(COLORS['bg_dark']); ax_pie.set_facecolor(COLORS['bg_dark'])
-                colors_pie = [COLORS['danger'], COLORS['blue_bright'], COLORS['accent_orange'], COLORS['success'], COLORS['accent_yellow']]
-                wedges, texts, autotexts = ax_pie.pie(class_data_pie.values, labels=class_data_pie.index, autopct='%1.1f%%', colors=colors_pie[:len(class_data_pie)], startangle=90, textprops={'fontsize': 10, 'fontweight': '600', 'color': COLORS['text_primary'], 'fontfamily': 'monospace'})
-                for autotext in autotexts: autotext.set_color(COLORS['bg_dark']); autotext.set_fontweight('bold'); autotext.set_fontsize(11)
-                ax_pie.set_title("CURRENT ASSET CLASS ALLOCATION", fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); st.pyplot(fig_pie)
+                def draw_allocation_pie():
+                    fig_pie, ax_pie = plt.subplots(figsize=(10, 6)); fig_pie.patch.set_facecolor(COLORS['bg_dark']); ax_pie.set_facecolor(COLORS['bg_dark'])
+                    colors_pie = [COLORS['danger'], COLORS['blue_bright'], COLORS['accent_orange'], COLORS['success'], COLORS['accent_yellow']]
+                    wedges, texts, autotexts = ax_pie.pie(class_data_pie.values, labels=class_data_pie.index, autopct='%1.1f%%', colors=colors_pie[:len(class_data_pie)], startangle=90, textprops={'fontsize': 10, 'fontweight': '600', 'color': COLORS['text_primary'], 'fontfamily': 'monospace'})
+                    for autotext in autotexts: autotext.set_color(COLORS['bg_dark']); autotext.set_fontweight('bold'); autotext.set_fontsize(11)
+                    ax_pie.set_title("CURRENT ASSET CLASS ALLOCATION", fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace')
+                    return fig_pie
+                show_chart(('allocation_pie', data_version), draw_allocation_pie)
             else: st.warning("No allocation data.")
         st.markdown("---")
+
+        # --- Éditeur what-if (mises à jour de rang 1, sans resimulation) ---
+        st.markdown("### WHAT-IF WEIGHT EDITOR")
+        what_if_base = cached_what_if(portfolio_df, benchmark_df, returns_all, data_version)
+        if what_if_base is not None:
+            st.caption(f"Buy & hold depuis le {START_DATE_SIMULATION.strftime('%d/%m/%Y')}, net des frais de gestion (comme le MONITOR). Chaque poids modifié met à jour NAV, Sharpe et TE par une mise à jour de rang 1.")
+            if st.session_state.get('what_if', (None,))[0] != data_version: st.session_state['what_if'] = (data_version, what_if_base.copy())
+            what_if = st.session_state['what_if'][1]
+            asset_class_map = benchmark_df.drop_duplicates('BBG Ticker').set_index('BBG Ticker')['Asset Class']
+            editor_base = pd.DataFrame({'Asset Class': asset_class_map.reindex(what_if_base.assets).fillna('Cash').to_numpy(), 'Weight (%)': what_if_base.weights * 100}, index=what_if_base.assets)
+            ecol1, ecol2 = st.columns([2, 3])
+            with ecol1:
+                edited_weights = st.data_editor(editor_base, column_config={'Weight (%)': st.column_config.NumberColumn(min_value=0.0, max_value=100.0, step=0.1, format="%.2f")}, disabled=['Asset Class'], key="what_if_editor", use_container_width=True, height=420)
+                st.button("RESET TO SHEET WEIGHTS", on_click=reset_what_if, key="what_if_reset")
+            what_if.update(edited_weights['Weight (%)'] / 100)
+            what_if_metrics, sheet_metrics = what_if.metrics(asset_class_map), what_if_base.metrics(asset_class_map)
+            with ecol2:
+                wcol1, wcol2, wcol3, wcol4 = st.columns(4)
+                wcol1.metric("NAV (NET)", f"{what_if_metrics['NAV']:.2f}", delta=f"{what_if_metrics['NAV'] - sheet_metrics['NAV']:+.2f} vs sheet")
+                wcol2.metric("SHARPE (ANN.)", f"{what_if_metrics['Sharpe']:.3f}" if pd.notna(what_if_metrics['Sharpe']) else "N/A", delta=f"{what_if_metrics['Sharpe'] - sheet_metrics['Sharpe']:+.3f}" if pd.notna(what_if_metrics['Sharpe']) and pd.notna(sheet_metrics['Sharpe']) else None)
+                wcol3.metric("TRACKING ERROR", f"{what_if_metrics['Tracking Error']:.2%}" if pd.notna(what_if_metrics['Tracking Error']) else "N/A", delta=f"{what_if_metrics['Tracking Error'] - sheet_metrics['Tracking Error']:+.2%}" if pd.notna(what_if_metrics['Tracking Error']) and pd.notna(sheet_metrics['Tracking Error']) else None, delta_color="inverse")
+                wcol4.metric("TOTAL WEIGHT", f"{what_if_metrics['Total Weight']:.2%}")
+                if what_if_metrics['Over Cap']: st.error(f"{ASSET_WEIGHT_LIMIT:.0%} CAP BREACHED: {', '.join(what_if_metrics['Over Cap'])}")
+                else: st.success(f"All positions within the {ASSET_WEIGHT_LIMIT:.0%} cap")
+                if abs(what_if_metrics['Total Weight'] - 1.0) > 1e-4: st.warning(f"Weights sum to {what_if_metrics['Total Weight']:.2%} (100% expected)")
+                st.dataframe(pd.DataFrame({'What-If': what_if_metrics['Class Weights'], 'Sheet': sheet_metrics['Class Weights']}).fillna(0.0).style.format('{:.2%}'), use_container_width=True)
+                what_if_navs = pd.DataFrame({'What-If (Net)': what_if.nav(), 'Sheet (Net)': what_if_base.nav(), 'Benchmark (Gross)': results['comparison']['Benchmark'] if results['comparison'] is not None else np.nan})
+                st.line_chart(what_if_navs, height=260)
+        else: st.info("What-if editor unavailable (no data since simulation start).")
+        st.markdown("---")
         st.markdown("### MANAGEMENT RULES & CONSTRAINTS")
         st.markdown(f"""
         <div class='bloomberg-panel'>
@@ -998,7 +724,7 @@ with tab2:
             <ul>
                 <li><strong>Management Fees:</strong> {MANAGEMENT_FEE_ANNUAL:.2%} p.a. (deducted daily)</li>
                 <li><strong>Cash Remuneration:</strong> {CASH_RATE_ANNUAL:.2%} p.a. (applied daily)</li>
-                <li><strong>Transaction Fees:</strong> {TRANSACTION_FEE_RATE:.2%} per trade (buy/sell). <span style='color:{COLORS['text_secondary']};'>*Note: Not applied in current NAV simulation.*</span></li>
+                <li><strong>Transaction Fees:</strong> {TRANSACTION_FEE_RATE:.2%} per trade (buy/sell). <span style='color:{COLORS['text_secondary']};'>*Note: Not applied in the MONITOR NAV; see the transaction simulator below.*</span></li>
                 <li><strong>Overdraft Facility:</strong> Up to 20% allowed (subject to costs).</li>
                 <li><strong>Risk Calculation (if Leveraged):</strong> VaR (1d, 99%) mandatory.</li>
                 <li><strong>Trading Basis:</strong> Closing prices.</li>
@@ -1007,15 +733,55 @@ with tab2:
             </ul>
         </div>
         """, unsafe_allow_html=True)
-        st.warning("""**TRANSACTION SIMULATOR**\n\n*UNDER DEVELOPMENT*\n\nAvailable soon for strategy testing.""")
+
+        # --- Simulateur de transactions (backtest de rebalancement) ---
+        st.markdown("---")
+        st.markdown("### TRANSACTION SIMULATOR (REBALANCING BACKTEST)")
+        st.caption(f"Poids de la feuille plafonnés à {ASSET_WEIGHT_LIMIT:.0%}, frais de {TRANSACTION_FEE_RATE:.2%} par échange (hors cash), frais de gestion {MANAGEMENT_FEE_ANNUAL:.2%} p.a. Buy & Hold = aucun rebalancement.")
+        tcol1, tcol2, tcol3 = st.columns(3)
+        with tcol1: rebalance_mode = st.selectbox("REBALANCING RULE", ["PERIODIC", "THRESHOLD", "SCHEDULED"], key="rebalance_mode")
+        with tcol2:
+            if rebalance_mode == "PERIODIC":
+                rebalance_label = st.selectbox("FREQUENCY", list(REBALANCE_PERIODS), index=1, key="rebalance_period")
+                rebalance_strategy = {'label': rebalance_label, 'period': REBALANCE_PERIODS[rebalance_label]}
+            elif rebalance_mode == "THRESHOLD":
+                rebalance_threshold = st.slider("DRIFT THRESHOLD (%)", min_value=0.5, max_value=10.0, value=2.0, step=0.5, key="rebalance_threshold") / 100
+                rebalance_strategy = {'label': f"Drift > {rebalance_threshold:.1%}", 'threshold': rebalance_threshold}
+            else:
+                rebalance_dates_text = st.text_input("REBALANCE DATES (YYYY-MM-DD, ...)", value="", key="rebalance_dates")
+                rebalance_dates = pd.to_datetime(pd.Series([d.strip() for d in rebalance_dates_text.split(',') if d.strip()], dtype=object), errors='coerce')
+                if rebalance_dates.isna().any(): st.warning("Dates invalides ignorées.")
+                rebalance_strategy = {'label': 'Scheduled', 'dates': tuple(d.strftime('%Y-%m-%d') for d in rebalance_dates.dropna())}
+        with tcol3: backtest_period = st.selectbox("PERIOD", ["SINCE SIMULATION START", "FULL HISTORY"], key="backtest_period")
+        backtest_start = START_DATE_SIMULATION if backtest_period == "SINCE SIMULATION START" else returns_all.index.min()
+        with st.spinner("RUNNING BACKTEST..."):
+            backtest_navs, backtest_summary = cached_backtest(portfolio_df, benchmark_df, returns_all, data_version, ({'label': 'Buy & Hold', 'period': 0, 'enforce_cap': False}, rebalance_strategy), backtest_start)
+        if backtest_navs is not None:
+            bt_cols = st.columns(4); rule_row = backtest_summary.iloc[1]
+            bt_cols[0].metric("PERFORMANCE (NET)", f"{rule_row['Performance']:.2%}", delta=f"{rule_row['Performance'] - backtest_summary.iloc[0]['Performance']:+.2%} vs B&H")
+            bt_cols[1].metric("REBALANCES", f"{int(rule_row['Rebalances'])}"); bt_cols[2].metric("TURNOVER", f"{rule_row['Turnover']:.1%}"); bt_cols[3].metric("FEE DRAG", f"{rule_row['Fee Drag']:.3%}")
+            def draw_backtest():
+                fig_bt, ax_bt = plt.subplots(figsize=(14, 6)); fig_bt.patch.set_facecolor(COLORS['bg_dark']); ax_bt.set_facecolor(COLORS['bg_panel'])
+                for name, color in zip(backtest_navs.columns, [COLORS['text_secondary'], COLORS['accent_orange']]): ax_bt.plot(backtest_navs.index, backtest_navs[name], color=color, linewidth=2, label=name.upper())
+                ax_bt.set_ylabel('NAV (BASE 100, NET)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_bt.set_title('REBALANCING BACKTEST (NET OF FEES)', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_bt.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_bt.tick_params(colors=COLORS['text_secondary']); ax_bt.spines['bottom'].set_color(COLORS['border']); ax_bt.spines['top'].set_color(COLORS['border']); ax_bt.spines['left'].set_color(COLORS['border']); ax_bt.spines['right'].set_color(COLORS['border'])
+                ax_bt.legend(loc='upper left', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary']); ax_bt.tick_params(axis='x', labelrotation=45, labelsize=8); fig_bt.tight_layout()
+                return fig_bt
+            show_chart(('backtest', data_version, rebalance_strategy, backtest_start), draw_backtest)
+            backtest_format = {'Volatilité': '{:.2%}', 'Sharpe': '{:.3f}', 'VaR 99%': '{:.2%}', 'Tracking Error': '{:.2%}', 'Performance': '{:.2%}', 'Rebalances': '{:.0f}', 'Turnover': '{:.1%}', 'Fee Drag': '{:.3%}'}
+            st.dataframe(backtest_summary.style.format(backtest_format, na_rep='N/A'), use_container_width=True)
+            if st.checkbox("SWEEP ALL FREQUENCIES & THRESHOLDS", value=False, key="rebalance_sweep"):
+                with st.spinner("SWEEPING REBALANCING RULES..."): sweep_df = cached_rebalancing_sweep(portfolio_df, returns_all, data_version, backtest_start)
+                if sweep_df is not None: st.dataframe(sweep_df.drop(columns=['Tracking Error']).style.format(backtest_format, na_rep='N/A').background_gradient(subset=['Performance'], cmap='RdYlGn'), use_container_width=True)
+        else: st.warning("Backtest unavailable (no returns for the selected period).")
     else: st.error("PORTFOLIO DATA UNAVAILABLE")
 
 
 # --- TAB 3: ANALYTICS --- (Inchangé)
-with tab3:
+@st.fragment
+def analytics_tab():
     st.markdown("## ASSET ANALYTICS")
     if indicators_full is not None and corr_matrix is not None and bench_indicators_full is not None:
-        subtab1, subtab2, subtab3 = st.tabs(["INDICATORS", "VISUAL ANALYSIS", "CORRELATION"])
+        subtab1, subtab2, subtab3, subtab4, subtab5 = st.tabs(["INDICATORS", "VISUAL ANALYSIS", "CORRELATION", "ROLLING", "RISK (MONTE CARLO)"])
         with subtab1:
             st.markdown("### ASSET CHARACTERISTICS"); st.caption("Calculated over full historical period")
             col1, col2, col3, col4 = st.columns(4); col1.metric("ASSETS ANALYZED", len(indicators_full))
@@ -1025,14 +791,15 @@ with tab3:
             st.markdown("---")
             col_filter1, col_filter2 = st.columns(2)
             with col_filter1: asset_classes = ['ALL'] + sorted(list(indicators_full['Asset Class'].dropna().unique())); selected_class = st.selectbox("FILTER BY ASSET CLASS", asset_classes, key="filter_indicators")
-            with col_filter2: sort_by = st.selectbox("SORT BY", ['Ticker', 'Volatilite Annuelle', 'Sharpe Ratio Annuel', 'Beta (vs Benchmark)'], key="sort_indicators")
+            with col_filter2: sort_by = st.selectbox("SORT BY", ['Ticker', 'Volatilite Annuelle', 'Sharpe Ratio Annuel', 'Beta (vs Benchmark)'] + (['Max Drawdown'] if 'Max Drawdown' in indicators_full.columns else []), key="sort_indicators")
             if selected_class == 'ALL': filtered_df = indicators_full.copy()
             else: filtered_df = indicators_full[indicators_full['Asset Class'] == selected_class].copy()
             filtered_df = filtered_df.sort_values(by=sort_by, ascending=(sort_by != 'Sharpe Ratio Annuel'))
             styled_indicators = filtered_df.style.format({
                 'Volatilite Annuelle': '{:.2%}', 'Beta (vs Benchmark)': '{:.2f}',
                 'Correlation (vs Benchmark)': '{:.2f}', 'VaR 99% (1 jour)': '{:.2%}',
-                'Sharpe Ratio Annuel': '{:.3f}'
+                'Sharpe Ratio Annuel': '{:.3f}', 'Max Drawdown': '{:.2%}',
+                'Drawdown Duration (days)': '{:.0f}', 'Time to Recovery (days)': '{:.0f}'
             }, na_rep='N/A').background_gradient(
                 subset=['Sharpe Ratio Annuel'], cmap='RdYlGn', vmin=-1, vmax=2
             ).background_gradient(
@@ -1053,23 +820,29 @@ with tab3:
             else: data_plot = indicators_full[indicators_full['Asset Class'] == selected_class_viz].dropna(subset=['Beta (vs Benchmark)', 'Volatilite Annuelle'])
             st.info(f"Displaying **{len(data_plot)}** assets")
             if not data_plot.empty:
-                fig_scatter, ax_scatter = plt.subplots(figsize=(12, 7)); fig_scatter.patch.set_facecolor(COLORS['bg_dark']); ax_scatter.set_facecolor(COLORS['bg_panel'])
                 class_colors = {'Action': COLORS['danger'], 'Gov bond': COLORS['success'], 'Commodities': COLORS['accent_orange']} # Rouge, Turquoise, Orange
-                for asset_class in data_plot['Asset Class'].unique():
-                    if pd.notna(asset_class): subset = data_plot[data_plot['Asset Class'] == asset_class]; ax_scatter.scatter(subset['Beta (vs Benchmark)'], subset['Volatilite Annuelle'] * 100, label=asset_class, s=120, alpha=0.8, color=class_colors.get(asset_class, COLORS['text_secondary']), edgecolors=COLORS['text_primary'], linewidth=1.5)
-                ax_scatter.set_xlabel('BETA (VS BENCHMARK)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_scatter.set_ylabel('ANNUAL VOLATILITY (%)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_scatter.set_title('RISK-BETA ANALYSIS', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_scatter.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_scatter.tick_params(colors=COLORS['text_secondary']); ax_scatter.spines['bottom'].set_color(COLORS['border']); ax_scatter.spines['top'].set_color(COLORS['border']); ax_scatter.spines['left'].set_color(COLORS['border']); ax_scatter.spines['right'].set_color(COLORS['border'])
-                legend = ax_scatter.legend(loc='best', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9); [text.set_color(COLORS['text_primary']) for text in legend.get_texts()]
-                ax_scatter.axvline(1.0, color=COLORS['text_secondary'], linestyle='--', alpha=0.5, linewidth=1.5); fig_scatter.tight_layout(); st.pyplot(fig_scatter)
+                def draw_risk_beta():
+                    fig_scatter, ax_scatter = plt.subplots(figsize=(12, 7)); fig_scatter.patch.set_facecolor(COLORS['bg_dark']); ax_scatter.set_facecolor(COLORS['bg_panel'])
+                    for asset_class in data_plot['Asset Class'].unique():
+                        if pd.notna(asset_class): subset = data_plot[data_plot['Asset Class'] == asset_class]; ax_scatter.scatter(subset['Beta (vs Benchmark)'], subset['Volatilite Annuelle'] * 100, label=asset_class, s=120, alpha=0.8, color=class_colors.get(asset_class, COLORS['text_secondary']), edgecolors=COLORS['text_primary'], linewidth=1.5)
+                    ax_scatter.set_xlabel('BETA (VS BENCHMARK)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_scatter.set_ylabel('ANNUAL VOLATILITY (%)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_scatter.set_title('RISK-BETA ANALYSIS', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_scatter.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_scatter.tick_params(colors=COLORS['text_secondary']); ax_scatter.spines['bottom'].set_color(COLORS['border']); ax_scatter.spines['top'].set_color(COLORS['border']); ax_scatter.spines['left'].set_color(COLORS['border']); ax_scatter.spines['right'].set_color(COLORS['border'])
+                    legend = ax_scatter.legend(loc='best', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9); [text.set_color(COLORS['text_primary']) for text in legend.get_texts()]
+                    ax_scatter.axvline(1.0, color=COLORS['text_secondary'], linestyle='--', alpha=0.5, linewidth=1.5); fig_scatter.tight_layout()
+                    return fig_scatter
+                show_chart(('risk_beta', data_version, selected_class_viz), draw_risk_beta)
                 st.markdown("---")
                 st.markdown("### SHARPE RATIO VS VOLATILITY")
                 data_plot_sharpe = data_plot.dropna(subset=['Sharpe Ratio Annuel'])
                 if not data_plot_sharpe.empty:
-                    fig_sharpe, ax_sharpe = plt.subplots(figsize=(12, 7)); fig_sharpe.patch.set_facecolor(COLORS['bg_dark']); ax_sharpe.set_facecolor(COLORS['bg_panel'])
-                    for asset_class in data_plot_sharpe['Asset Class'].unique():
-                        if pd.notna(asset_class): subset = data_plot_sharpe[data_plot_sharpe['Asset Class'] == asset_class]; ax_sharpe.scatter(subset['Volatilite Annuelle'] * 100, subset['Sharpe Ratio Annuel'], label=asset_class, s=120, alpha=0.8, color=class_colors.get(asset_class, COLORS['text_secondary']), edgecolors=COLORS['text_primary'], linewidth=1.5)
-                    ax_sharpe.set_xlabel('ANNUAL VOLATILITY (%)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_sharpe.set_ylabel('SHARPE RATIO (ANN.)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_sharpe.set_title('RISK-ADJUSTED RETURN', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_sharpe.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_sharpe.tick_params(colors=COLORS['text_secondary']); ax_sharpe.spines['bottom'].set_color(COLORS['border']); ax_sharpe.spines['top'].set_color(COLORS['border']); ax_sharpe.spines['left'].set_color(COLORS['border']); ax_sharpe.spines['right'].set_color(COLORS['border'])
-                    legend = ax_sharpe.legend(loc='best', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9); [text.set_color(COLORS['text_primary']) for text in legend.get_texts()]
-                    ax_sharpe.axhline(0, color=COLORS['text_secondary'], linestyle='--', alpha=0.5, linewidth=1.5); fig_sharpe.tight_layout(); st.pyplot(fig_sharpe)
+                    def draw_sharpe_vol():
+                        fig_sharpe, ax_sharpe = plt.subplots(figsize=(12, 7)); fig_sharpe.patch.set_facecolor(COLORS['bg_dark']); ax_sharpe.set_facecolor(COLORS['bg_panel'])
+                        for asset_class in data_plot_sharpe['Asset Class'].unique():
+                            if pd.notna(asset_class): subset = data_plot_sharpe[data_plot_sharpe['Asset Class'] == asset_class]; ax_sharpe.scatter(subset['Volatilite Annuelle'] * 100, subset['Sharpe Ratio Annuel'], label=asset_class, s=120, alpha=0.8, color=class_colors.get(asset_class, COLORS['text_secondary']), edgecolors=COLORS['text_primary'], linewidth=1.5)
+                        ax_sharpe.set_xlabel('ANNUAL VOLATILITY (%)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_sharpe.set_ylabel('SHARPE RATIO (ANN.)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_sharpe.set_title('RISK-ADJUSTED RETURN', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_sharpe.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_sharpe.tick_params(colors=COLORS['text_secondary']); ax_sharpe.spines['bottom'].set_color(COLORS['border']); ax_sharpe.spines['top'].set_color(COLORS['border']); ax_sharpe.spines['left'].set_color(COLORS['border']); ax_sharpe.spines['right'].set_color(COLORS['border'])
+                        legend = ax_sharpe.legend(loc='best', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9); [text.set_color(COLORS['text_primary']) for text in legend.get_texts()]
+                        ax_sharpe.axhline(0, color=COLORS['text_secondary'], linestyle='--', alpha=0.5, linewidth=1.5); fig_sharpe.tight_layout()
+                        return fig_sharpe
+                    show_chart(('sharpe_vol', data_version, selected_class_viz), draw_sharpe_vol)
                 else: st.warning("Insufficient Sharpe data")
             else: st.warning("No data to display")
         with subtab3:
@@ -1077,27 +850,84 @@ with tab3:
             if corr_matrix is not None and not corr_matrix.empty:
                 col1, col2, col3, col4 = st.columns(4); corr_values = corr_matrix.values[np.triu_indices_from(corr_matrix.values, k=1)]; col1.metric("AVG CORR", f"{corr_values.mean():.2f}"); col2.metric("MAX CORR", f"{corr_values.max():.2f}"); col3.metric("MIN CORR", f"{corr_values.min():.2f}"); col4.metric("STD DEV", f"{corr_values.std():.2f}")
                 st.markdown("---")
-                all_assets = corr_matrix.columns.tolist(); col_filter1, col_filter2 = st.columns(2)
-                with col_filter1: show_all = st.checkbox("SHOW ALL ASSETS", value=True)
-                if not show_all:
-                    with col_filter2: n_assets = st.slider("NUMBER OF ASSETS", min_value=5, max_value=min(50, len(all_assets)), value=min(20, len(all_assets))); selected_assets = all_assets[:n_assets]; corr_display = corr_matrix.loc[selected_assets, selected_assets]
-                else: corr_display = corr_matrix
-                styled_corr = corr_display.style.background_gradient(cmap='coolwarm', vmin=-1, vmax=1).format("{:.2f}", na_rep='N/A')
-                st.dataframe(styled_corr, use_container_width=True, height=600)
-                csv_corr = corr_display.to_csv().encode('utf-8'); st.download_button("DOWNLOAD MATRIX", csv_corr, "correlation_matrix.csv", "text/csv", key='download_corr')
-                st.markdown("---")
-                st.markdown("### CORRELATION HEATMAP")
-                fig_heatmap, ax_heatmap = plt.subplots(figsize=(14, 12)); fig_heatmap.patch.set_facecolor(COLORS['bg_dark'])
-                if len(corr_display) > 30: st.info(f"Display limited to first 30 assets"); corr_viz = corr_display.iloc[:30, :30]
-                else: corr_viz = corr_display
-                im = ax_heatmap.imshow(corr_viz, cmap='coolwarm', aspect='auto', vmin=-1, vmax=1)
-                cbar = plt.colorbar(im, ax=ax_heatmap); cbar.set_label('CORRELATION', rotation=270, labelpad=20, fontsize=10, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); cbar.ax.tick_params(colors=COLORS['text_secondary'])
-                ax_heatmap.set_xticks(range(len(corr_viz.columns))); ax_heatmap.set_yticks(range(len(corr_viz.index))); ax_heatmap.set_xticklabels(corr_viz.columns, rotation=90, fontsize=7, color=COLORS['text_secondary']); ax_heatmap.set_yticklabels(corr_viz.index, fontsize=7, color=COLORS['text_secondary']); ax_heatmap.set_title('CORRELATION HEATMAP', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); fig_heatmap.tight_layout(); st.pyplot(fig_heatmap)
+                n_corr_assets = len(corr_matrix)
+                n_clusters = st.slider("CLUSTERS", min_value=1, max_value=max(2, min(12, n_corr_assets)), value=min(CORRELATION_CLUSTERS, n_corr_assets), key="corr_clusters")
+                corr_order, corr_clusters, corr_cluster_summary = cached_correlation_clusters(corr_matrix, asset_map, data_version, n_clusters)
+                corr_ordered = corr_matrix.loc[corr_order, corr_order]
+                st.markdown("### CLUSTERED CORRELATION HEATMAP"); st.caption("Actifs ordonnés par classification hiérarchique (lien moyen, distance √((1 - ρ) / 2)), groupes encadrés. Une seule image quelle que soit la taille de l'univers.")
+                def draw_correlation_heatmap():
+                    fig_heatmap, ax_heatmap = plt.subplots(figsize=(14, 12)); fig_heatmap.patch.set_facecolor(COLORS['bg_dark'])
+                    im = ax_heatmap.imshow(corr_ordered.to_numpy(dtype=float), cmap='coolwarm', aspect='auto', vmin=-1, vmax=1, interpolation='nearest')
+                    cbar = fig_heatmap.colorbar(im, ax=ax_heatmap); cbar.set_label('CORRELATION', rotation=270, labelpad=20, fontsize=10, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); cbar.ax.tick_params(colors=COLORS['text_secondary'])
+                    for boundary in np.flatnonzero(np.diff(corr_clusters.to_numpy())) + 0.5: ax_heatmap.axhline(boundary, color=COLORS['text_primary'], linewidth=1.2); ax_heatmap.axvline(boundary, color=COLORS['text_primary'], linewidth=1.2)
+                    if n_corr_assets <= 60: ax_heatmap.set_xticks(range(n_corr_assets)); ax_heatmap.set_yticks(range(n_corr_assets)); ax_heatmap.set_xticklabels(corr_ordered.columns, rotation=90, fontsize=7, color=COLORS['text_secondary']); ax_heatmap.set_yticklabels(corr_ordered.index, fontsize=7, color=COLORS['text_secondary'])
+                    else: ax_heatmap.set_xticks([]); ax_heatmap.set_yticks([]) # Univers trop large pour des libellés lisibles: voir le détail par groupe
+                    ax_heatmap.set_title(f'CORRELATION HEATMAP ({n_corr_assets} ASSETS, {len(corr_cluster_summary)} CLUSTERS)', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); fig_heatmap.tight_layout()
+                    return fig_heatmap
+                show_chart(('correlation_heatmap', data_version, n_clusters), draw_correlation_heatmap)
+                st.markdown("### CLUSTERS")
+                st.dataframe(corr_cluster_summary.style.format({'Avg Corr (Within)': '{:.2f}', 'Avg Corr (Other Clusters)': '{:.2f}'}, na_rep='N/A'), use_container_width=True)
+                drill_cluster = st.selectbox("DRILL DOWN", corr_cluster_summary.index, format_func=lambda c: f"CLUSTER {c} ({corr_cluster_summary.loc[c, 'Assets']} ASSETS)", key="corr_cluster_drill")
+                cluster_members = corr_clusters.index[corr_clusters == drill_cluster]
+                st.dataframe(corr_ordered.loc[cluster_members, cluster_members].style.background_gradient(cmap='coolwarm', vmin=-1, vmax=1).format("{:.2f}", na_rep='N/A'), use_container_width=True, height=min(600, 35 * (len(cluster_members) + 1) + 3))
+                csv_corr = corr_ordered.to_csv().encode('utf-8'); st.download_button("DOWNLOAD MATRIX (CLUSTERED ORDER)", csv_corr, "correlation_matrix.csv", "text/csv", key='download_corr')
             else: st.error("Correlation matrix unavailable")
+        with subtab4:
+            st.markdown("### ROLLING ANALYTICS"); st.caption(f"Fenêtre glissante, annualisé {TRADING_DAYS}j. Portfolio = poids de la feuille appliqués sur tout l'historique (brut)")
+            rcol1, rcol2 = st.columns(2)
+            with rcol1: rolling_window = st.selectbox("WINDOW (DAYS)", ROLLING_WINDOWS, index=ROLLING_WINDOWS.index(ROLLING_WINDOW_DEFAULT), key="rolling_window")
+            with rcol2: rolling_metric = st.selectbox("METRIC", ROLLING_METRICS, key="rolling_metric")
+            if rolling_window == ROLLING_WINDOW_DEFAULT and results.get('rolling') is not None: rolling = results['rolling'] # Précalculé par le pipeline
+            else: rolling = cached_rolling_analytics(portfolio_df, benchmark_df, returns_all, data_version, rolling_window)
+            if rolling is not None:
+                rolling_df = rolling[rolling_metric]
+                rolling_series = st.multiselect("SERIES", list(rolling_df.columns), default=['Portfolio', 'Benchmark'], key="rolling_series")
+                if rolling_series:
+                    def draw_rolling():
+                        fig_rolling, ax_rolling = plt.subplots(figsize=(14, 6)); fig_rolling.patch.set_facecolor(COLORS['bg_dark']); ax_rolling.set_facecolor(COLORS['bg_panel'])
+                        for name in rolling_series: ax_rolling.plot(rolling_df.index, rolling_df[name], linewidth=2 if name in ('Portfolio', 'Benchmark') else 1.2, label=name.upper())
+                        if rolling_metric in ('Volatilité', 'Tracking Error'): ax_rolling.yaxis.set_major_formatter(mtick.PercentFormatter(xmax=1.0))
+                        elif rolling_metric == 'Beta': ax_rolling.axhline(1.0, color=COLORS['text_secondary'], linestyle='--', alpha=0.5, linewidth=1.5)
+                        else: ax_rolling.axhline(0, color=COLORS['text_secondary'], linestyle='--', alpha=0.5, linewidth=1.5)
+                        ax_rolling.set_ylabel(f'{rolling_metric.upper()} ({rolling_window}D)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_rolling.set_title(f'ROLLING {rolling_metric.upper()} ({rolling_window}D WINDOW)', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_rolling.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_rolling.tick_params(colors=COLORS['text_secondary']); ax_rolling.spines['bottom'].set_color(COLORS['border']); ax_rolling.spines['top'].set_color(COLORS['border']); ax_rolling.spines['left'].set_color(COLORS['border']); ax_rolling.spines['right'].set_color(COLORS['border'])
+                        ax_rolling.legend(loc='upper left', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary']); ax_rolling.tick_params(axis='x', labelrotation=45, labelsize=8); fig_rolling.tight_layout()
+                        return fig_rolling
+                    show_chart(('rolling', data_version, rolling_window, rolling_metric, tuple(rolling_series)), draw_rolling)
+                    st.dataframe(rolling_df[rolling_series].iloc[::-1].style.format('{:.2%}' if rolling_metric in ('Volatilité', 'Tracking Error') else '{:.3f}', na_rep='N/A'), use_container_width=True, height=300)
+                else: st.info("Select at least one series")
+            else: st.warning(f"Historique insuffisant pour une fenêtre de {rolling_window} jours")
+        with subtab5:
+            st.markdown("### MONTE CARLO VaR / CVaR"); st.caption(f"Poids de la feuille vs benchmark, rendements bruts rebalancés chaque jour, horizons {', '.join(str(h) for h in MC_HORIZONS)} jours de bourse.")
+            mcol1, mcol2, mcol3 = st.columns(3)
+            with mcol1: mc_method = st.selectbox("SCENARIOS", ['cholesky', 'bootstrap'], format_func={'cholesky': 'NORMAL (CHOLESKY, μ/Σ OPTIM.)', 'bootstrap': 'FILTERED HISTORICAL BOOTSTRAP'}.get, key="mc_method")
+            with mcol2: mc_paths = st.select_slider("PATHS", options=[10_000, 100_000, 1_000_000], value=MC_PATHS, format_func=lambda n: f"{n:,}", key="mc_paths")
+            with mcol3: mc_confidence = st.selectbox("CONFIDENCE", [0.95, 0.99], index=1, format_func=lambda c: f"{c:.0%}", key="mc_confidence")
+            with st.spinner(f"SIMULATING {mc_paths:,} PATHS..."):
+                mean_returns_opt, cov_matrix_opt = optimization_inputs_for(results_cov_method)
+                mc_risk, mc_distribution = cached_monte_carlo(portfolio_df, benchmark_df, returns_all, mean_returns_opt, cov_matrix_opt, data_version, results_cov_method, mc_method, mc_paths, mc_confidence)
+            if mc_risk is not None:
+                var_col, cvar_col = f"VaR {mc_confidence:.0%}", f"CVaR {mc_confidence:.0%}"
+                mc_table = mc_risk.pivot(index='Horizon (days)', columns='Portfolio', values=[var_col, cvar_col, 'Mean', 'Std'])
+                st.dataframe(mc_table.style.format('{:.2%}'), use_container_width=True)
+                def draw_monte_carlo():
+                    fig_mc, ax_mc = plt.subplots(figsize=(14, 6)); fig_mc.patch.set_facecolor(COLORS['bg_dark']); ax_mc.set_facecolor(COLORS['bg_panel'])
+                    horizon_max = mc_risk['Horizon (days)'].max(); bin_width = mc_distribution.index[1] - mc_distribution.index[0]
+                    for name, color in zip(mc_distribution.columns, [COLORS['accent_orange'], COLORS['blue_bright']]):
+                        ax_mc.bar(mc_distribution.index, mc_distribution[name], width=bin_width, color=color, alpha=0.55, label=f"{name.upper()} ({horizon_max}D)")
+                        var_value = mc_risk[(mc_risk['Portfolio'] == name) & (mc_risk['Horizon (days)'] == horizon_max)][var_col].iloc[0]
+                        ax_mc.axvline(100 * (1 + var_value), color=color, linestyle='--', linewidth=2, label=f"{var_col} {name.upper()} ({var_value:.2%})")
+                    visible = mc_distribution.index[(mc_distribution.sum(axis=1) > 1e-5).to_numpy()]
+                    if len(visible): ax_mc.set_xlim(visible.min() - bin_width, visible.max() + bin_width)
+                    ax_mc.set_xlabel(f'TERMINAL NAV (BASE 100, {horizon_max}D)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_mc.set_ylabel('FREQUENCY', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_mc.set_title('TERMINAL NAV DISTRIBUTION (MONTE CARLO)', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_mc.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_mc.tick_params(colors=COLORS['text_secondary']); ax_mc.spines['bottom'].set_color(COLORS['border']); ax_mc.spines['top'].set_color(COLORS['border']); ax_mc.spines['left'].set_color(COLORS['border']); ax_mc.spines['right'].set_color(COLORS['border'])
+                    ax_mc.legend(loc='upper left', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary']); fig_mc.tight_layout()
+                    return fig_mc
+                show_chart(('monte_carlo', data_version, results_cov_method, mc_method, mc_paths, mc_confidence), draw_monte_carlo)
+            else: st.warning("Monte Carlo unavailable (optimization inputs missing).")
     else: st.error("Analytics data unavailable")
 
 # --- TAB 4: OPTIMIZATION ---
-with tab4:
+@st.fragment
+def optimization_tab():
     st.markdown("## PORTFOLIO OPTIMIZATION")
     st.markdown("Calcul automatique du portefeuille maximisant le Ratio de Sharpe (basé sur l'historique 2022-2025).")
     st.markdown("**Contraintes:** Poids Actifs >= 0% | Poids Actifs <= 10% | Somme Poids = 100%")
@@ -1109,6 +939,12 @@ with tab4:
     with col2:
         target_sharpe = bench_indicators_full['Ratio de Sharpe Annuel'] * 2 if bench_indicators_full and pd.notna(bench_indicators_full['Ratio de Sharpe Annuel']) else np.nan
         st.metric("TARGET PORTFOLIO SHARPE", f"{target_sharpe:.4f}" if pd.notna(target_sharpe) else "N/A", help="Benchmark Sharpe x 2 (Your Goal)")
+    cov_methods = list(COVARIANCE_METHODS)
+    cov_method = st.selectbox("COVARIANCE ESTIMATOR", cov_methods, index=cov_methods.index(results_cov_method), format_func=COVARIANCE_METHODS.get, key="cov_method",
+                              help="Sample: historique brut | Ledoit-Wolf: shrinkage vers l'identité | EWMA: observations récentes surpondérées | Factor: L L' + diag(d), produits en O(nk)")
+    opt = optimization_results(cov_method)
+    mean_returns_opt, cov_matrix_opt, optimal_weights, optim_error = opt['mean_returns_opt'], opt['cov_matrix_opt'], opt['optimal_weights'], opt['optim_error']
+    nav_opt_sim, indicators_opt_sim, comparison = opt['nav_opt_sim'], opt['indicators_opt_sim'], results['comparison']
     st.markdown("---")
 
     # --- Section de Simulation Automatique ---
@@ -1135,13 +971,6 @@ with tab4:
 
 
         st.markdown("### SIMULATED PERFORMANCE (OPTIMIZED PORTFOLIO)")
-        
-        # Convertir le DataFrame de poids en dictionnaire pour la simulation
-        optimal_weights_dict = optimal_weights['Weight'].to_dict()
-
-        nav_opt_sim, indicators_opt_sim = simulate_portfolio_performance(
-            optimal_weights_dict, returns_all, START_DATE_SIMULATION
-        )
 
         if nav_opt_sim is not None and indicators_opt_sim is not None:
             st.markdown("#### Indicateurs Clés Simulés (Net of Fees):")
@@ -1171,18 +1000,20 @@ with tab4:
                  else: comparison_opt_df.loc[START_DATE_SIMULATION] = 100.0; comparison_opt_df = comparison_opt_df.sort_index()
                  comparison_opt_df = comparison_opt_df.ffill()
 
-                 fig_opt, ax_opt = plt.subplots(figsize=(14, 7)); fig_opt.patch.set_facecolor(COLORS['bg_dark']); ax_opt.set_facecolor(COLORS['bg_panel'])
-                 ax_opt.plot(comparison_opt_df.index, comparison_opt_df['Benchmark (Gross)'], color=COLORS['blue_bright'], linewidth=2.0, linestyle='--', label='Benchmark (Gross)', alpha=0.8)
-                 ax_opt.plot(comparison_opt_df.index, comparison_opt_df['Optimized Portfolio (Sim, Net)'], color=COLORS['success'], linewidth=2.5, label='Optimized Sim (Net)', alpha=0.9)
-                 ax_opt.set_ylabel("NAV (BASE 100)", fontsize=11, color=COLORS['text_primary'], fontfamily='monospace')
-                 ax_opt.tick_params(axis='y', labelcolor=COLORS['text_primary'], colors=COLORS['text_primary']); ax_opt.tick_params(axis='x', labelcolor=COLORS['text_secondary'], colors=COLORS['text_secondary'])
-                 min_val_opt = comparison_opt_df.min().min() if not comparison_opt_df.empty else 90
-                 max_val_opt = comparison_opt_df.max().max() if not comparison_opt_df.empty else 110
-                 ax_opt.set_ylim(bottom=max(80, min_val_opt - 2), top=min(120, max_val_opt + 2))
-                 ax_opt.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_opt.spines['bottom'].set_color(COLORS['border']); ax_opt.spines['top'].set_color(COLORS['border']); ax_opt.spines['left'].set_color(COLORS['border']); ax_opt.spines['right'].set_color(COLORS['border'])
-                 ax_opt.legend(loc='upper left', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary'])
-                 plt.title("SIMULATED OPTIMIZED PERFORMANCE vs BENCHMARK", fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); plt.xticks(rotation=45, fontsize=8); fig_opt.tight_layout();
-                 st.pyplot(fig_opt)
+                 def draw_optimized_performance():
+                     fig_opt, ax_opt = plt.subplots(figsize=(14, 7)); fig_opt.patch.set_facecolor(COLORS['bg_dark']); ax_opt.set_facecolor(COLORS['bg_panel'])
+                     ax_opt.plot(comparison_opt_df.index, comparison_opt_df['Benchmark (Gross)'], color=COLORS['blue_bright'], linewidth=2.0, linestyle='--', label='Benchmark (Gross)', alpha=0.8)
+                     ax_opt.plot(comparison_opt_df.index, comparison_opt_df['Optimized Portfolio (Sim, Net)'], color=COLORS['success'], linewidth=2.5, label='Optimized Sim (Net)', alpha=0.9)
+                     ax_opt.set_ylabel("NAV (BASE 100)", fontsize=11, color=COLORS['text_primary'], fontfamily='monospace')
+                     ax_opt.tick_params(axis='y', labelcolor=COLORS['text_primary'], colors=COLORS['text_primary']); ax_opt.tick_params(axis='x', labelcolor=COLORS['text_secondary'], colors=COLORS['text_secondary'])
+                     min_val_opt = comparison_opt_df.min().min() if not comparison_opt_df.empty else 90
+                     max_val_opt = comparison_opt_df.max().max() if not comparison_opt_df.empty else 110
+                     ax_opt.set_ylim(bottom=max(80, min_val_opt - 2), top=min(120, max_val_opt + 2))
+                     ax_opt.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_opt.spines['bottom'].set_color(COLORS['border']); ax_opt.spines['top'].set_color(COLORS['border']); ax_opt.spines['left'].set_color(COLORS['border']); ax_opt.spines['right'].set_color(COLORS['border'])
+                     ax_opt.legend(loc='upper left', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary'])
+                     ax_opt.set_title("SIMULATED OPTIMIZED PERFORMANCE vs BENCHMARK", fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_opt.tick_params(axis='x', labelrotation=45, labelsize=8); fig_opt.tight_layout()
+                     return fig_opt
+                 show_chart(('optimized_performance', data_version, cov_method), draw_optimized_performance)
             else:
                  st.warning("Could not generate comparison chart for optimal simulation.")
         else:
@@ -1192,8 +1023,8 @@ with tab4:
         # Fallback si Scipy n'est pas dispo ou si l'optimisation a échoué
         if not SCIPY_AVAILABLE:
             st.error("Optimisation automatique désactivée (Scipy non trouvé).")
-        elif 'optim_success' in st.session_state and not st.session_state['optim_success']:
-             st.error(f"L'optimisation automatique a échoué: {st.session_state.get('optim_error', 'Erreur inconnue')}")
+        elif optim_error:
+             st.error(f"L'optimisation automatique a échoué: {optim_error}")
         else:
              st.error("L'optimisation automatique a échoué (données manquantes ou autre erreur).")
 
@@ -1211,12 +1042,143 @@ with tab4:
 
         if 'cov_matrix_opt' in locals() and cov_matrix_opt is not None:
              st.markdown("Aperçu (5x5):")
-             st.dataframe(cov_matrix_opt.iloc[:5, :5].style.format("{:.8f}"), use_container_width=True)
-             csv_cov = cov_matrix_opt.to_csv().encode('utf-8')
+             cov_frame_opt = covariance_frame(cov_matrix_opt) # Modèle factoriel: densifié pour l'affichage/export uniquement
+             st.dataframe(cov_frame_opt.iloc[:5, :5].style.format("{:.8f}"), use_container_width=True)
+             csv_cov = cov_frame_opt.to_csv().encode('utf-8')
              st.download_button("DOWNLOAD COVARIANCE MATRIX (CSV)", csv_cov, "covariance_matrix_opt.csv", "text/csv", key='dl_cov_mat_manual')
         else:
             st.warning("Covariance matrix data for optimization not available.")
 
+    # --- Allocateurs du registre comparés sur les mêmes mu/S ---
+    st.markdown("---")
+    st.markdown("### ALLOCATION ENGINES (SIDE BY SIDE)")
+    if mean_returns_opt is not None and cov_matrix_opt is not None:
+        with st.spinner("RUNNING ALLOCATORS..."): alloc_weights, alloc_summary, alloc_errors = cached_allocators(mean_returns_opt, cov_matrix_opt, data_version, cov_method)
+        for label, message in (alloc_errors or {}).items(): st.warning(f"{label}: {message}")
+        if alloc_weights is not None:
+            st.caption(f"Mêmes contraintes pour tous (0% <= Poids <= {ASSET_WEIGHT_LIMIT:.0%}, somme = 100%) et même estimateur ({COVARIANCE_METHODS[cov_method]}). Risk parity, max diversification et HRP n'investissent pas le cash (variance nulle).")
+            st.markdown("#### EX-ANTE (HISTORICAL)")
+            st.dataframe(alloc_summary.style.format({'Return (Ann.)': '{:.2%}', 'Volatility (Ann.)': '{:.2%}', 'Sharpe (Ann.)': '{:.3f}', 'Diversification Ratio': '{:.2f}',
+                                                     'Max Risk Contribution': '{:.1%}', 'Effective N': '{:.1f}', 'Max Weight': '{:.2%}', 'Assets': '{:.0f}'}, na_rep='N/A'), use_container_width=True)
+            returns_sim_alloc = returns_all[returns_all.index >= START_DATE_SIMULATION]
+            bench_returns_alloc = calculate_benchmark_returns(returns_sim_alloc, get_tickers_by_class(benchmark_df, returns_sim_alloc.columns), calculate_daily_rates()[0]).fillna(0)
+            _, alloc_sim = simulate_portfolios_batch(alloc_weights, returns_all, START_DATE_SIMULATION, bench_returns_alloc)
+            if alloc_sim is not None:
+                st.markdown(f"#### SIMULATED SINCE {START_DATE_SIMULATION.strftime('%d/%m/%Y')} (NET OF MGMT FEES)")
+                st.dataframe(alloc_sim.style.format({'Volatilité': '{:.2%}', 'Sharpe': '{:.3f}', 'VaR 99%': '{:.2%}', 'Tracking Error': '{:.2%}', 'Performance': '{:+.2%}'}, na_rep='N/A').background_gradient(subset=['Sharpe'], cmap='RdYlGn'), use_container_width=True)
+            class_of = benchmark_df.drop_duplicates('BBG Ticker').set_index('BBG Ticker')['Asset Class'].reindex(alloc_weights.columns).fillna('Cash')
+            st.markdown("#### WEIGHTS BY ASSET CLASS")
+            st.bar_chart(alloc_weights.T.groupby(class_of.to_numpy()).sum().T)
+            with st.expander("WEIGHTS BY ASSET"):
+                st.dataframe(alloc_weights.T.loc[(alloc_weights > 1e-6).any().to_numpy()].style.format('{:.2%}').background_gradient(cmap='Greens', vmin=0, vmax=ASSET_WEIGHT_LIMIT), use_container_width=True, height=400)
+    else: st.info("Allocation engines require optimization data.")
+
+    # --- Frontière efficiente ---
+    st.markdown("---")
+    st.markdown("### EFFICIENT FRONTIER")
+    if SCIPY_AVAILABLE and mean_returns_opt is not None and cov_matrix_opt is not None:
+        fcol1, fcol2 = st.columns(2)
+        with fcol1: frontier_mode = st.checkbox("FRONTIER MODE", value=False, key="frontier_mode", help=f"Min-variance portfolios across a grid of target returns (0% <= Poids <= {ASSET_WEIGHT_LIMIT:.0%}).")
+        with fcol2: n_frontier_points = st.slider("FRONTIER POINTS", min_value=10, max_value=60, value=FRONTIER_POINTS, step=5, key="frontier_points")
+        if frontier_mode:
+            with st.spinner("SOLVING EFFICIENT FRONTIER..."):
+                if results.get('frontier') is not None and n_frontier_points == FRONTIER_POINTS and cov_method == results_cov_method: frontier_df = results['frontier'] # Précalculée par la CLI
+                else: frontier_df = cached_efficient_frontier(mean_returns_opt, cov_matrix_opt, data_version, cov_method, ASSET_WEIGHT_LIMIT, n_frontier_points)
+            if frontier_df is not None and not frontier_df.empty:
+                def draw_frontier():
+                    fig_frontier, ax_frontier = plt.subplots(figsize=(12, 7)); fig_frontier.patch.set_facecolor(COLORS['bg_dark']); ax_frontier.set_facecolor(COLORS['bg_panel'])
+                    ax_frontier.plot(frontier_df['Volatility (Ann.)'] * 100, frontier_df['Return (Ann.)'] * 100, color=COLORS['accent_yellow'], linewidth=2.5, marker='o', markersize=4, label='EFFICIENT FRONTIER')
+                    frontier_points = {'PORTFOLIO (SHEET)': (portfolio_df.set_index('BBG Ticker')['Weight'], COLORS['accent_orange']),
+                                       'BENCHMARK': (benchmark_composition(benchmark_df, mean_returns_opt.index), COLORS['blue_bright'])}
+                    if optimal_weights is not None: frontier_points['MAX SHARPE'] = (optimal_weights['Weight'], COLORS['success'])
+                    for label, (weights_point, color) in frontier_points.items():
+                        ret_point, vol_point = portfolio_point(weights_point, mean_returns_opt, cov_matrix_opt)
+                        ax_frontier.scatter(vol_point * 100, ret_point * 100, s=160, color=color, edgecolors=COLORS['text_primary'], linewidth=1.5, label=label, zorder=3)
+                    ax_frontier.set_xlabel('ANNUAL VOLATILITY (%)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_frontier.set_ylabel('ANNUAL RETURN (%)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_frontier.set_title('EFFICIENT FRONTIER (HISTORICAL, CAPPED)', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_frontier.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_frontier.tick_params(colors=COLORS['text_secondary']); ax_frontier.spines['bottom'].set_color(COLORS['border']); ax_frontier.spines['top'].set_color(COLORS['border']); ax_frontier.spines['left'].set_color(COLORS['border']); ax_frontier.spines['right'].set_color(COLORS['border'])
+                    ax_frontier.legend(loc='best', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary']); fig_frontier.tight_layout()
+                    return fig_frontier
+                show_chart(('frontier', data_version, cov_method, n_frontier_points), draw_frontier)
+                with st.expander("FRONTIER PORTFOLIOS"):
+                    st.dataframe(frontier_df.drop(columns=['Target Return']).style.format({c: '{:.2%}' for c in frontier_df.columns if c != 'Target Return'}), use_container_width=True, height=300)
+            else: st.warning("Efficient frontier unavailable (infeasible constraints or solver failure).")
+    else: st.info("Efficient frontier requires scipy and optimization data.")
+
+    # --- Walk-forward: ré-estimation périodique et NAV hors échantillon ---
+    st.markdown("---")
+    st.markdown("### WALK-FORWARD BACKTEST (OUT-OF-SAMPLE)")
+    if SCIPY_AVAILABLE and mean_returns_opt is not None:
+        wcol1, wcol2, wcol3 = st.columns(3)
+        with wcol1: walk_forward_mode = st.checkbox("WALK-FORWARD MODE", value=False, key="walk_forward_mode", help="Max Sharpe re-estimated on past data only at each rebalance date, applied from the next day.")
+        with wcol2: walk_forward_freq = st.selectbox("REBALANCE FREQUENCY", list(REBALANCE_PERIODS), index=1, key="walk_forward_freq")
+        with wcol3: walk_forward_window = st.selectbox("ESTIMATION WINDOW", list(WALK_FORWARD_LOOKBACKS), index=1, key="walk_forward_window")
+        if walk_forward_mode:
+            with st.spinner("RUNNING WALK-FORWARD OPTIMIZATION..."):
+                wf_navs, wf_weights, wf_summary = cached_walk_forward(benchmark_df, returns_all, optimal_weights['Weight'] if optimal_weights is not None else None, data_version, cov_method,
+                                                                       REBALANCE_PERIODS[walk_forward_freq], WALK_FORWARD_LOOKBACKS[walk_forward_window])
+            if wf_navs is not None:
+                st.caption(f"{len(wf_weights)} estimations ({COVARIANCE_METHODS[cov_method]}) depuis le {wf_navs.index[0].strftime('%d/%m/%Y')}; frais de transaction {TRANSACTION_FEE_RATE:.2%} du turnover et frais de gestion inclus. L'optimum plein historique (in-sample) est rebalancé aux mêmes dates.")
+                wf_row = wf_summary.loc['Walk-Forward (Net)']
+                wf_cols = st.columns(4)
+                wf_cols[0].metric("PERFORMANCE (OOS, NET)", f"{wf_row['Performance']:.2%}", delta=f"{wf_row['Performance'] - wf_summary.loc['Benchmark', 'Performance']:+.2%} vs BMK")
+                wf_cols[1].metric("SHARPE (OOS)", f"{wf_row['Sharpe']:.3f}" if pd.notna(wf_row['Sharpe']) else "N/A"); wf_cols[2].metric("TURNOVER", f"{wf_row['Turnover']:.1%}"); wf_cols[3].metric("FEE DRAG", f"{wf_row['Fee Drag']:.3%}")
+                def draw_walk_forward():
+                    fig_wf, ax_wf = plt.subplots(figsize=(14, 6)); fig_wf.patch.set_facecolor(COLORS['bg_dark']); ax_wf.set_facecolor(COLORS['bg_panel'])
+                    wf_colors = {'Walk-Forward (Net)': COLORS['success'], 'Benchmark': COLORS['blue_bright'], 'In-Sample Max Sharpe (Net)': COLORS['text_secondary']}
+                    for name in wf_navs.columns: ax_wf.plot(wf_navs.index, wf_navs[name], color=wf_colors.get(name, COLORS['accent_yellow']), linewidth=2, linestyle='--' if name == 'In-Sample Max Sharpe (Net)' else '-', label=name.upper())
+                    ax_wf.set_ylabel('NAV (BASE 100)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_wf.set_title('WALK-FORWARD vs IN-SAMPLE OPTIMUM', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_wf.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_wf.tick_params(colors=COLORS['text_secondary']); ax_wf.spines['bottom'].set_color(COLORS['border']); ax_wf.spines['top'].set_color(COLORS['border']); ax_wf.spines['left'].set_color(COLORS['border']); ax_wf.spines['right'].set_color(COLORS['border'])
+                    ax_wf.legend(loc='upper left', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary']); ax_wf.tick_params(axis='x', labelrotation=45, labelsize=8); fig_wf.tight_layout()
+                    return fig_wf
+                show_chart(('walk_forward', data_version, cov_method, walk_forward_freq, walk_forward_window), draw_walk_forward)
+                st.dataframe(wf_summary.style.format({'Volatilité': '{:.2%}', 'Sharpe': '{:.3f}', 'VaR 99%': '{:.2%}', 'Tracking Error': '{:.2%}', 'Performance': '{:.2%}', 'Rebalances': '{:.0f}', 'Turnover': '{:.1%}', 'Fee Drag': '{:.3%}'}, na_rep='N/A'), use_container_width=True)
+                with st.expander("WEIGHTS AT EACH REBALANCE"):
+                    st.dataframe(wf_weights.loc[:, (wf_weights > 1e-6).any()].style.format('{:.2%}'), use_container_width=True, height=300)
+            else: st.warning("Walk-forward unavailable (not enough history for the estimation window or solver failure).")
+    else: st.info("Walk-forward backtest requires scipy and optimization data.")
+
+    # --- Comparaison batch: portefeuille du fichier, optimum SLSQP et allocations candidates ---
+    st.markdown("---")
+    st.markdown("### PORTFOLIO COMPARISON (BATCH SIMULATION)")
+    universe_batch = [str(t) for t in mean_returns_opt.index] if mean_returns_opt is not None else []
+    if universe_batch and portfolio_df is not None:
+        st.caption(f"All allocations simulated together since {START_DATE_SIMULATION.strftime('%d/%m/%Y')} (net of management fees). Candidates are random allocations under the {ASSET_WEIGHT_LIMIT:.0%} cap.")
+        n_candidates = st.slider("NUMBER OF CANDIDATE ALLOCATIONS", min_value=0, max_value=2000, value=500, step=100, key="batch_candidates")
+        named_weights = {'Sheet Portfolio': portfolio_df.groupby('BBG Ticker')['Weight'].sum()}
+        if optimal_weights is not None: named_weights['Max Sharpe (SLSQP)'] = optimal_weights['Weight']
+        named_weights['Equal Weight'] = pd.Series(1.0 / len(universe_batch), index=universe_batch)
+        batch_weights = pd.DataFrame(named_weights).T
+        if n_candidates > 0 and len(universe_batch) * ASSET_WEIGHT_LIMIT >= 1:
+            candidates = pd.DataFrame(random_capped_weights(n_candidates, len(universe_batch)), columns=universe_batch, index=[f"Candidate {i + 1}" for i in range(n_candidates)])
+            batch_weights = pd.concat([batch_weights, candidates])
+        batch_weights = batch_weights.fillna(0.0)
+
+        returns_sim_batch = returns_all[returns_all.index >= START_DATE_SIMULATION]
+        bench_returns_batch = calculate_benchmark_returns(returns_sim_batch, get_tickers_by_class(benchmark_df, returns_sim_batch.columns), calculate_daily_rates()[0]).fillna(0)
+        navs_batch, metrics_batch = simulate_portfolios_batch(batch_weights, returns_all, START_DATE_SIMULATION, bench_returns_batch)
+
+        if metrics_batch is not None:
+            named_index = [name for name in named_weights if name in metrics_batch.index]
+            top_candidates = metrics_batch.drop(index=named_index).sort_values('Sharpe', ascending=False).head(10)
+            batch_table = pd.concat([metrics_batch.loc[named_index], top_candidates])
+            st.dataframe(batch_table.style.format({'Volatilité': '{:.2%}', 'Sharpe': '{:.3f}', 'VaR 99%': '{:.2%}', 'Tracking Error': '{:.2%}', 'Performance': '{:+.2%}'}, na_rep='N/A').background_gradient(subset=['Sharpe'], cmap='RdYlGn'), use_container_width=True)
+            st.caption("Reference portfolios first, then the 10 best candidates by simulated Sharpe.")
+
+            def draw_batch():
+                fig_batch, ax_batch = plt.subplots(figsize=(12, 6)); fig_batch.patch.set_facecolor(COLORS['bg_dark']); ax_batch.set_facecolor(COLORS['bg_panel'])
+                candidate_metrics = metrics_batch.drop(index=named_index)
+                if not candidate_metrics.empty: ax_batch.scatter(candidate_metrics['Volatilité'] * 100, candidate_metrics['Performance'] * 100, s=12, alpha=0.4, color=COLORS['text_secondary'], label='Candidates')
+                named_colors = {'Sheet Portfolio': COLORS['accent_orange'], 'Max Sharpe (SLSQP)': COLORS['success'], 'Equal Weight': COLORS['blue_bright']}
+                for name in named_index: ax_batch.scatter(metrics_batch.loc[name, 'Volatilité'] * 100, metrics_batch.loc[name, 'Performance'] * 100, s=160, color=named_colors.get(name, COLORS['accent_yellow']), edgecolors=COLORS['text_primary'], linewidth=1.5, label=name)
+                ax_batch.set_xlabel('ANNUAL VOLATILITY (%)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_batch.set_ylabel('PERFORMANCE (NET, %)', fontsize=11, fontweight='600', color=COLORS['text_primary'], fontfamily='monospace'); ax_batch.set_title('SIMULATED ALLOCATIONS: RISK vs PERFORMANCE', fontsize=13, fontweight='700', pad=15, color=COLORS['accent_orange'], fontfamily='monospace'); ax_batch.grid(True, alpha=0.2, linestyle='--', linewidth=0.5, color=COLORS['grid']); ax_batch.tick_params(colors=COLORS['text_secondary']); ax_batch.spines['bottom'].set_color(COLORS['border']); ax_batch.spines['top'].set_color(COLORS['border']); ax_batch.spines['left'].set_color(COLORS['border']); ax_batch.spines['right'].set_color(COLORS['border'])
+                ax_batch.legend(loc='best', frameon=True, facecolor=COLORS['bg_panel'], edgecolor=COLORS['border'], fontsize=9, labelcolor=COLORS['text_primary']); fig_batch.tight_layout()
+                return fig_batch
+            show_chart(('batch', data_version, cov_method, n_candidates), draw_batch)
+        else: st.warning("Batch simulation unavailable (no data since simulation start).")
+    else: st.warning("Batch comparison unavailable (optimization universe missing).")
+
+for tab, render_tab in ((tab1, monitor_tab), (tab2, holdings_tab), (tab3, analytics_tab), (tab4, optimization_tab)):
+    with tab:
+        if tab.open: render_tab()
+
 # --- Footer Bloomberg Style ---
 st.markdown("---")
 col1, col2, col3 = st.columns(3)
@@ -0,0 +1,1761 @@
+"""Moteur de calcul du terminal M2 MBFA, sans dépendance à l'interface Streamlit.
+
+Chargement du classeur, traitement des prix, indicateurs, optimisation, poids actifs et simulations.
+Les messages destinés à l'utilisateur sont émis comme avertissements EngineMessage (voir run_pipeline).
+
+Précalcul en ligne de commande (à planifier, ex. cron):
+    python engine.py precompute [--source URL_OU_FICHIER] [--snapshot-dir DOSSIER] [--frontier] [--covariance METHODE]
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import io
+import multiprocessing
+import os
+import shutil
+import sys
+import types
+import urllib.request
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# --- Import de Scipy pour l'optimisation et la classification hiérarchique (optionnel) ---
+try:
+    import scipy.optimize as sco
+    import scipy.cluster.hierarchy as sch
+    from scipy.spatial.distance import squareform
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+# Pyarrow (optionnel) pour les snapshots Parquet; repli sur pickle sinon
+try:
+    import pyarrow # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# --- Constantes (Mises à jour avec les règles du mandat) ---
+EXCEL_URL = os.environ.get("DASHBOARD_EXCEL_URL", "https://docs.google.com/spreadsheets/d/1VqgRMRJJ3DaCYKJ1OT77LFn9ExUUifO7x3Zzqq6fmwQ/export?format=xlsx") # URL ou fichier local
+WORKBOOK_FETCH_TIMEOUT = 30 # secondes
+SNAPSHOT_DIR = os.environ.get("DASHBOARD_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshots"))
+SNAPSHOT_FRAMES = ('benchmark', 'prices', 'portfolio') # Ordre = retour de load_data()
+PROCESSED_FRAMES = ('prices_hist', 'returns') # Ordre = retour de process_prices()
+EUR_FRAMES = ('prices_eur', 'returns_eur') # Ordre = retour de convert_to_eur()
+SNAPSHOT_KEEP = 5 # Nombre de snapshots conservés sur disque
+RESULTS_MAX_AGE = int(os.environ.get("DASHBOARD_RESULTS_MAX_AGE", 3600)) # Âge max (s) des résultats précalculés lus par l'interface
+MANAGEMENT_FEE_ANNUAL = 0.01 # 1% [Source: PDF page 3]
+CASH_RATE_ANNUAL = 0.015 # 1.5% [Source: PDF page 3]
+TRANSACTION_FEE_RATE = 0.001 # 0.10% [Source: PDF page 3]
+RISK_FREE_RATE_ANNUAL = 0.015 # Supposons égal au taux cash pour Sharpe
+TRADING_DAYS = 252 # Pour annualisation du risque (Vol, Sharpe, TE)
+CALENDAR_DAYS = 365 # Pour annualisation/journalisation des frais et taux cash
+BENCHMARK_WEIGHTS = {'Action': 0.60, 'Gov bond': 0.20, 'Commodities': 0.15, 'Cash': 0.05} # [Source: PDF page 2]
+START_DATE_SIMULATION = pd.to_datetime('2025-10-06') # [Source: PDF page 4]
+INITIAL_NAV_EUR = 100_000_000 # 100M € [Source: PDF page 1]
+CASH_TICKER_NAME = "CASH EUR" # [Source: PDF page 2]
+BASE_CURRENCY = 'EUR'
+FX_TICKERS = {'USD': 'EURUSD Curncy'} # Fixing par devise, coté en devise pour 1 EUR: prix EUR = prix local / fixing
+CLASS_CURRENCIES = {'Commodities': 'USD'} # Devise par défaut par classe d'actif (colonne 'Currency' du Benchmark prioritaire)
+ASSET_WEIGHT_LIMIT = 0.10 # Limite de 10% par actif
+FRONTIER_POINTS = 25 # Points de la frontière efficiente
+FRONTIER_MAX_WORKERS = 4 # Processus pour les solves de la frontière
+COVARIANCE_METHOD = os.environ.get("DASHBOARD_COVARIANCE_METHOD", "sample") # Estimateur par défaut (voir COVARIANCE_METHODS)
+EWMA_LAMBDA = 0.94 # Décroissance journalière EWMA (RiskMetrics)
+FACTOR_COUNT = 5 # Nombre de facteurs PCA du modèle factoriel
+ROLLING_WINDOWS = (20, 60, 120, 252) # Fenêtres glissantes proposées (jours de bourse)
+ROLLING_WINDOW_DEFAULT = 60 # Fenêtre précalculée par le pipeline
+ROLLING_METRICS = ('Volatilité', 'Sharpe', 'Beta', 'Correlation', 'Tracking Error')
+REBALANCE_PERIODS = {'Weekly': 5, 'Monthly': 21, 'Quarterly': 63, 'Semi-Annual': 126, 'Annual': 252} # Jours de bourse
+REBALANCE_THRESHOLDS = (0.01, 0.02, 0.03, 0.05) # Écarts absolus de poids déclenchant un rebalancement
+WALK_FORWARD_LOOKBACKS = {'Rolling 6M': 126, 'Rolling 1Y': 252, 'Rolling 2Y': 504, 'Expanding': None} # Fenêtres d'estimation (jours de bourse, None = croissante)
+WALK_FORWARD_MIN_HISTORY = 126 # Historique minimal avant la première estimation en fenêtre croissante
+WALK_FORWARD_MAX_WORKERS = 4 # Processus pour les solves du walk-forward
+PERIOD_WINDOWS = ('1W', '1M', 'YTD', 'SINCE INCEPTION') # Périodes des panneaux de performance (MONITOR)
+CORRELATION_CLUSTERS = 6 # Groupes par défaut de la vue corrélation classifiée
+ATTRIBUTION_EFFECTS = ('Allocation', 'Selection', 'Interaction') # Effets Brinson-Fachler
+MC_PATHS = 100_000 # Trajectoires Monte Carlo par défaut
+MC_CHUNK_SIZE = 20_000 # Trajectoires simulées par bloc (borne la mémoire)
+MC_HORIZONS = (1, 10, 20) # Horizons VaR (jours de bourse)
+MC_CONFIDENCE = 0.99
+MC_MAX_WORKERS = 4 # Processus pour les blocs Monte Carlo
+MC_DISTRIBUTION_BINS = 200; MC_DISTRIBUTION_RANGE = 0.5 # Histogramme de la performance finale sur [-50%, +50%]
+BOOTSTRAP_RESAMPLES = 5_000 # Tirages du bootstrap des indicateurs de simulation
+BOOTSTRAP_CHUNK_SIZE = 1_000 # Tirages par bloc (un bloc = une tâche du pool)
+BOOTSTRAP_BLOCK_LENGTH = 5 # Longueur moyenne des blocs (jours de bourse) du bootstrap stationnaire
+BOOTSTRAP_CONFIDENCE = 0.90
+BOOTSTRAP_MAX_WORKERS = 1 # Processus pour les blocs de tirages (mesuré sur 5000 tirages: 4 processus pas plus rapides qu'un seul)
+BOOTSTRAP_METRICS = (('Portfolio', 'Volatilité'), ('Portfolio', 'Sharpe'), ('Portfolio', 'VaR 99%'), # (série, indicateur) dans l'ordre de simulation_statistics
+                     ('Benchmark', 'Volatilité'), ('Benchmark', 'Sharpe'), ('Benchmark', 'VaR 99%'), ('Active', 'Tracking Error'))
+TE_WINDOW = 60 # Fenêtre (jours de bourse) de la TE glissante de la simulation
+COVARIANCE_METHODS = {'sample': 'Sample', 'ledoit_wolf': 'Ledoit-Wolf Shrinkage', 'ewma': f'EWMA (lambda={EWMA_LAMBDA})', 'factor': f'Factor Model ({FACTOR_COUNT} PCA factors)'}
+
+# --- Messages utilisateur (sans UI) ---
+class EngineMessage(UserWarning):
+    """Avertissement destiné à l'utilisateur, relayé par l'interface ou la CLI."""
+    level = 'warning'
+
+class EngineError(EngineMessage):
+    """Erreur destinée à l'utilisateur (le calcul concerné retourne None)."""
+    level = 'error'
+
+def notify(message):
+    """Signale une erreur utilisateur."""
+    warnings.warn(message, EngineError, stacklevel=2)
+
+def notify_warning(message):
+    """Signale un avertissement utilisateur."""
+    warnings.warn(message, EngineMessage, stacklevel=2)
+
+# --- Fonctions Utilitaires ---
+
+def calculate_daily_rates():
+    """Calcule les taux journaliers en base 365."""
+    cash_daily = (1 + CASH_RATE_ANNUAL) ** (1/CALENDAR_DAYS) - 1
+    rf_daily = (1 + RISK_FREE_RATE_ANNUAL) ** (1/TRADING_DAYS) - 1
+    mgmt_fee_daily = MANAGEMENT_FEE_ANNUAL / CALENDAR_DAYS
+    return cash_daily, rf_daily, mgmt_fee_daily
+
+def parallel_map(fn, args, workers=1, consume=None):
+    """Applique fn(*a) à chaque tuple de args, dans l'ordre. Avec workers > 1: pool de processus en forkserver/spawn (jamais de fork
+    du serveur Streamlit multi-thread); fn doit être importable par les processus (une fonction du script Streamlit, module __main__,
+    reste séquentielle). Le module __main__ (script Streamlit ou CLI) est masqué pendant le démarrage: les processus n'importent que
+    le module de fn. Repli séquentiel seulement si le pool ne démarre pas ou casse, et seulement pour les tâches restantes;
+    les exceptions levées par fn sont propagées. consume: appelé sur chaque résultat (retour None), sinon retourne la liste des résultats."""
+    results = []; handle = consume or results.append; done = 0
+    workers = max(1, min(workers, os.cpu_count() or 1, len(args)))
+    if workers > 1 and getattr(fn, '__module__', '__main__') != '__main__':
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        try: pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        except (OSError, ValueError): pool = None # Pool indisponible (sémaphores, processus): repli séquentiel
+        if pool is not None:
+            with pool:
+                main = sys.modules['__main__']; sys.modules['__main__'] = types.ModuleType('__main__') # Sinon chaque processus ré-exécute le script
+                try: outputs = pool.map(fn, *zip(*args))
+                except (OSError, concurrent.futures.BrokenExecutor): outputs = () # Échec au démarrage des processus
+                finally: sys.modules['__main__'] = main
+                try:
+                    for output in outputs: handle(output); done += 1
+                except concurrent.futures.BrokenExecutor: pass # Processus tué en cours de route: le reste est calculé ici
+    for task in args[done:]: handle(fn(*task))
+    return None if consume else results
+
+def get_tickers_by_class(benchmark_df, available_columns):
+    """Retourne les tickers par classe d'actif."""
+    if 'BBG Ticker' not in benchmark_df.columns or 'Asset Class' not in benchmark_df.columns:
+        notify("Colonnes 'BBG Ticker' ou 'Asset Class' manquantes dans 'Benchmark'.")
+        return {'action': [], 'bond': [], 'commodity': []}
+    asset_class_map = pd.Series(benchmark_df['Asset Class'].to_numpy(), index=benchmark_df['BBG Ticker'].astype(str).str.strip()) # benchmark_df non modifié (partagé)
+    available_columns_str = [str(col).strip() for col in available_columns]
+    return {
+        'action': [t for t in asset_class_map[asset_class_map == 'Action'].index if t in available_columns_str],
+        'bond': [t for t in asset_class_map[asset_class_map == 'Gov bond'].index if t in available_columns_str],
+        'commodity': [t for t in asset_class_map[asset_class_map == 'Commodities'].index if t in available_columns_str]
+    }
+
+def benchmark_composition(benchmark_df, available_columns):
+    """Poids théoriques du benchmark par ticker: poids de la classe réparti également entre ses tickers disponibles."""
+    composition = {}
+    tickers_by_class = get_tickers_by_class(benchmark_df, available_columns)
+    for class_name, weight_total in BENCHMARK_WEIGHTS.items():
+         if class_name.lower() == 'cash':
+             composition[CASH_TICKER_NAME] = weight_total
+         else:
+             class_key = 'action' if class_name == 'Action' else \
+                         'bond' if class_name == 'Gov bond' else \
+                         'commodity' if class_name == 'Commodities' else None
+             if class_key and tickers_by_class.get(class_key):
+                 weight_per_asset = weight_total / len(tickers_by_class[class_key])
+                 for ticker in tickers_by_class[class_key]:
+                     composition[ticker] = weight_per_asset
+    return pd.Series(composition, name="Benchmark Weight", dtype=float)
+
+def calculate_indicators(returns, rf_daily_for_sharpe):
+    """Calcule volatilité (annu TRADING_DAYS), Sharpe (annu TRADING_DAYS) et VaR."""
+    if returns is None or returns.empty or len(returns) < 2: return {'Volatilité': np.nan, 'Sharpe': np.nan, 'VaR 99%': np.nan}
+    vol = returns.std() * np.sqrt(TRADING_DAYS)
+    var = returns.quantile(0.01); sharpe = np.nan
+    std_dev = returns.std()
+    if std_dev != 0 and np.isfinite(std_dev):
+        excess = returns - rf_daily_for_sharpe
+        sharpe = (excess.mean() / std_dev) * np.sqrt(TRADING_DAYS)
+    return {'Volatilité': vol, 'Sharpe': sharpe, 'VaR 99%': var}
+
+def calculate_indicators_matrix(returns_df, bench_returns, rf_daily_for_sharpe):
+    """Vol, Sharpe, VaR 99%, beta et corrélation vs benchmark pour tous les tickers en une passe (NaN masqués par colonne).
+    Beta = cov/var et corrélation calculés sur les dates où le ticker a un rendement."""
+    Y = returns_df.to_numpy(dtype=float); x = bench_returns.reindex(returns_df.index).to_numpy(dtype=float)[:, None]
+    mask = ~np.isnan(Y); n_obs = mask.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_y = np.where(mask, Y, 0.0).sum(axis=0) / n_obs
+        mean_x = np.where(mask, x, 0.0).sum(axis=0) / n_obs
+        dev_y = np.where(mask, Y - mean_y, 0.0); dev_x = np.where(mask, x - mean_x, 0.0)
+        ss_y = (dev_y ** 2).sum(axis=0); ss_x = (dev_x ** 2).sum(axis=0); s_xy = (dev_x * dev_y).sum(axis=0)
+        std = np.sqrt(ss_y / (n_obs - 1))
+        sharpe = np.where((std != 0) & np.isfinite(std), (mean_y - rf_daily_for_sharpe) / std * np.sqrt(TRADING_DAYS), np.nan)
+        finite = np.isfinite(np.where(mask, Y, 0.0)).all(axis=0) & np.isfinite(np.where(mask, x, 0.0)).all(axis=0)
+        beta = np.where(finite & (ss_x != 0), s_xy / ss_x, np.nan)
+        corr = np.where(finite & (ss_x != 0) & (ss_y != 0), s_xy / np.sqrt(ss_x * ss_y), np.nan)
+        with warnings.catch_warnings(): warnings.simplefilter("ignore"); var = np.nanquantile(Y, 0.01, axis=0) if Y.size else np.full(Y.shape[1], np.nan)
+    std = np.where(n_obs >= 2, std, np.nan)
+    return pd.DataFrame({'Volatilité': std * np.sqrt(TRADING_DAYS), 'Sharpe': np.where(n_obs >= 2, sharpe, np.nan), 'VaR 99%': np.where(n_obs >= 2, var, np.nan),
+                         'Beta': beta, 'Correlation': corr, 'Observations': n_obs}, index=returns_df.columns)
+
+def calculate_benchmark_returns(returns_period, tickers, cash_daily_rate):
+    """Calcule les rendements BRUTS quotidiens du benchmark."""
+    returns_by_class = {
+        'Action': returns_period[tickers['action']].mean(axis=1) if tickers['action'] else pd.Series(0, index=returns_period.index),
+        'Gov bond': returns_period[tickers['bond']].mean(axis=1) if tickers['bond'] else pd.Series(0, index=returns_period.index),
+        'Commodities': returns_period[tickers['commodity']].mean(axis=1) if tickers['commodity'] else pd.Series(0, index=returns_period.index),
+        'Cash': pd.Series(cash_daily_rate, index=returns_period.index)
+    }
+    common_index = returns_period.index; weighted_sum = pd.Series(0.0, index=common_index)
+    for k, weight in BENCHMARK_WEIGHTS.items():
+         if k in returns_by_class and not returns_by_class[k].empty: weighted_sum = weighted_sum.add(returns_by_class[k].reindex(common_index).fillna(0) * weight, fill_value=0)
+    return weighted_sum
+
+def calculate_drawdowns(levels_df):
+    """Drawdowns de toutes les colonnes d'une matrice de niveaux (prix ou NAV, jours x colonnes) en une passe vectorisée.
+    Retourne (drawdown quotidien = niveau / plus-haut courant - 1, résumé par colonne): Max Drawdown, dates du pic, du creux et du retour
+    au pic, Drawdown Duration (plus longue période sous un plus-haut, jours de bourse) et Time to Recovery (creux -> pic, NaN si non revenu)."""
+    P = levels_df.ffill().to_numpy(dtype=float); steps = np.arange(len(P))[:, None]; cols = np.arange(P.shape[1])
+    with np.errstate(divide='ignore', invalid='ignore'): drawdown = P / np.fmax.accumulate(P, axis=0) - 1.0
+    at_peak = drawdown >= 0 # NaN (avant le premier prix) -> False
+    last_peak = np.maximum.accumulate(np.where(at_peak, steps, -1), axis=0)
+    trough = np.argmin(np.nan_to_num(drawdown, nan=0.0), axis=0); max_dd = np.nan_to_num(drawdown, nan=0.0)[trough, cols]
+    peak = np.where(max_dd < 0, last_peak[trough, cols], trough)
+    recovery_mask = (steps > trough) & at_peak; recovered = recovery_mask.any(axis=0) | (max_dd >= 0)
+    recovery = np.where(max_dd < 0, recovery_mask.argmax(axis=0), trough)
+    has_data = at_peak.any(axis=0); dates = pd.Series(levels_df.index)
+    summary = pd.DataFrame({'Max Drawdown': np.where(has_data, max_dd, np.nan),
+                            'Peak Date': dates.iloc[peak].where(has_data).to_numpy(), 'Trough Date': dates.iloc[trough].where(has_data).to_numpy(),
+                            'Recovery Date': dates.iloc[recovery].where(has_data & recovered).to_numpy(),
+                            'Drawdown Duration (days)': np.where(has_data, np.where(last_peak >= 0, steps - last_peak, 0).max(axis=0), np.nan),
+                            'Time to Recovery (days)': np.where(has_data & recovered, recovery - trough, np.nan)}, index=levels_df.columns)
+    return pd.DataFrame(drawdown, index=levels_df.index, columns=levels_df.columns), summary
+
+# --- Classification hiérarchique des corrélations ---
+def cluster_correlation(corr_matrix, n_clusters=CORRELATION_CLUSTERS):
+    """Ordre d'affichage et groupes des actifs par classification hiérarchique (lien moyen sur la distance sqrt((1 - rho) / 2),
+    ordre optimal des feuilles). Retourne (tickers ordonnés, Series ticker -> groupe numéroté 1..k dans l'ordre d'affichage).
+    Sans Scipy: ordre de la première composante principale et un seul groupe."""
+    C = np.nan_to_num(corr_matrix.to_numpy(dtype=float), nan=0.0); np.fill_diagonal(C, 1.0); n = len(C)
+    if SCIPY_AVAILABLE and n >= 3:
+        D = np.sqrt(np.clip((1.0 - C) / 2.0, 0.0, 1.0)); np.fill_diagonal(D, 0.0)
+        Z = sch.linkage(squareform((D + D.T) / 2.0, checks=False), method='average', optimal_ordering=True)
+        order, labels = sch.leaves_list(Z), sch.fcluster(Z, t=min(n_clusters, n), criterion='maxclust')
+    else: order, labels = np.argsort(np.linalg.eigh(C)[1][:, -1]), np.ones(n, dtype=int)
+    ordered_labels = labels[order]; _, first_seen = np.unique(ordered_labels, return_index=True)
+    renumber = {label: rank + 1 for rank, label in enumerate(ordered_labels[np.sort(first_seen)])}
+    return corr_matrix.index[order], pd.Series([renumber[l] for l in ordered_labels], index=corr_matrix.index[order], name='Cluster')
+
+def cluster_summary(corr_matrix, clusters, asset_class=None):
+    """Par groupe: taille, classe d'actifs dominante, corrélation moyenne intra-groupe et vers les autres groupes, membres.
+    Sommes par blocs M' C M (M = appartenance one-hot): une seule passe sur la matrice."""
+    C = np.nan_to_num(corr_matrix.loc[clusters.index, clusters.index].to_numpy(dtype=float), nan=0.0)
+    M = pd.get_dummies(clusters).to_numpy(dtype=float); sizes = M.sum(axis=0); n = len(clusters)
+    block = M.T @ C @ M; within = np.diag(block)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_within = np.where(sizes > 1, (within - sizes) / (sizes * (sizes - 1)), np.nan)
+        avg_between = np.where(n > sizes, (block.sum(axis=1) - within) / (sizes * (n - sizes)), np.nan)
+    groups = clusters.groupby(clusters)
+    summary = pd.DataFrame({'Assets': sizes.astype(int), 'Avg Corr (Within)': avg_within, 'Avg Corr (Other Clusters)': avg_between,
+                            'Members': [', '.join(members.index) for _, members in groups]}, index=pd.Index(sorted(clusters.unique()), name='Cluster'))
+    if asset_class is not None:
+        summary.insert(1, 'Main Asset Class', [asset_class.reindex(members.index).fillna('N/A').value_counts().index[0] for _, members in groups])
+    return summary
+
+# --- Fonctions de Chargement ---
+def fetch_workbook_bytes(source):
+    """Télécharge le classeur une seule fois (URL http(s) ou fichier local)."""
+    if str(source).lower().startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=WORKBOOK_FETCH_TIMEOUT) as response: return response.read()
+    with open(source, 'rb') as f: return f.read()
+
+def parse_price_sheet(prices_df_raw):
+    """Convertit la feuille 'Historique Prix' brute en prix numériques indexés par date."""
+    if prices_df_raw is None: return None
+    original_cols = prices_df_raw.columns.tolist(); date_col = original_cols[0]
+    if len(prices_df_raw.index) > 1 and not pd.isna(prices_df_raw.iloc[1, 0]):
+        candidate = prices_df_raw.iloc[1, 0]
+        if isinstance(candidate, str) and 'date' in candidate.lower(): date_col = candidate; new_cols = original_cols.copy(); new_cols[0] = date_col; prices_df_raw.columns = new_cols
+    prices_df = prices_df_raw.iloc[2:].copy()
+    try: prices_df[date_col] = pd.to_datetime(prices_df[date_col]); prices_df = prices_df.set_index(date_col)
+    except Exception as e: notify(f"Date conversion error: {e}"); return None
+    prices_numeric = prices_df.apply(pd.to_numeric, errors='coerce').astype(float)
+    prices_numeric.columns = prices_numeric.columns.astype(str).str.strip(); prices_numeric.index.name = 'Date'
+    return prices_numeric
+
+def parse_workbook(content):
+    """Parse les feuilles Benchmark, Historique Prix et Portefeuille en une seule passe et les nettoie."""
+    with pd.ExcelFile(io.BytesIO(content)) as xls:
+        benchmark_df = xls.parse("Benchmark")
+        prices_df_raw = xls.parse("Historique Prix", header=3)
+        portfolio_df = xls.parse("Portefeuille", skiprows=1)
+
+    required_cols = ['BBG Ticker', 'Asset Class']
+    if not all(col in benchmark_df.columns for col in required_cols): notify(f"Colonnes manquantes dans 'Benchmark': {required_cols}"); return None, None, None
+    benchmark_df['BBG Ticker'] = benchmark_df['BBG Ticker'].astype(str).str.strip(); benchmark_df = benchmark_df.dropna(subset=['BBG Ticker'])
+
+    prices_df = parse_price_sheet(prices_df_raw)
+    if prices_df is None: return None, None, None
+
+    if len(portfolio_df.columns) < 6: notify("'Portefeuille' sheet must have >= 6 columns."); return None, None, None
+    ticker_col = portfolio_df.columns[2]; weight_col = portfolio_df.columns[5] # Col C, Col F
+    portfolio_df = portfolio_df[[ticker_col, weight_col]].copy(); portfolio_df.columns = ['BBG Ticker', 'Weight']
+    portfolio_df['BBG Ticker'] = portfolio_df['BBG Ticker'].astype(str).str.strip(); portfolio_df = portfolio_df.dropna(subset=['BBG Ticker'])
+    portfolio_df['Weight'] = pd.to_numeric(portfolio_df['Weight'], errors='coerce'); portfolio_df = portfolio_df.dropna(subset=['Weight'])
+
+    total = portfolio_df['Weight'].sum()
+    if total <= 0: notify("Sum of portfolio weights <= 0."); return None, None, None
+
+    if np.isclose(total, 100.0, atol=1.0): portfolio_df['Weight'] /= 100.0
+    elif not np.isclose(total, 1.0, atol=0.01): notify_warning(f"Sum of weights ({total:.2f}) != 1 or 100. Normalizing..."); portfolio_df['Weight'] /= total
+
+    final_sum = portfolio_df['Weight'].sum()
+    if not np.isclose(final_sum, 1.0, atol=0.01): notify(f"Weight normalization failed. Sum: {final_sum:.4f}"); return None, None, None
+
+    return benchmark_df, prices_df, portfolio_df
+
+# --- Snapshot disque (clé = hash SHA-256 du classeur) ---
+def _write_snapshot_frame(df, base_path):
+    """Écrit un DataFrame en Parquet (pickle si pyarrow absent ou types mixtes)."""
+    if PYARROW_AVAILABLE:
+        try: df.to_parquet(base_path + '.parquet.tmp'); os.replace(base_path + '.parquet.tmp', base_path + '.parquet'); return
+        except Exception:
+            if os.path.exists(base_path + '.parquet.tmp'): os.remove(base_path + '.parquet.tmp')
+    df.to_pickle(base_path + '.pkl.tmp'); os.replace(base_path + '.pkl.tmp', base_path + '.pkl')
+
+def _read_snapshot_frame(base_path):
+    """Relit un DataFrame de snapshot, quel que soit son format."""
+    if os.path.exists(base_path + '.parquet'): return pd.read_parquet(base_path + '.parquet')
+    return pd.read_pickle(base_path + '.pkl')
+
+def write_snapshot(content_hash, frames, names=SNAPSHOT_FRAMES, pointer='LATEST'):
+    """Persiste les DataFrames sous le hash donné et met à jour le pointeur (LATEST ou PROCESSED)."""
+    snapshot_dir = os.path.join(SNAPSHOT_DIR, content_hash)
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        for name, df in zip(names, frames): _write_snapshot_frame(df, os.path.join(snapshot_dir, name))
+        with open(os.path.join(SNAPSHOT_DIR, pointer + '.tmp'), 'w') as f: f.write(content_hash)
+        os.replace(os.path.join(SNAPSHOT_DIR, pointer + '.tmp'), os.path.join(SNAPSHOT_DIR, pointer))
+        # Ne garder que les SNAPSHOT_KEEP snapshots les plus récents
+        old_dirs = sorted((d for d in os.scandir(SNAPSHOT_DIR) if d.is_dir()), key=lambda d: d.stat().st_mtime, reverse=True)[SNAPSHOT_KEEP:]
+        for d in old_dirs: shutil.rmtree(d.path, ignore_errors=True)
+    except OSError: pass # Le snapshot n'est qu'un cache: un échec d'écriture ne doit pas bloquer le chargement
+
+def read_snapshot(content_hash, names=SNAPSHOT_FRAMES):
+    """Relit un snapshot par hash. Retourne None s'il est absent ou illisible."""
+    if not content_hash: return None
+    snapshot_dir = os.path.join(SNAPSHOT_DIR, content_hash)
+    if not os.path.isdir(snapshot_dir): return None
+    try: return tuple(_read_snapshot_frame(os.path.join(snapshot_dir, name)) for name in names)
+    except Exception: return None
+
+def latest_snapshot_hash(pointer='LATEST'):
+    """Hash du dernier snapshot valide (None si aucun)."""
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, pointer)) as f: return f.read().strip() or None
+    except OSError: return None
+
+def _load_last_good_snapshot(reason):
+    """Repli sur le dernier snapshot valide quand la source est injoignable ou illisible."""
+    fallback_hash = latest_snapshot_hash(); frames = read_snapshot(fallback_hash)
+    if frames is None: notify(f"Error loading data: {reason}"); return None, None, None, None
+    notify_warning(f"Source unreachable ({reason}). Using last good snapshot {fallback_hash[:12]}.")
+    return (*frames, fallback_hash)
+
+def load_data(source=None):
+    """Charge les données: un seul téléchargement, snapshot disque par hash de contenu, repli hors-ligne.
+    Retourne aussi le hash du classeur (data_version) pour les caches dérivés. source: URL ou fichier (défaut EXCEL_URL)."""
+    try: content = fetch_workbook_bytes(source or EXCEL_URL)
+    except Exception as e: return _load_last_good_snapshot(e)
+
+    content_hash = hashlib.sha256(content).hexdigest()
+    frames = read_snapshot(content_hash)
+    if frames is not None:
+        if latest_snapshot_hash() != content_hash: write_snapshot(content_hash, frames)
+        return (*frames, content_hash)
+
+    try: frames = parse_workbook(content)
+    except Exception as e: return _load_last_good_snapshot(e)
+    if any(frame is None for frame in frames): return None, None, None, None
+    write_snapshot(content_hash, frames)
+    return (*frames, content_hash)
+
+def _clean_prices_full(prices_df):
+    """Remplissage complet (ffill/bfill) et rendements sur tout l'historique."""
+    prices_clean = prices_df.copy().ffill().bfill()
+    prices_clean.columns = prices_clean.columns.astype(str).str.strip()
+    returns = prices_clean.pct_change().iloc[1:]
+    return prices_clean, returns
+
+def update_prices_incremental(prices_df, prev_prices_df, prev_hist, prev_returns):
+    """Ajoute uniquement les nouvelles dates/tickers à prices_hist/returns_all déjà calculés.
+    Retourne None si l'historique déjà traité a été révisé (recalcul complet nécessaire)."""
+    n_old = len(prev_prices_df.index)
+    if n_old < 2 or len(prices_df.index) < n_old or not prices_df.index[:n_old].equals(prev_prices_df.index): return None
+    old_cols = [c for c in prev_prices_df.columns if c in prices_df.columns]
+    if len(old_cols) != len(prev_prices_df.columns): return None # Ticker supprimé
+    if not np.array_equal(prices_df[old_cols].to_numpy()[:n_old], prev_prices_df[old_cols].to_numpy(), equal_nan=True): return None
+
+    # Tickers entièrement vides dans l'ancien historique: le bfill peut changer tout leur passé -> recalcul par colonne
+    recompute_cols = [c for c in prices_df.columns if c not in old_cols] + [c for c in old_cols if prev_hist[c].isna().all()]
+    tail_cols = [c for c in old_cols if c not in recompute_cols]
+
+    # Queue: dernière ligne déjà remplie + nouvelles lignes brutes -> ffill et rendements sur O(nouvelles lignes)
+    new_rows = prices_df[tail_cols].iloc[n_old:]
+    tail = pd.concat([prev_hist[tail_cols].iloc[[-1]], new_rows]).ffill()
+    prices_hist = pd.concat([prev_hist[tail_cols], tail.iloc[1:]]) if not new_rows.empty else prev_hist[tail_cols]
+    returns = pd.concat([prev_returns[tail_cols], tail.pct_change().iloc[1:]]) if not new_rows.empty else prev_returns[tail_cols]
+
+    if recompute_cols:
+        hist_new_cols, returns_new_cols = _clean_prices_full(prices_df[recompute_cols])
+        prices_hist = pd.concat([prices_hist, hist_new_cols], axis=1); returns = pd.concat([returns, returns_new_cols], axis=1)
+    return prices_hist[list(prices_df.columns)], returns[list(prices_df.columns)]
+
+def process_prices(prices_df, data_version=None):
+    """Traite les données de prix (remplissage des trous et rendements).
+    Avec data_version, réutilise l'état traité sur disque et n'ajoute que les nouvelles lignes depuis le dernier snapshot."""
+    if prices_df is None: return None, None
+    if data_version is None: return _clean_prices_full(prices_df)
+
+    processed = read_snapshot(data_version, PROCESSED_FRAMES)
+    if processed is not None: return processed
+
+    result = None; prev_version = latest_snapshot_hash('PROCESSED')
+    if prev_version and prev_version != data_version:
+        prev_raw = read_snapshot(prev_version, ('prices',)); prev_processed = read_snapshot(prev_version, PROCESSED_FRAMES)
+        if prev_raw is not None and prev_processed is not None:
+            result = update_prices_incremental(prices_df, prev_raw[0], *prev_processed)
+    if result is None: result = _clean_prices_full(prices_df)
+    write_snapshot(data_version, result, PROCESSED_FRAMES, pointer='PROCESSED')
+    return result
+
+# --- Conversion EUR (devise détectée par ticker, fixings sur tout l'historique) ---
+def detect_currencies(benchmark_df, columns):
+    """Devise de cotation de chaque colonne de prix: colonne 'Currency' du Benchmark si renseignée,
+    sinon devise de la classe d'actif (CLASS_CURRENCIES), sinon BASE_CURRENCY (fixings et tickers hors benchmark inclus)."""
+    tickers = benchmark_df['BBG Ticker'].astype(str).str.strip()
+    by_class = pd.Series(benchmark_df['Asset Class'].map(CLASS_CURRENCIES).to_numpy(), index=tickers)
+    if 'Currency' in benchmark_df.columns:
+        explicit = pd.Series(benchmark_df['Currency'].astype(str).str.strip().str.upper().to_numpy(), index=tickers)
+        by_class = explicit.where(benchmark_df['Currency'].notna().to_numpy(), by_class)
+    by_class = by_class[~by_class.index.duplicated()]
+    currencies = pd.Series(columns, index=columns).map(by_class).fillna(BASE_CURRENCY)
+    currencies[currencies.index.isin(FX_TICKERS.values())] = BASE_CURRENCY
+    return currencies.rename('Currency')
+
+def convert_prices_to_eur(prices_hist, currencies):
+    """Convertit toute la matrice de prix en EUR en un seul broadcast: chaque colonne est divisée par la colonne de fixing de sa devise
+    (EURUSD = USD pour 1 EUR, donc prix EUR = prix USD / EURUSD).
+    Devise sans fixing disponible (ou fixing manquant): prix laissé en devise locale, avec un avertissement."""
+    fx_cols = [t for t in dict.fromkeys(FX_TICKERS.values()) if t in prices_hist.columns]
+    fx_matrix = np.column_stack([np.ones(len(prices_hist))] + [prices_hist[t].to_numpy(dtype=float) for t in fx_cols])
+    fx_matrix = np.where(np.isfinite(fx_matrix) & (fx_matrix != 0), fx_matrix, 1.0)
+    fx_pos = {cur: fx_cols.index(t) + 1 for cur, t in FX_TICKERS.items() if t in fx_cols}
+    foreign = currencies[currencies != BASE_CURRENCY]
+    missing = sorted(set(foreign) - set(fx_pos))
+    if missing: notify_warning(f"No FX fixing for {', '.join(missing)}: {int(foreign.isin(missing).sum())} tickers kept in local currency.")
+    col_fx = currencies.reindex(prices_hist.columns).map(fx_pos).fillna(0).to_numpy(dtype=int)
+    return pd.DataFrame(prices_hist.to_numpy(dtype=float) / fx_matrix[:, col_fx], index=prices_hist.index, columns=prices_hist.columns)
+
+def convert_to_eur(prices_hist, benchmark_df, data_version=None):
+    """Prix et rendements en EUR sur tout l'historique (matrice unique pour risque, NAV et optimisation).
+    Avec data_version, relit/écrit les matrices EUR dans le snapshot de la version."""
+    if prices_hist is None or benchmark_df is None: return None, None
+    cached = read_snapshot(data_version, EUR_FRAMES) if data_version else None
+    if cached is not None: return cached
+    prices_eur = convert_prices_to_eur(prices_hist, detect_currencies(benchmark_df, prices_hist.columns))
+    result = (prices_eur, prices_eur.pct_change().iloc[1:])
+    if data_version: write_snapshot(data_version, result, EUR_FRAMES, pointer='EUR')
+    return result
+
+# --- Estimateurs de covariance (échantillon, Ledoit-Wolf, EWMA, modèle factoriel) ---
+class FactorCovariance:
+    """Covariance factorielle S = L L' + diag(d): chargements L (n x k) et variances spécifiques d (n).
+    Le produit S @ w coûte O(nk) sans jamais matérialiser la matrice n x n."""
+    def __init__(self, loadings, specific_var, index):
+        self.loadings = loadings; self.specific_var = specific_var
+        self.index = self.columns = pd.Index(index)
+
+    def __matmul__(self, other):
+        other = np.asarray(other, dtype=float)
+        specific = self.specific_var if other.ndim == 1 else self.specific_var[:, None]
+        return self.loadings @ (self.loadings.T @ other) + specific * other
+
+    def __len__(self): return len(self.index)
+
+    def diagonal(self):
+        """Variances totales par actif."""
+        return (self.loadings ** 2).sum(axis=1) + self.specific_var
+
+    def to_frame(self):
+        """Matrice dense n x n (affichage/export uniquement)."""
+        return pd.DataFrame(self.loadings @ self.loadings.T + np.diag(self.specific_var), index=self.index, columns=self.columns)
+
+def covariance_operator(cov_matrix):
+    """Objet supportant 'S @ w' pour les optimiseurs: tableau NumPy dense ou modèle factoriel tel quel."""
+    return cov_matrix if isinstance(cov_matrix, FactorCovariance) else np.asarray(cov_matrix, dtype=float)
+
+def covariance_frame(cov_matrix):
+    """Covariance sous forme de DataFrame dense, quel que soit l'estimateur."""
+    return cov_matrix.to_frame() if isinstance(cov_matrix, FactorCovariance) else cov_matrix
+
+def _ledoit_wolf(X):
+    """Shrinkage Ledoit-Wolf (2004) vers l'identité mise à l'échelle; X déjà centré (T x n)."""
+    n_obs, n_assets = X.shape
+    S = X.T @ X / n_obs; mu = np.trace(S) / n_assets
+    delta = ((S - mu * np.eye(n_assets)) ** 2).sum() / n_assets
+    X2 = X ** 2
+    beta = min(((X2.T @ X2) / n_obs - S ** 2).sum() / (n_assets * n_obs), delta)
+    shrinkage = beta / delta if delta > 0 else 1.0
+    return shrinkage * mu * np.eye(n_assets) + (1.0 - shrinkage) * S
+
+def _ewma_covariance(X, lam=EWMA_LAMBDA):
+    """Covariance pondérée exponentiellement (RiskMetrics), poids lam^(T-1-t) normalisés."""
+    weights = lam ** np.arange(len(X) - 1, -1, -1); weights /= weights.sum()
+    X = X - weights @ X
+    return (X * weights[:, None]).T @ X
+
+def _factor_model(X, n_factors=FACTOR_COUNT):
+    """Modèle factoriel PCA via SVD des rendements centrés (sans former X'X): chargements et variances spécifiques."""
+    X = X - X.mean(axis=0)
+    _, singular, vt = np.linalg.svd(X / np.sqrt(max(len(X) - 1, 1)), full_matrices=False)
+    k = max(1, min(n_factors, len(singular)))
+    loadings = vt[:k].T * singular[:k]
+    specific_var = np.maximum((X ** 2).sum(axis=0) / max(len(X) - 1, 1) - (loadings ** 2).sum(axis=1), 1e-12)
+    return loadings, specific_var
+
+def estimate_covariance(returns_df, method=COVARIANCE_METHOD):
+    """Covariance des rendements selon 'method' (voir COVARIANCE_METHODS).
+    Les colonnes à variance nulle (CASH EUR) sont exclues de l'estimation et gardent une variance exactement nulle.
+    'factor' retourne un FactorCovariance, les autres méthodes un DataFrame."""
+    if method not in COVARIANCE_METHODS: raise ValueError(f"Unknown covariance method '{method}'. Choose from {list(COVARIANCE_METHODS)}.")
+    if method == 'sample': return returns_df.cov()
+    X = returns_df.fillna(returns_df.mean()).to_numpy(dtype=float)
+    active = np.ptp(X, axis=0) > 0; X_active = X[:, active]; n_assets = X.shape[1]
+    if method == 'factor':
+        loadings = np.zeros((n_assets, min(FACTOR_COUNT, max(1, X_active.shape[1])))); specific_var = np.zeros(n_assets)
+        if active.any():
+            active_loadings, specific_var[active] = _factor_model(X_active)
+            loadings = np.zeros((n_assets, active_loadings.shape[1])); loadings[active] = active_loadings
+        return FactorCovariance(loadings, specific_var, returns_df.columns)
+    cov = np.zeros((n_assets, n_assets))
+    if active.any():
+        cov[np.ix_(active, active)] = _ledoit_wolf(X_active - X_active.mean(axis=0)) if method == 'ledoit_wolf' else _ewma_covariance(X_active)
+    return pd.DataFrame(cov, index=returns_df.columns, columns=returns_df.columns)
+
+# --- Optimiseur Max Sharpe (gradient analytique, warm start) ---
+def negative_sharpe_ratio(weights, mu, S, rf):
+    """-Sharpe journalier et son gradient analytique (mu, S: tableaux NumPy)."""
+    S_w = S @ weights
+    portfolio_volatility = np.sqrt(weights @ S_w)
+    if portfolio_volatility == 0: return 0.0, np.zeros_like(weights) # Éviter division par zéro
+    excess_return = weights @ mu - rf
+    gradient = -(mu / portfolio_volatility - excess_return * S_w / portfolio_volatility ** 3)
+    return -excess_return / portfolio_volatility, gradient
+
+def optimize_max_sharpe(mu, S, rf, cap=ASSET_WEIGHT_LIMIT, init_guess=None):
+    """SLSQP max Sharpe sous 0 <= w <= cap et somme = 1, avec jacobiens analytiques."""
+    num_assets = len(mu)
+    if init_guess is None:
+        # Guess initial: équipondéré (plafonné), renormalisé pour sommer à 1
+        init_guess = np.full(num_assets, min(1.0 / num_assets, cap)); init_guess /= init_guess.sum()
+    constraints = ({'type': 'eq', 'fun': lambda w: np.sum(w) - 1, 'jac': lambda w: np.ones_like(w)},)
+    bounds = tuple((0.0, cap) for _ in range(num_assets))
+    return sco.minimize(negative_sharpe_ratio, init_guess, args=(mu, S, rf), jac=True, method='SLSQP',
+                        bounds=bounds, constraints=constraints, options={'disp': False, 'ftol': 1e-9, 'maxiter': 500})
+
+def warm_start_weights(assets, data_version, cap=ASSET_WEIGHT_LIMIT):
+    """Poids optimaux de la version de données précédente réalignés sur 'assets' (None si indisponible)."""
+    prev_version = latest_snapshot_hash('OPTIMIZED')
+    previous = read_snapshot(prev_version, ('optimal_weights',)) if prev_version else None
+    if previous is None: return None
+    guess = previous[0]['Weight'].reindex([str(a) for a in assets]).fillna(0.0).clip(0.0, cap).to_numpy(dtype=float)
+    if guess.sum() < 0.5: return None # Univers trop différent: repartir de l'équipondéré
+    return guess / guess.sum()
+
+# --- Frontière efficiente (min-variance sous rendement cible, solves parallèles) ---
+def _portfolio_variance(weights, S):
+    """Variance journalière et son gradient."""
+    S_w = S @ weights
+    return weights @ S_w, 2.0 * S_w
+
+def optimize_min_variance(mu, S, target_return=None, cap=ASSET_WEIGHT_LIMIT, init_guess=None):
+    """SLSQP min w'Sw sous somme = 1, 0 <= w <= cap et, si donné, w'mu = target_return."""
+    num_assets = len(mu)
+    if init_guess is None: init_guess = np.full(num_assets, min(1.0 / num_assets, cap)); init_guess /= init_guess.sum()
+    constraints = [{'type': 'eq', 'fun': lambda w: np.sum(w) - 1, 'jac': lambda w: np.ones_like(w)}]
+    if target_return is not None: constraints.append({'type': 'eq', 'fun': lambda w: w @ mu - target_return, 'jac': lambda w: mu})
+    return sco.minimize(_portfolio_variance, init_guess, args=(S,), jac=True, method='SLSQP', bounds=tuple((0.0, cap) for _ in range(num_assets)),
+                        constraints=constraints, options={'disp': False, 'ftol': 1e-12, 'maxiter': 500})
+
+def _solve_frontier_chunk(mu, S, targets, cap, init_guess):
+    """Résout une suite de cibles voisines en réutilisant chaque solution comme point de départ de la suivante."""
+    solutions = []; guess = init_guess
+    for target in targets:
+        result = optimize_min_variance(mu, S, target, cap, guess)
+        solutions.append(result.x if result.success else np.full(len(mu), np.nan))
+        if result.success: guess = result.x
+    return solutions
+
+def max_capped_return(mu, cap=ASSET_WEIGHT_LIMIT):
+    """Rendement maximal atteignable sous 0 <= w <= cap et somme = 1 (remplissage glouton des meilleurs actifs)."""
+    weights = np.zeros(len(mu)); remaining = 1.0
+    for i in np.argsort(mu)[::-1]:
+        weights[i] = min(cap, remaining); remaining -= weights[i]
+        if remaining <= 0: break
+    return weights @ mu
+
+def compute_efficient_frontier(mean_returns, cov_matrix, cap=ASSET_WEIGHT_LIMIT, n_points=FRONTIER_POINTS):
+    """Frontière efficiente sur une grille de rendements cibles.
+    La grille est découpée en blocs contigus résolus en parallèle (warm start entre cibles voisines dans chaque bloc)."""
+    if not SCIPY_AVAILABLE or mean_returns is None or cov_matrix is None: return None
+    mu = mean_returns.to_numpy(dtype=float); S = covariance_operator(cov_matrix)
+    if len(mu) * cap < 1: return None # Contraintes infaisables
+    min_var = optimize_min_variance(mu, S, cap=cap)
+    if not min_var.success: return None
+    targets = np.linspace(min_var.x @ mu, max_capped_return(mu, cap), n_points)
+
+    n_workers = max(1, min(FRONTIER_MAX_WORKERS, os.cpu_count() or 1, n_points))
+    chunks = [chunk for chunk in np.array_split(targets, n_workers) if len(chunk)]
+    solutions = [w for part in parallel_map(_solve_frontier_chunk, [(mu, S, chunk, cap, min_var.x) for chunk in chunks], n_workers) for w in part]
+
+    weights = pd.DataFrame(solutions, columns=mean_returns.index); W = weights.to_numpy()
+    frontier = pd.DataFrame({'Target Return': targets, 'Return (Ann.)': W @ mu * TRADING_DAYS,
+                             'Volatility (Ann.)': np.sqrt(np.sum(W * (S @ W.T).T, axis=1) * TRADING_DAYS)})
+    return frontier.join(weights).dropna().reset_index(drop=True)
+
+def portfolio_point(weights, mean_returns, cov_matrix):
+    """Rendement et volatilité annualisés d'une allocation (Series indexée par ticker) selon mu/S historiques."""
+    w = weights.groupby(level=0).sum().reindex(mean_returns.index).fillna(0.0).to_numpy(dtype=float)
+    return w @ mean_returns.to_numpy() * TRADING_DAYS, np.sqrt(w @ (covariance_operator(cov_matrix) @ w) * TRADING_DAYS)
+
+def optimization_universe(benchmark_df, returns_full):
+    """Rendements historiques de l'univers d'optimisation: actifs du benchmark + CASH EUR au taux journalier (None si vide)."""
+    tickers = get_tickers_by_class(benchmark_df, returns_full.columns)
+    all_tickers = tickers['action'] + tickers['bond'] + tickers['commodity']
+    returns_universe_opt = returns_full[[col for col in all_tickers if col in returns_full.columns]].copy()
+    if returns_universe_opt.empty: return None
+    returns_universe_opt[CASH_TICKER_NAME] = calculate_daily_rates()[0]
+    return returns_universe_opt
+
+def optimization_inputs(benchmark_df, returns_full, cov_method=COVARIANCE_METHOD):
+    """Rendements moyens et covariance (estimateur cov_method) de l'univers d'optimisation."""
+    returns_universe_opt = optimization_universe(benchmark_df, returns_full)
+    if returns_universe_opt is None: return None, None
+    return returns_universe_opt.mean(), estimate_covariance(returns_universe_opt, cov_method)
+
+def run_max_sharpe(mean_returns, cov_matrix, data_version=None):
+    """Max Sharpe sous plafond; retourne (poids non nuls, message d'erreur). Sauvegarde la solution pour le warm start suivant."""
+    if not SCIPY_AVAILABLE or mean_returns is None or cov_matrix is None: return None, None # Scipy non dispo ou données manquantes
+    try:
+        opt_result = optimize_max_sharpe(mean_returns.to_numpy(dtype=float), covariance_operator(cov_matrix), calculate_daily_rates()[1],
+                                         init_guess=warm_start_weights(mean_returns.index, data_version))
+        if not opt_result.success: return None, opt_result.message
+        # Récupérer les poids et les nettoyer (mettre les très petites valeurs à 0)
+        optimal_weights_array = opt_result.x
+        optimal_weights_array[optimal_weights_array < 1e-6] = 0 # Seuil
+        optimal_weights_array /= np.sum(optimal_weights_array) # Renormaliser
+        optimal_weights = pd.DataFrame(optimal_weights_array, index=mean_returns.index, columns=['Weight'])
+        if data_version: write_snapshot(data_version, (optimal_weights,), ('optimal_weights',), pointer='OPTIMIZED') # Point de départ du prochain refresh
+        return optimal_weights[optimal_weights['Weight'] > 1e-6], None # Filtrer les poids nuls
+    except Exception as e:
+        return None, str(e)
+
+# --- Allocateurs sous contraintes (registre: max Sharpe, min variance, ERC, max diversification, HRP) ---
+ALLOCATORS = {} # clé -> (libellé, fonction (mu, S, cap) -> poids NumPy sommant à 1 sous 0 <= w <= cap); voir register_allocator
+
+def register_allocator(key, label):
+    """Décorateur: ajoute une fonction d'allocation au registre ALLOCATORS (ordre d'enregistrement = ordre d'affichage)."""
+    def register(allocator): ALLOCATORS[key] = (label, allocator); return allocator
+    return register
+
+def project_capped_simplex(v, cap=ASSET_WEIGHT_LIMIT):
+    """Projection euclidienne exacte sur {0 <= w <= cap, somme = 1}: w = clip(v - tau, 0, cap). La somme f(tau) est linéaire par morceaux
+    et décroissante entre les points de rupture v_i - cap et v_i; f est évaluée à tous les points par sommes préfixées (O(n log n))."""
+    sorted_v = np.sort(v); prefix = np.concatenate([[0.0], np.cumsum(sorted_v)])
+    breakpoints = np.sort(np.concatenate([v - cap, v]))
+    lower, upper = np.searchsorted(sorted_v, breakpoints, 'right'), np.searchsorted(sorted_v, breakpoints + cap, 'right')
+    sums = cap * (len(v) - upper) + prefix[upper] - prefix[lower] - breakpoints * (upper - lower)
+    k = min(max(int(np.searchsorted(-sums, -1.0)), 1), len(sums) - 1)
+    span = sums[k - 1] - sums[k]
+    tau = breakpoints[k - 1] + (sums[k - 1] - 1.0) / span * (breakpoints[k] - breakpoints[k - 1]) if span > 0 else breakpoints[k]
+    return np.clip(v - tau, 0.0, cap)
+
+def _largest_eigenvalue(S, n, n_iter=100):
+    """Plus grande valeur propre de S par itération de puissance (uniquement des produits S @ v: modèle factoriel compris)."""
+    v = np.random.default_rng(0).random(n) + 0.5; eigenvalue = 0.0
+    for _ in range(n_iter):
+        Sv = S @ v; norm = np.linalg.norm(Sv)
+        if norm == 0: return 0.0
+        eigenvalue, v = v @ Sv / (v @ v), Sv / norm
+    return eigenvalue
+
+def _risky_assets(S):
+    """Masque des actifs à variance strictement positive (le cash est exclu des allocateurs fondés sur le risque)."""
+    diagonal = S.diagonal() if isinstance(S, FactorCovariance) else np.diag(S)
+    return diagonal > 1e-18
+
+def _dense(S):
+    """Covariance dense (les mises à jour par coordonnée lisent des lignes de S)."""
+    return S.to_frame().to_numpy(dtype=float) if isinstance(S, FactorCovariance) else np.asarray(S, dtype=float)
+
+def _check_capacity(n_assets, cap):
+    """Lève ValueError si n_assets actifs plafonnés à cap ne peuvent pas sommer à 1."""
+    if n_assets * cap < 1 - 1e-12: raise ValueError(f"Infeasible constraints: {n_assets} eligible assets x {cap:.0%} cap < 100%.")
+
+@register_allocator('max_sharpe', 'Max Sharpe (SLSQP)')
+def allocate_max_sharpe(mu, S, cap=ASSET_WEIGHT_LIMIT):
+    """Max Sharpe historique (optimiseur SLSQP existant, gradient analytique)."""
+    if not SCIPY_AVAILABLE: raise ValueError("Scipy not available.")
+    result = optimize_max_sharpe(mu, S, calculate_daily_rates()[1], cap)
+    if not result.success: raise ValueError(result.message)
+    return result.x
+
+def _capped_quadratic(S, q, cap, w, lipschitz, tol=1e-12, max_iter=20_000):
+    """min 0.5 w'Sw - q'w sous 0 <= w <= cap, somme = 1, depuis w: gradient projeté accéléré (FISTA avec redémarrage
+    d'O'Donoghue-Candès contre les oscillations), pas 1 / lipschitz."""
+    step = 1.0 / max(lipschitz, 1e-18); z = w.copy(); t = 1.0
+    for _ in range(max_iter):
+        w_next = project_capped_simplex(z - step * (S @ z - q), cap)
+        if np.abs(w_next - w).max() < tol: return w_next
+        if (z - w_next) @ (w_next - w) > 0: t = 1.0
+        t_next = (1.0 + np.sqrt(1.0 + 4.0 * t * t)) / 2.0
+        z = w_next + (t - 1.0) / t_next * (w_next - w); w, t = w_next, t_next
+    return w
+
+@register_allocator('min_variance', 'Minimum Variance')
+def allocate_min_variance(mu, S, cap=ASSET_WEIGHT_LIMIT):
+    """Variance minimale (cash compris): programme quadratique sous plafond résolu par FISTA, L = valeur propre max de S."""
+    n = len(mu); _check_capacity(n, cap)
+    return _capped_quadratic(S, np.zeros(n), cap, project_capped_simplex(np.full(n, 1.0 / n), cap), _largest_eigenvalue(S, n) * 1.01)
+
+def _erc_newton(S, w, free, target, tol=1e-13, max_iter=200):
+    """Newton amorti sur le système bordé des contributions égales: (Sw)_i - b / w_i = 0 pour i libre (autres poids fixes) et
+    sum(w libres) = target, inconnues (w libres, b). Le pas est réduit pour garder w > 0 et faire décroître le résidu."""
+    S_free = S[np.ix_(free, free)]; fixed = S[np.ix_(free, ~free)] @ w[~free]
+    y = w[free] * target / w[free].sum(); b = np.mean(y * (S_free @ y + fixed))
+    def residual(y, b): return np.concatenate([S_free @ y + fixed - b / y, [y.sum() - target]])
+    r = residual(y, b); n = len(y)
+    for _ in range(max_iter):
+        J = np.zeros((n + 1, n + 1)); J[:n, :n] = S_free + np.diag(b / y ** 2); J[:n, n] = -1.0 / y; J[n, :n] = 1.0
+        step_y, step_b = np.split(np.linalg.solve(J, -r), [n]); step = 1.0
+        while step > 1e-12 and ((y + step * step_y <= 0).any() or np.linalg.norm(residual(y + step * step_y, b + step * step_b[0])) > (1 - 1e-4 * step) * np.linalg.norm(r)): step /= 2.0
+        y, b = y + step * step_y, b + step * step_b[0]; r = residual(y, b)
+        if np.abs(step * step_y).max() < tol * y.min(): break
+    w = w.copy(); w[free] = y
+    return w
+
+@register_allocator('equal_risk', 'Equal Risk Contribution')
+def allocate_equal_risk(mu, S, cap=ASSET_WEIGHT_LIMIT):
+    """Contributions au risque w_i (Sw)_i égales entre actifs risqués (cash exclu), par Newton amorti (une factorisation par itération).
+    Départ inverse-volatilité; les actifs dépassant cap y sont fixés et les autres se partagent le reste à contributions égales."""
+    risky = _risky_assets(S); _check_capacity(int(risky.sum()), cap)
+    S = _dense(S)[np.ix_(risky, risky)]; n = len(S)
+    w = 1.0 / np.sqrt(np.diag(S)); w /= w.sum(); capped = np.zeros(n, dtype=bool)
+    while True:
+        w = _erc_newton(S, np.where(capped, cap, w), ~capped, 1.0 - cap * capped.sum())
+        over = ~capped & (w > cap + 1e-12)
+        if not over.any(): break
+        capped |= over
+    weights = np.zeros(len(risky)); weights[risky] = w
+    return weights
+
+@register_allocator('max_diversification', 'Maximum Diversification')
+def allocate_max_diversification(mu, S, cap=ASSET_WEIGHT_LIMIT, tol=1e-12, max_iter=100):
+    """Ratio de diversification w'sigma / sqrt(w'Sw) maximal (actifs risqués), par itérations de Dinkelbach: en w_k (vol s, ratio r),
+    sqrt(w'Sw) est majorée par sa tangente, d'où le programme quadratique min 0.5 w'Sw - (s / r) sigma'w (FISTA, départ w_k).
+    Le ratio croît à chaque itération et converge vers le maximum global (ratio pseudo-concave)."""
+    risky = _risky_assets(S); _check_capacity(int(risky.sum()), cap)
+    S = _dense(S)[np.ix_(risky, risky)]; sigma = np.sqrt(np.diag(S)); lipschitz = _largest_eigenvalue(S, len(S)) * 1.01
+    w = project_capped_simplex(np.full(len(S), 1.0 / len(S)), cap); vol = np.sqrt(w @ S @ w); ratio = w @ sigma / vol
+    for _ in range(max_iter):
+        w_next = _capped_quadratic(S, vol / ratio * sigma, cap, w, lipschitz)
+        vol_next = np.sqrt(w_next @ S @ w_next); ratio_next = w_next @ sigma / vol_next
+        if ratio_next <= ratio * (1 + tol): break
+        w, vol, ratio = w_next, vol_next, ratio_next
+    weights = np.zeros(len(risky)); weights[risky] = w
+    return weights
+
+@register_allocator('hrp', 'Hierarchical Risk Parity')
+def allocate_hrp(mu, S, cap=ASSET_WEIGHT_LIMIT):
+    """HRP (López de Prado): ordre de la classification hiérarchique des corrélations (cluster_correlation), puis bissection récursive,
+    chaque moitié recevant un poids inversement proportionnel à la variance de son portefeuille inverse-variance. Actifs risqués
+    uniquement; le plafond est appliqué ensuite par cap_weights (excédent redistribué au prorata)."""
+    risky = _risky_assets(S); _check_capacity(int(risky.sum()), cap)
+    S = _dense(S)[np.ix_(risky, risky)]; sigma = np.sqrt(np.diag(S))
+    order, _ = cluster_correlation(pd.DataFrame(S / np.outer(sigma, sigma)))
+    def cluster_variance(members):
+        ivp = 1.0 / np.diag(S)[members]; ivp /= ivp.sum()
+        return ivp @ S[np.ix_(members, members)] @ ivp
+    w = np.ones(len(S)); clusters = [np.asarray(order)]
+    while clusters:
+        clusters = [half for c in clusters if len(c) > 1 for half in (c[:len(c) // 2], c[len(c) // 2:])]
+        for left, right in zip(clusters[::2], clusters[1::2]):
+            var_left, var_right = cluster_variance(left), cluster_variance(right)
+            alpha = 1.0 - var_left / (var_left + var_right); w[left] *= alpha; w[right] *= 1.0 - alpha
+    weights = np.zeros(len(risky)); weights[risky] = cap_weights(w[None, :] / w.sum(), cap)[0]
+    return weights
+
+def run_allocator(key, mean_returns, cov_matrix, cap=ASSET_WEIGHT_LIMIT):
+    """Exécute l'allocateur 'key' du registre; retourne (poids DataFrame 'Weight' indexé par ticker, message d'erreur)."""
+    if mean_returns is None or cov_matrix is None: return None, None
+    try:
+        weights = np.asarray(ALLOCATORS[key][1](mean_returns.to_numpy(dtype=float), covariance_operator(cov_matrix), cap), dtype=float)
+        weights[weights < 1e-6] = 0; weights /= weights.sum() # Même nettoyage que run_max_sharpe
+        return pd.DataFrame(weights, index=mean_returns.index, columns=['Weight']), None
+    except Exception as e:
+        return None, str(e)
+
+def risk_contributions(weights, S):
+    """Parts de risque w_i (Sw)_i / w'Sw de chaque actif (somme = 1)."""
+    Sw = S @ weights; variance = weights @ Sw
+    return weights * Sw / variance if variance > 0 else np.zeros_like(weights)
+
+def compare_allocators(mean_returns, cov_matrix, cap=ASSET_WEIGHT_LIMIT, keys=None):
+    """Exécute les allocateurs du registre (tous par défaut) sur les mêmes mu/S.
+    Retourne (poids allocateurs x tickers, synthèse ex ante par allocateur, erreurs {libellé: message}) ou (None, None, None)."""
+    if mean_returns is None or cov_matrix is None: return None, None, None
+    S = covariance_operator(cov_matrix); mu = mean_returns.to_numpy(dtype=float); sigma = np.sqrt(np.maximum(np.diag(_dense(S)), 0.0))
+    rf = calculate_daily_rates()[1]; rows, weights, errors = {}, {}, {}
+    for key in keys or list(ALLOCATORS):
+        label = ALLOCATORS[key][0]; allocation, error = run_allocator(key, mean_returns, cov_matrix, cap)
+        if allocation is None: errors[label] = error; continue
+        w = allocation['Weight'].to_numpy(); vol = np.sqrt(w @ (S @ w)); contributions = risk_contributions(w, S)
+        weights[label] = allocation['Weight']
+        rows[label] = {'Return (Ann.)': w @ mu * TRADING_DAYS, 'Volatility (Ann.)': vol * np.sqrt(TRADING_DAYS),
+                       'Sharpe (Ann.)': (w @ mu - rf) / vol * np.sqrt(TRADING_DAYS) if vol > 0 else np.nan,
+                       'Diversification Ratio': w @ sigma / vol if vol > 0 else np.nan, 'Max Risk Contribution': contributions.max(),
+                       'Effective N': 1.0 / (w ** 2).sum(), 'Max Weight': w.max(), 'Assets': int((w > 1e-6).sum())}
+    if not rows: return None, None, errors
+    return pd.DataFrame(weights).T, pd.DataFrame(rows).T, errors
+
+# --- MODIFIED: Ajout Optimisation ---
+def calculate_full_period_indicators(benchmark_df, prices_hist, returns_full, data_version=None, cov_method=COVARIANCE_METHOD, optimize=True):
+    """Calcule les indicateurs sur toute la période et effectue l'optimisation (warm start depuis la version précédente).
+    optimize=False: optimisation laissée à run_optimization (entrées, poids et erreur à None)."""
+    if benchmark_df is None or prices_hist is None or returns_full is None: return None, None, None, None, None, None, None, None
+    if returns_full.empty: notify("No return data."); return None, None, None, None, None, None, None, None
+
+    cash_daily_365, rf_daily_365, _ = calculate_daily_rates()
+    tickers = get_tickers_by_class(benchmark_df, prices_hist.columns)
+    all_tickers = tickers['action'] + tickers['bond'] + tickers['commodity']
+    if not all_tickers: notify("No valid asset tickers found."); return None, None, None, None, None, None, None, None
+
+    try:
+        benchmark_df_indexed = benchmark_df.set_index(benchmark_df['BBG Ticker'].astype(str))
+        asset_class_map = benchmark_df_indexed['Asset Class']
+    except Exception as e:
+        notify(f"Error creating asset class map: {e}")
+        return None, None, None, None, None, None, None, None
+
+    bench_returns = calculate_benchmark_returns(returns_full, tickers, cash_daily_365).fillna(0)
+    bench_returns.name = "Benchmark_Returns"
+    if bench_returns.empty: notify("Benchmark returns calculation failed."); return None, None, None, None, None, None, None, None
+
+    bench_ind_calc = calculate_indicators(bench_returns, rf_daily_365)
+    bench_indicators_full = {
+        'Volatilité Annuelle': bench_ind_calc['Volatilité'],
+        'Ratio de Sharpe Annuel': bench_ind_calc['Sharpe'],
+        'VaR 99% (1 jour)': bench_ind_calc['VaR 99%'],
+        'Max Drawdown': calculate_drawdowns(pd.DataFrame({'Benchmark': nav_from_returns(bench_returns.to_numpy(), base=1.0)}))[1].loc['Benchmark', 'Max Drawdown']
+    }
+
+    # --- Préparation des données et exécution de l'optimisation ---
+    mean_daily_returns_opt, cov_matrix_opt, optimal_weights, optim_error = None, None, None, None
+    if optimize:
+        mean_daily_returns_opt, cov_matrix_opt = optimization_inputs(benchmark_df, returns_full, cov_method)
+        if mean_daily_returns_opt is None: notify_warning("No asset returns found for optimization data.")
+        optimal_weights, optim_error = run_max_sharpe(mean_daily_returns_opt, cov_matrix_opt, data_version)
+
+    # ... (Calcul des indicateurs 'indicators_df' inchangé) ...
+    returns_aligned = returns_full[[str(t) for t in all_tickers]].loc[bench_returns.index]
+    universe_ind = calculate_indicators_matrix(returns_aligned, bench_returns, rf_daily_365)
+    universe_ind = universe_ind[universe_ind['Observations'] >= 2]
+    drawdowns = calculate_drawdowns(prices_hist[universe_ind.index])[1] # Une passe sur la matrice des prix
+    indicators_list = [{'Ticker': ticker, 'Asset Class': asset_class_map.get(ticker, 'N/A'), 'Volatilite Annuelle': row['Volatilité'], 'Beta (vs Benchmark)': row['Beta'], 'Correlation (vs Benchmark)': row['Correlation'], 'VaR 99% (1 jour)': row['VaR 99%'], 'Sharpe Ratio Annuel': row['Sharpe'],
+                        'Max Drawdown': drawdowns.at[ticker, 'Max Drawdown'], 'Drawdown Duration (days)': drawdowns.at[ticker, 'Drawdown Duration (days)'], 'Time to Recovery (days)': drawdowns.at[ticker, 'Time to Recovery (days)']} for ticker, row in universe_ind.iterrows()]
+
+    indicators_df = pd.DataFrame(indicators_list, columns=['Ticker', 'Asset Class', 'Volatilite Annuelle', 'Beta (vs Benchmark)', 'Correlation (vs Benchmark)', 'VaR 99% (1 jour)', 'Sharpe Ratio Annuel', 'Max Drawdown', 'Drawdown Duration (days)', 'Time to Recovery (days)']); corr_matrix = returns_aligned.corr()
+    
+    # Retourne aussi les données pour l'optimisation, les poids optimaux et l'erreur d'optimisation éventuelle
+    return indicators_df, corr_matrix, bench_indicators_full, asset_class_map, mean_daily_returns_opt, cov_matrix_opt, optimal_weights, optim_error
+
+
+# --- Dérive des positions (quantités fixées au départ, sans rebalancement) ---
+def calculate_holdings_drift(portfolio_weights_df, benchmark_df, prices_hist, start_date=START_DATE_SIMULATION):
+    """Valeurs EUR quotidiennes de chaque ligne du portefeuille depuis start_date (premier prix disponible à partir de cette date).
+    prices_hist: prix déjà convertis en EUR (convert_to_eur), fixing du jour inclus pour les lignes en devise.
+    Quantités calculées une seule fois aux prix de départ. Cash constant, ligne sans prix de départ = 0.
+    Retourne (DataFrame dates x lignes, Series classe d'actif par ligne) ou (None, None)."""
+    if portfolio_weights_df is None or benchmark_df is None or prices_hist is None or prices_hist.empty: return None, None
+    prices_sim = prices_hist[prices_hist.index >= start_date]
+    if prices_sim.empty: notify(f"Cannot find prices at or after simulation start date {start_date.strftime('%Y-%m-%d')}"); return None, None
+
+    tickers = portfolio_weights_df['BBG Ticker'].astype(str).reset_index(drop=True)
+    class_map = benchmark_df.set_index(benchmark_df['BBG Ticker'].astype(str))['Asset Class']
+    class_map = class_map[~class_map.index.duplicated()]
+    is_cash = (tickers.str.lower() == CASH_TICKER_NAME.lower()).to_numpy()
+    asset_class = tickers.map(class_map)
+    asset_class = asset_class.where(asset_class.notna(), pd.Series(np.where(is_cash, 'Cash', 'Unknown'))).set_axis(tickers)
+
+    alloc_eur = portfolio_weights_df['Weight'].to_numpy(dtype=float) * INITIAL_NAV_EUR
+    px = prices_sim.reindex(columns=tickers).to_numpy(dtype=float); start_px = px[0]
+    priced = np.isfinite(start_px) & (start_px != 0) & ~is_cash
+    with np.errstate(invalid='ignore', divide='ignore'): values = alloc_eur / np.where(priced, start_px, 1.0) * px
+    values[:, ~priced] = 0.0; values[:, is_cash] = alloc_eur[is_cash]
+    return pd.DataFrame(values, index=prices_sim.index, columns=tickers), asset_class
+
+def drift_weights(holdings_values):
+    """Poids courants quotidiens (valeur / valeur totale du jour, lignes sans prix exclues du total)."""
+    totals = holdings_values.sum(axis=1).to_numpy()[:, None]
+    with np.errstate(invalid='ignore', divide='ignore'): weights = np.where(totals != 0, holdings_values.to_numpy() / totals, 0.0)
+    return pd.DataFrame(weights, index=holdings_values.index, columns=holdings_values.columns)
+
+def active_weights_history(holdings_weights, benchmark_df):
+    """Poids actifs quotidiens (poids courant - poids benchmark) des lignes détenues."""
+    weights = holdings_weights.T.groupby(level=0).sum().T
+    benchmark_weights = benchmark_composition(benchmark_df, benchmark_df['BBG Ticker'].astype(str).unique())
+    benchmark_weights.index = benchmark_weights.index.astype(str)
+    return weights - benchmark_weights.reindex(weights.columns).fillna(0.0)
+
+def calculate_active_weights(portfolio_weights_df, benchmark_df, prices_hist, holdings=None):
+    """Calcule les poids courants du portefeuille et les poids actifs par rapport au benchmark (dernière date de la dérive).
+    holdings: résultat de calculate_holdings_drift déjà calculé (recalculé sinon). Les entrées ne sont pas modifiées."""
+    if portfolio_weights_df is None or benchmark_df is None or prices_hist is None or prices_hist.empty:
+        return None
+
+    try:
+        holdings_values, asset_class = holdings if holdings is not None else calculate_holdings_drift(portfolio_weights_df, benchmark_df, prices_hist)
+        if holdings_values is None: return None
+
+        # 1. Calculer les poids benchmark théoriques
+        benchmark_weights_series = benchmark_composition(benchmark_df, benchmark_df['BBG Ticker'].astype(str).unique())
+
+        # 2. Poids courants du portefeuille (dernière ligne de la dérive; lignes sans prix exclues du total)
+        latest_values = holdings_values.iloc[-1]
+        total_current_value = latest_values.sum()
+        active_weight_df = pd.DataFrame({'Asset Class': asset_class.to_numpy(),
+                                         'Current Weight': latest_values.to_numpy() / total_current_value if total_current_value != 0 else 0.0},
+                                        index=holdings_values.columns)
+
+        # 3. Fusionner avec les poids benchmark et calculer poids actif
+        benchmark_weights_series.index = benchmark_weights_series.index.astype(str)
+        combined_df = pd.concat([benchmark_weights_series, active_weight_df[['Asset Class', 'Current Weight']]], axis=1)
+
+        combined_df['Benchmark Weight'] = combined_df['Benchmark Weight'].fillna(0)
+        combined_df['Current Weight'] = combined_df['Current Weight'].fillna(0)
+        if not isinstance(benchmark_df.index, pd.Index) or benchmark_df.index.name != 'BBG Ticker':
+             benchmark_df_indexed_active = benchmark_df.set_index(benchmark_df['BBG Ticker'].astype(str))
+        else:
+             benchmark_df_indexed_active = benchmark_df.copy()
+             benchmark_df_indexed_active.index = benchmark_df_indexed_active.index.astype(str)
+
+        combined_df['Asset Class'] = combined_df['Asset Class'].fillna(benchmark_df_indexed_active['Asset Class'])
+        combined_df['Asset Class'] = combined_df['Asset Class'].fillna('Unknown') # Fallback
+
+        combined_df['Active Weight'] = combined_df['Current Weight'] - combined_df['Benchmark Weight']
+
+        active_weight_final = combined_df[[
+            'Asset Class', 'Benchmark Weight', 'Current Weight', 'Active Weight'
+        ]].reset_index().rename(columns={'index': 'BBG Ticker'}).copy()
+        active_weight_final.loc[active_weight_final['BBG Ticker'].str.lower() == CASH_TICKER_NAME.lower(), 'Asset Class'] = 'Cash'
+
+        return active_weight_final
+
+    except KeyError as e:
+         notify(f"Error calculating active weights: Missing data for ticker {e} on start or latest date.")
+         return None
+    except Exception as e:
+        notify(f"Error calculating active weights: {e}")
+        return None
+
+# --- Moteur NAV vectorisé (partagé par les simulations) ---
+def nav_from_returns(gross_returns, daily_fee=0.0, base=100.0):
+    """NAV nette en forme fermée: base * cumprod((1 + r) * (1 - frais)). Le premier jour vaut base.
+    daily_fee peut être un scalaire ou un vecteur de frais journaliers."""
+    factors = (1.0 + np.asarray(gross_returns, dtype=float)) * (1.0 - np.asarray(daily_fee, dtype=float))
+    if factors.size == 0: return factors
+    factors[0] = 1.0
+    return base * np.cumprod(factors, axis=0)
+
+def accrued_cash_values(initial_value, daily_rate, n_days):
+    """Valeur du cash rémunéré jour par jour: initial * (1 + taux)^t, t = 0..n-1."""
+    return initial_value * (1.0 + daily_rate) ** np.arange(n_days)
+
+def cumulative_asset_values(returns_matrix, initial_values):
+    """Valeurs cumulées par actif (jours x actifs) en partant des montants initiaux; les NaN comptent comme 0%."""
+    return np.nancumprod(1.0 + np.asarray(returns_matrix, dtype=float), axis=0) * np.asarray(initial_values, dtype=float)
+
+def calculate_simulation_performance(portfolio_df, benchmark_df, returns_all, start_date):
+    """Calcule les performances de simulation, gérant le cash explicite ET les frais, ET la contribution.
+    Retourne aussi les rendements quotidiens après start_date sur lesquels portent les indicateurs et la TE (Portfolio net, Benchmark brut)."""
+    # ... (fonction inchangée depuis v2.5) ...
+    if portfolio_df is None or benchmark_df is None or returns_all is None: return None, None, None, None, None, None
+    returns_sim = returns_all[returns_all.index >= start_date].copy()
+    if returns_sim.empty: notify_warning(f"No data since {start_date.strftime('%Y-%m-%d')}."); return None, None, None, None, None, None
+
+    cash_daily_365, rf_daily_365, mgmt_fee_daily_365 = calculate_daily_rates()
+    tickers = get_tickers_by_class(benchmark_df, returns_sim.columns)
+
+    # --- Benchmark Returns & NAV (Brut) ---
+    bench_returns_gross = calculate_benchmark_returns(returns_sim, tickers, cash_daily_365).fillna(0)
+    actual_start_brut = bench_returns_gross.index.min()
+    actual_start = start_date
+    if start_date not in bench_returns_gross.index:
+         bench_returns_gross.loc[start_date] = 0.0
+         bench_returns_gross = bench_returns_gross.sort_index()
+
+    nav_bench_raw = (1 + bench_returns_gross).cumprod(); nav_bench = nav_bench_raw * 100; nav_bench.name = "Benchmark"
+
+    # --- Portfolio Returns (Brut) & NAV (Net de frais) ---
+    weights_dict = portfolio_df.set_index('BBG Ticker')['Weight'].to_dict()
+
+    cash_weight_explicit = 0.0; cash_ticker_found = None
+    for ticker, weight in weights_dict.items():
+        if CASH_TICKER_NAME.lower() == str(ticker).lower():
+            cash_weight_explicit = weight; cash_ticker_found = ticker; break
+
+    portfolio_asset_tickers = [t for t in weights_dict.keys() if str(t) in returns_sim.columns and (cash_ticker_found is None or str(t).lower() != str(cash_ticker_found).lower())]
+    portfolio_returns_raw = returns_sim[[str(t) for t in portfolio_asset_tickers]]
+    aligned_weights = pd.Series({t: weights_dict[t] for t in portfolio_asset_tickers})
+    weighted_asset_returns = portfolio_returns_raw.multiply(aligned_weights, axis=1).sum(axis=1).fillna(0)
+    portfolio_returns_gross = weighted_asset_returns + (cash_weight_explicit * cash_daily_365)
+
+    if start_date not in portfolio_returns_gross.index:
+        portfolio_returns_gross.loc[start_date] = 0.0
+        portfolio_returns_gross = portfolio_returns_gross.sort_index()
+
+    nav_portfolio = pd.Series(nav_from_returns(portfolio_returns_gross.values, mgmt_fee_daily_365), index=portfolio_returns_gross.index, name="Votre Fonds (Net)")
+
+    # --- Calcul Contribution P&L (Brut) ---
+    pnl_contributions = []
+    if not isinstance(benchmark_df.index, pd.Index) or benchmark_df.index.name != 'BBG Ticker':
+         benchmark_df_indexed_contrib = benchmark_df.set_index(benchmark_df['BBG Ticker'].astype(str))
+    else: benchmark_df_indexed_contrib = benchmark_df
+    asset_class_map_contrib = benchmark_df_indexed_contrib['Asset Class']
+    sim_period_returns_contrib = returns_sim[returns_sim.index >= start_date]
+
+    # Valeurs finales par actif en une passe (cumprod sur la matrice des rendements)
+    contrib_tickers = [str(t) for t in weights_dict if str(t) != cash_ticker_found and str(t) in sim_period_returns_contrib.columns]
+    initial_values = np.array([weights_dict[t] * 100 for t in weights_dict if str(t) in contrib_tickers])
+    final_values = cumulative_asset_values(sim_period_returns_contrib[contrib_tickers].values, initial_values)[-1] if contrib_tickers and not sim_period_returns_contrib.empty else initial_values
+    final_value_map = dict(zip(contrib_tickers, final_values))
+    num_cash_days = len(sim_period_returns_contrib.index)
+
+    for ticker, initial_weight in weights_dict.items():
+        ticker_str = str(ticker)
+        asset_class = asset_class_map_contrib.get(ticker_str, 'Cash' if CASH_TICKER_NAME.lower() == ticker_str.lower() else 'Unknown')
+        initial_value = initial_weight * 100
+
+        if ticker_str == cash_ticker_found:
+             final_value = accrued_cash_values(initial_value, cash_daily_365, num_cash_days)[-1] if num_cash_days > 0 else initial_value
+             pnl = final_value - initial_value
+        elif ticker_str in final_value_map: pnl = final_value_map[ticker_str] - initial_value
+        else: pnl = 0
+
+        pnl_contributions.append({'Asset Class': asset_class, 'P&L Contribution (Base 100)': pnl})
+
+    contribution_df = pd.DataFrame(pnl_contributions)
+    if 'Asset Class' in contribution_df.columns:
+        contribution_by_class = contribution_df.groupby('Asset Class')['P&L Contribution (Base 100)'].sum().reset_index()
+    else:
+        contribution_by_class = pd.DataFrame(columns=['Asset Class', 'P&L Contribution (Base 100)'])
+
+    # --- Indicateurs & TE ---
+    portfolio_returns_net = nav_portfolio.pct_change().fillna(0)
+    sim_indicators = {"benchmark": {}, "portfolio": {}}; te_series = None; avg_te = np.nan
+    bench_rets_stats = bench_returns_gross[bench_returns_gross.index > start_date]
+    port_rets_stats = portfolio_returns_net[portfolio_returns_net.index > start_date]
+
+    if len(bench_rets_stats) >= 1:
+        sim_indicators['benchmark'] = calculate_indicators(bench_rets_stats, rf_daily_365)
+        sim_indicators['portfolio'] = calculate_indicators(port_rets_stats, rf_daily_365)
+        if len(bench_rets_stats) >= 2:
+            common_te_index = bench_rets_stats.index.intersection(port_rets_stats.index)
+            if not common_te_index.empty:
+                diff = port_rets_stats.loc[common_te_index] - bench_rets_stats.loc[common_te_index]
+                if len(diff) >= 2:
+                    avg_te = diff.std() * np.sqrt(TRADING_DAYS)
+                    window = TE_WINDOW
+                    if len(diff) >= window:
+                        te_series = diff.rolling(window=window).std() * np.sqrt(TRADING_DAYS)
+                        te_series = te_series.dropna(); te_series.name = "Tracking Error (60j)"
+                        if not te_series.empty: avg_te = te_series.mean()
+
+    comparison = pd.DataFrame({'Benchmark': nav_bench, 'Votre Fonds (Net)': nav_portfolio})
+    if start_date in comparison.index: comparison.loc[start_date] = 100.0
+    else: comparison.loc[start_date] = 100.0; comparison = comparison.sort_index()
+    comparison = comparison.ffill()
+
+    stat_returns = pd.DataFrame({'Portfolio': port_rets_stats, 'Benchmark': bench_rets_stats})
+    return comparison, sim_indicators, te_series, avg_te, contribution_by_class, stat_returns
+
+# --- Simulateur multi-portefeuilles (batch) ---
+def align_returns_for_batch(returns_all, assets, start_date):
+    """Matrice des rendements (jours x actifs) depuis start_date, alignée sur 'assets'.
+    Le cash est rémunéré au taux journalier; tickers absents et NaN comptent pour 0%."""
+    cash_daily_365, _, _ = calculate_daily_rates()
+    returns_sim = returns_all[returns_all.index >= start_date]
+    if start_date not in returns_sim.index: # Jour de départ ajouté (neutralisé par nav_from_returns)
+        returns_sim = pd.concat([pd.DataFrame(0.0, index=[start_date], columns=returns_sim.columns), returns_sim])
+    aligned = returns_sim.reindex(columns=[str(a) for a in assets]).fillna(0.0).to_numpy(dtype=float, copy=True) # Copie modifiable (copy-on-write)
+    cash_mask = np.array([str(a).lower() == CASH_TICKER_NAME.lower() for a in assets], dtype=bool)
+    aligned[:, cash_mask] = cash_daily_365
+    return returns_sim.index, aligned
+
+def random_capped_weights(n_portfolios, n_assets, cap=ASSET_WEIGHT_LIMIT, seed=0):
+    """Tire n allocations aléatoires (Dirichlet) avec 0 <= w <= cap et somme = 1 (nécessite n_assets * cap >= 1)."""
+    rng = np.random.default_rng(seed)
+    return cap_weights(rng.dirichlet(np.ones(n_assets), size=n_portfolios), cap)
+
+def cap_weights(weights, cap=ASSET_WEIGHT_LIMIT):
+    """Plafonne chaque ligne de 'weights' (N x actifs) à cap, l'excédent étant redistribué au prorata des poids non plafonnés (somme conservée)."""
+    weights = np.array(weights, dtype=float)
+    for _ in range(100): # Écrêtage puis redistribution de l'excédent sur les poids non plafonnés
+        excess = np.clip(weights - cap, 0, None).sum(axis=1, keepdims=True)
+        if excess.max() < 1e-12: break
+        weights = np.minimum(weights, cap); free = np.where(weights < cap, weights, 0.0)
+        weights = weights + excess * free / np.maximum(free.sum(axis=1, keepdims=True), 1e-18)
+    return weights
+
+def simulate_portfolios_batch(weights_df, returns_all, start_date, bench_returns=None):
+    """Simule N portefeuilles (lignes de weights_df, colonnes = tickers) en un seul produit matriciel.
+    Retourne les NAV nettes (jours x N, base 100) et Vol/Sharpe/VaR/TE/Performance par portefeuille."""
+    if weights_df is None or weights_df.empty or returns_all is None: return None, None
+    if returns_all[returns_all.index >= start_date].empty: return None, None
+    mgmt_fee_daily_365 = calculate_daily_rates()[2]
+
+    dates, returns_matrix = align_returns_for_batch(returns_all, weights_df.columns, start_date)
+    gross = returns_matrix @ weights_df.fillna(0.0).to_numpy(dtype=float).T # jours x N
+    navs = nav_from_returns(gross, mgmt_fee_daily_365)
+    return pd.DataFrame(navs, index=dates, columns=weights_df.index), nav_metrics(navs, dates, weights_df.index, bench_returns)
+
+def nav_metrics(navs, dates, labels, bench_returns=None):
+    """Vol/Sharpe/VaR/TE/Performance de chaque colonne d'une matrice de NAV (jours x N, base 100) sur ses rendements nets."""
+    rf_daily_365 = calculate_daily_rates()[1]
+    net = navs[1:] / navs[:-1] - 1.0 # Rendements nets après la date de départ
+    nan_row = np.full(navs.shape[1], np.nan); vol, sharpe, var, te = nan_row, nan_row.copy(), nan_row.copy(), nan_row.copy()
+    if len(net) >= 2:
+        std = net.std(axis=0, ddof=1); vol = std * np.sqrt(TRADING_DAYS)
+        with np.errstate(divide='ignore', invalid='ignore'): sharpe = np.where(std > 0, (net.mean(axis=0) - rf_daily_365) / std * np.sqrt(TRADING_DAYS), np.nan)
+        var = np.quantile(net, 0.01, axis=0)
+        if bench_returns is not None:
+            bench = bench_returns.reindex(dates[1:]).fillna(0.0).to_numpy(dtype=float)
+            te = (net - bench[:, None]).std(axis=0, ddof=1) * np.sqrt(TRADING_DAYS)
+    return pd.DataFrame({'Volatilité': vol, 'Sharpe': sharpe, 'VaR 99%': var, 'Tracking Error': te, 'Performance': navs[-1] / 100.0 - 1.0}, index=labels)
+
+# --- Éditeur what-if (rendements bruts linéaires en w: mises à jour de rang 1) ---
+class WhatIfPortfolio:
+    """Allocation modifiable ligne à ligne, simulée comme simulate_portfolios_batch (buy & hold des poids, frais de gestion quotidiens).
+    Le rendement brut g = R w est linéaire en w et le net vaut (1 + g)(1 - frais) - 1: changer un poids de delta met à jour
+    g (O(T)), S w, w'S w, mu'w et c'w (O(n), S = covariance des rendements, c = covariance avec le benchmark).
+    Vol, Sharpe et TE s'en déduisent en forme fermée, sans resimulation."""
+    def __init__(self, weights, returns_all, start_date, bench_returns=None):
+        self.assets = pd.Index([str(a) for a in weights.index])
+        self.dates, self._R = align_returns_for_batch(returns_all, list(self.assets), start_date)
+        self._fee = calculate_daily_rates()[2]
+        R1 = self._R[1:] # Jours de rendement net (le départ est neutralisé par nav_from_returns)
+        bench = bench_returns.reindex(self.dates[1:]).fillna(0.0).to_numpy(dtype=float) if bench_returns is not None else None
+        self._mu = R1.mean(axis=0)
+        self._S = np.cov(R1, rowvar=False, ddof=1).reshape(len(self.assets), len(self.assets)) if len(R1) >= 2 else np.zeros((len(self.assets),) * 2)
+        self._c = (R1 - self._mu).T @ (bench - bench.mean()) / (len(R1) - 1) if bench is not None and len(R1) >= 2 else None
+        self._bench_mean, self._bench_var = (bench.mean(), bench.var(ddof=1)) if self._c is not None else (np.nan, np.nan)
+        self.reset(weights.to_numpy(dtype=float))
+
+    def reset(self, weights):
+        """Recalcule entièrement l'état pour les poids donnés (alignés sur self.assets)."""
+        self.weights = np.asarray(weights, dtype=float).copy()
+        self._gross = self._R @ self.weights; self._Sw = self._S @ self.weights
+        self._quad = self.weights @ self._Sw; self._mu_w = self._mu @ self.weights
+        self._c_w = self._c @ self.weights if self._c is not None else np.nan
+
+    def copy(self):
+        """Copie indépendante pour une session: R, S, mu et c partagés (lecture seule), état propre."""
+        clone = object.__new__(WhatIfPortfolio); clone.__dict__.update(self.__dict__)
+        clone.weights, clone._gross, clone._Sw = self.weights.copy(), self._gross.copy(), self._Sw.copy()
+        return clone
+
+    def set_weight(self, asset, weight):
+        """Mise à jour de rang 1 pour le poids d'un actif."""
+        i = self.assets.get_loc(str(asset)); delta = float(weight) - self.weights[i]
+        if delta == 0.0: return
+        self._gross += delta * self._R[:, i]
+        self._quad += 2.0 * delta * self._Sw[i] + delta * delta * self._S[i, i]
+        self._Sw += delta * self._S[:, i]; self._mu_w += delta * self._mu[i]
+        if self._c is not None: self._c_w += delta * self._c[i]
+        self.weights[i] = float(weight)
+
+    def update(self, weights):
+        """Applique les poids (Series indexée par actif) ligne à ligne; seules les lignes modifiées coûtent une mise à jour."""
+        changed = weights.reindex(self.assets).fillna(0.0).to_numpy(dtype=float) != self.weights
+        for asset, weight in weights.reindex(self.assets).fillna(0.0)[changed].items(): self.set_weight(asset, weight)
+        return int(changed.sum())
+
+    def nav(self):
+        """NAV nette (base 100) de l'allocation courante."""
+        return pd.Series(nav_from_returns(self._gross, self._fee), index=self.dates, name='What-If (Net)')
+
+    def metrics(self, asset_class=None, cap=ASSET_WEIGHT_LIMIT):
+        """Performance, Vol, Sharpe, TE (nets, annualisés), poids total, lignes au-dessus du plafond (hors cash) et totaux par classe."""
+        rf_daily_365 = calculate_daily_rates()[1]; scale = 1.0 - self._fee; n_days = len(self.dates) - 1
+        nav_final = 100.0 * np.prod((1.0 + self._gross[1:]) * scale)
+        std = np.sqrt(max(self._quad, 0.0)) * scale if n_days >= 2 else np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = (scale * self._mu_w - self._fee - rf_daily_365) / std * np.sqrt(TRADING_DAYS) if std > 0 else np.nan
+        te_var = scale ** 2 * self._quad - 2.0 * scale * self._c_w + self._bench_var
+        cash_mask = self.assets.str.lower() == CASH_TICKER_NAME.lower()
+        over_cap = [asset for asset, weight, cash in zip(self.assets, self.weights, cash_mask) if weight > cap + 1e-9 and not cash]
+        weights = pd.Series(self.weights, index=self.assets)
+        classes = weights.groupby(asset_class.reindex(self.assets).fillna('Cash').to_numpy()).sum() if asset_class is not None else None
+        return {'NAV': nav_final, 'Performance': nav_final / 100.0 - 1.0, 'Volatilité': std * np.sqrt(TRADING_DAYS), 'Sharpe': sharpe,
+                'Tracking Error': np.sqrt(max(te_var, 0.0) * TRADING_DAYS) if n_days >= 2 and np.isfinite(te_var) else np.nan,
+                'Total Weight': self.weights.sum(), 'Over Cap': over_cap, 'Class Weights': classes}
+
+def what_if_portfolio(portfolio_df, benchmark_df, returns_all, start_date=START_DATE_SIMULATION):
+    """WhatIfPortfolio sur l'univers du benchmark + lignes de la feuille + CASH, initialisé avec les poids de la feuille."""
+    if portfolio_df is None or benchmark_df is None or returns_all is None or returns_all[returns_all.index >= start_date].empty: return None
+    sheet = portfolio_df.groupby('BBG Ticker')['Weight'].sum()
+    tickers = get_tickers_by_class(benchmark_df, returns_all.columns)
+    universe = list(dict.fromkeys([str(t) for t in sheet.index] + tickers['action'] + tickers['bond'] + tickers['commodity'] + [CASH_TICKER_NAME]))
+    returns_sim = returns_all[returns_all.index >= start_date]
+    bench_returns = calculate_benchmark_returns(returns_sim, get_tickers_by_class(benchmark_df, returns_sim.columns), calculate_daily_rates()[0]).fillna(0)
+    return WhatIfPortfolio(sheet.reindex(universe).fillna(0.0), returns_all, start_date, bench_returns)
+
+# --- Backtest avec rebalancement et frais de transaction ---
+def backtest_rebalancing(weights, returns_all, start_date, strategies, fee_rate=TRANSACTION_FEE_RATE, cap=ASSET_WEIGHT_LIMIT, bench_returns=None):
+    """Backtest d'une allocation cible (Series indexée par ticker) sous K stratégies de rebalancement simulées ensemble:
+    l'état est une matrice K x actifs et la boucle ne porte que sur les jours (un balayage de fréquences/seuils coûte une seule passe).
+    strategies: liste de dicts {'label', 'period': jours de bourse entre rebalancements (0 = jamais), 'threshold': écart absolu
+    max toléré vs cible (None = aucun), 'dates': rebalancements programmés (jour de bourse suivant si fermé), 'enforce_cap': un poids
+    au-dessus de cap déclenche un rebalancement (défaut True)}.
+    La cible est plafonnée à cap; chaque rebalancement coûte fee_rate x turnover (somme des |échanges| hors cash). La constitution
+    initiale n'est pas facturée (comme la NAV du MONITOR); frais de gestion journaliers comme nav_from_returns.
+    Retourne (NAV nettes jours x K base 100, tableau de synthèse par stratégie) ou (None, None)."""
+    if weights is None or weights.empty or returns_all is None or not strategies: return None, None
+    if returns_all[returns_all.index >= start_date].empty: return None, None
+    mgmt_fee_daily_365 = calculate_daily_rates()[2]
+    weights = weights.groupby(weights.index.astype(str)).sum()
+    dates, R = align_returns_for_batch(returns_all, list(weights.index), start_date)
+    tradable = np.array([str(a).lower() != CASH_TICKER_NAME.lower() for a in weights.index], dtype=bool)
+    target = cap_weights(weights.to_numpy(dtype=float)[None, :], cap)[0]
+
+    n_days, n_strats = len(dates), len(strategies)
+    period = np.array([int(s.get('period') or 0) for s in strategies])
+    threshold = np.array([np.inf if s.get('threshold') is None else float(s['threshold']) for s in strategies])
+    enforce_cap = np.array([bool(s.get('enforce_cap', True)) for s in strategies])
+    scheduled = np.zeros((n_days, n_strats), dtype=bool)
+    for k, strategy in enumerate(strategies):
+        if strategy.get('dates'):
+            positions = dates.searchsorted(pd.to_datetime(list(strategy['dates'])))
+            scheduled[positions[(positions > 0) & (positions < n_days)], k] = True
+
+    W = np.tile(target, (n_strats, 1)); nav = np.full(n_strats, 100.0); cost_factor = np.ones(n_strats)
+    navs = np.empty((n_days, n_strats)); navs[0] = nav; turnover = np.zeros((n_days, n_strats))
+    for t in range(1, n_days):
+        port_return = W @ R[t] # Poids en fraction de la NAV (le reliquat non investi rapporte 0)
+        W = W * (1.0 + R[t]) / (1.0 + port_return)[:, None]
+        nav = nav * (1.0 + port_return) * (1.0 - mgmt_fee_daily_365)
+        due = (((period > 0) & (t % np.maximum(period, 1) == 0)) | (np.abs(W - target).max(axis=1) > threshold) | scheduled[t]
+               | (enforce_cap & (W[:, tradable].max(axis=1, initial=0.0) > cap + 1e-12)))
+        if due.any():
+            traded = np.abs(target - W[due])[:, tradable].sum(axis=1)
+            turnover[t, due] = traded; nav[due] *= 1.0 - fee_rate * traded; cost_factor[due] *= 1.0 - fee_rate * traded
+            W[due] = target
+        navs[t] = nav
+
+    labels = [s.get('label', f"Strategy {k + 1}") for k, s in enumerate(strategies)]
+    summary = nav_metrics(navs, dates, labels, bench_returns)
+    summary['Rebalances'] = (turnover > 0).sum(axis=0); summary['Turnover'] = turnover.sum(axis=0)
+    summary['Fee Drag'] = (navs[-1] / cost_factor - navs[-1]) / 100.0 # Performance perdue en frais de transaction
+    return pd.DataFrame(navs, index=dates, columns=labels), summary
+
+def rebalancing_sweep(weights, returns_all, start_date, periods=tuple(REBALANCE_PERIODS.values()), thresholds=REBALANCE_THRESHOLDS, fee_rate=TRANSACTION_FEE_RATE, cap=ASSET_WEIGHT_LIMIT):
+    """Balayage des fréquences et seuils de rebalancement en une passe (plus le buy & hold sans contrainte): tableau de synthèse."""
+    strategies = [{'label': 'Buy & Hold', 'period': 0, 'enforce_cap': False}]
+    strategies += [{'label': f"Every {p}d", 'period': p} for p in periods] + [{'label': f"Drift > {th:.1%}", 'threshold': th} for th in thresholds]
+    _, summary = backtest_rebalancing(weights, returns_all, start_date, strategies, fee_rate, cap)
+    return summary
+
+# --- Walk-forward hors échantillon (ré-estimation périodique, solves parallèles avec warm start) ---
+def _solve_walk_forward_chunk(universe, positions, lookback, cov_method, cap, rf):
+    """Max Sharpe sur la fenêtre d'estimation se terminant à chaque position (incluse), dans l'ordre: chaque solution sert de
+    point de départ à la suivante. Échec: ligne NaN (les poids précédents sont conservés au chaînage)."""
+    solutions = []; guess = None
+    for p in positions:
+        window = universe.iloc[(0 if lookback is None else max(0, p + 1 - lookback)):p + 1]
+        mu = window.mean().to_numpy(dtype=float); S = covariance_operator(estimate_covariance(window, cov_method))
+        result = optimize_max_sharpe(mu, S, rf, cap, guess)
+        if result.success: guess = np.clip(result.x, 0.0, cap); solutions.append(guess / guess.sum())
+        else: solutions.append(np.full(universe.shape[1], np.nan))
+    return solutions
+
+def walk_forward_backtest(benchmark_df, returns_full, period=REBALANCE_PERIODS['Monthly'], lookback=WALK_FORWARD_LOOKBACKS['Rolling 1Y'], start_date=None,
+                          cov_method=COVARIANCE_METHOD, cap=ASSET_WEIGHT_LIMIT, fee_rate=TRANSACTION_FEE_RATE, min_history=WALK_FORWARD_MIN_HISTORY, workers=1):
+    """Backtest hors échantillon du max Sharpe: tous les 'period' jours de bourse, mu et covariance (cov_method) sont ré-estimés sur les
+    'lookback' derniers jours (None = tout l'historique disponible) et l'optimum plafonné est appliqué à partir du jour suivant.
+    Les solves sont indépendants: la liste des dates est découpée en blocs contigus résolus en parallèle (warm start dans chaque bloc).
+    NAV chaînée comme backtest_rebalancing: dérive des poids entre deux dates, frais fee_rate x turnover hors cash à chaque changement
+    (constitution initiale non facturée), frais de gestion journaliers. start_date: première estimation au plus tôt (défaut: dès que
+    l'historique suffit). Retourne (NAV jours x [Walk-Forward (Net), Benchmark] base 100, poids par date de rebalancement, synthèse)
+    ou (None, None, None)."""
+    if not SCIPY_AVAILABLE or benchmark_df is None or returns_full is None: return None, None, None
+    universe = optimization_universe(benchmark_df, returns_full)
+    if universe is None or len(universe.columns) * cap < 1: return None, None, None
+    universe = universe.fillna(0.0); n_days = len(universe); first = (lookback or min_history) - 1
+    if start_date is not None: first = max(first, int(universe.index.searchsorted(pd.Timestamp(start_date))))
+    positions = np.arange(first, n_days - 1, max(int(period), 1)) # Dernier jour exclu: aucun rendement hors échantillon après
+    if len(positions) == 0: notify_warning("Not enough history for the walk-forward window."); return None, None, None
+    rf = calculate_daily_rates()[1]
+
+    n_workers = max(1, min(workers, os.cpu_count() or 1, len(positions)))
+    chunks = [chunk for chunk in np.array_split(positions, n_workers) if len(chunk)]
+    solutions = [w for part in parallel_map(_solve_walk_forward_chunk, [(universe, chunk, lookback, cov_method, cap, rf) for chunk in chunks], n_workers) for w in part]
+    targets = pd.DataFrame(solutions, index=universe.index[positions], columns=universe.columns).ffill()
+    valid = targets.notna().all(axis=1).to_numpy()
+    if not valid.any(): notify_warning("Walk-forward optimization failed on every window."); return None, None, None
+    targets, positions = targets[valid], positions[valid]
+
+    # Chaînage hors échantillon: segment [p + 1, p suivant] à poids dérivants, une passe cumprod par segment
+    mgmt_fee_daily_365 = calculate_daily_rates()[2]
+    R = universe.to_numpy(dtype=float); tradable = np.array([str(a).lower() != CASH_TICKER_NAME.lower() for a in universe.columns])
+    T = targets.to_numpy(dtype=float); bounds = list(positions) + [n_days - 1]
+    nav_values = [100.0]; drifted = T[0]; turnover = np.zeros(len(T)); cost_factor = 1.0
+    for k in range(len(T)):
+        if k > 0:
+            turnover[k] = np.abs(T[k] - drifted)[tradable].sum(); cost_factor *= 1.0 - fee_rate * turnover[k]
+            nav_values[-1] *= 1.0 - fee_rate * turnover[k]
+        growth = np.cumprod(1.0 + R[bounds[k] + 1:bounds[k + 1] + 1], axis=0) * T[k] # Valeurs par actif (fraction de la NAV de départ)
+        segment_nav = nav_values[-1] * growth.sum(axis=1) * (1.0 - mgmt_fee_daily_365) ** np.arange(1, len(growth) + 1)
+        nav_values.extend(segment_nav); drifted = growth[-1] / growth[-1].sum()
+    dates = universe.index[positions[0]:]
+    bench = calculate_benchmark_returns(returns_full.reindex(dates[1:]), get_tickers_by_class(benchmark_df, returns_full.columns), calculate_daily_rates()[0]).fillna(0)
+    navs = np.column_stack([nav_values, 100.0 * np.concatenate([[1.0], np.cumprod(1.0 + bench.to_numpy(dtype=float))])])
+
+    labels = ['Walk-Forward (Net)', 'Benchmark']
+    summary = nav_metrics(navs, dates, labels, bench)
+    summary['Rebalances'] = [len(T) - 1, 0]; summary['Turnover'] = [turnover.sum(), 0.0]
+    summary['Fee Drag'] = [(navs[-1, 0] / cost_factor - navs[-1, 0]) / 100.0, 0.0]
+    return pd.DataFrame(navs, index=dates, columns=labels), targets, summary
+
+# --- VaR/CVaR Monte Carlo (simulation par blocs, mémoire bornée) ---
+def risk_weights(portfolio_df, benchmark_df, assets):
+    """Poids de la feuille et du benchmark sur l'univers 'assets' (2 x actifs); les lignes hors univers sont ignorées."""
+    sheet = portfolio_df.set_index(portfolio_df['BBG Ticker'].astype(str))['Weight']
+    sheet.index = [CASH_TICKER_NAME if t.lower() == CASH_TICKER_NAME.lower() else t for t in sheet.index]
+    weights = pd.DataFrame({'Portfolio': sheet.groupby(level=0).sum(), 'Benchmark': benchmark_composition(benchmark_df, assets)}).T
+    return weights.reindex(columns=list(assets)).fillna(0.0)
+
+def _filtered_residuals(returns_hist, lam=EWMA_LAMBDA):
+    """Résidus standardisés par la volatilité EWMA de chaque actif et volatilité EWMA courante (bootstrap historique filtré)."""
+    X = returns_hist.fillna(0.0).to_numpy(dtype=float); X = X - X.mean(axis=0)
+    variance = np.empty_like(X); variance[0] = X.var(axis=0)
+    for t in range(1, len(X)): variance[t] = lam * variance[t - 1] + (1 - lam) * X[t - 1] ** 2
+    current_vol = np.sqrt(lam * variance[-1] + (1 - lam) * X[-1] ** 2)
+    with np.errstate(divide='ignore', invalid='ignore'): residuals = np.where(variance > 0, X / np.sqrt(variance), 0.0)
+    return residuals, current_vol
+
+def _monte_carlo_chunk(seed, n_paths, horizons, mu, chol, scenarios, n_tail, bins):
+    """Simule un bloc de trajectoires jour par jour (mémoire n_paths x portefeuilles) et n'en garde que la queue, un histogramme et des sommes."""
+    rng = np.random.default_rng(seed)
+    growth = np.ones((n_paths, len(mu))); summary = {}
+    for day in range(1, max(horizons) + 1):
+        if scenarios is None: daily = mu + rng.standard_normal((n_paths, len(mu))) @ chol.T
+        else: daily = mu + scenarios[rng.integers(0, len(scenarios), n_paths)] # Jours entiers: corrélations préservées
+        growth *= 1.0 + daily
+        if day in horizons:
+            terminal = growth - 1.0; k = min(n_tail, n_paths)
+            summary[day] = {'tail': np.partition(terminal, k - 1, axis=0)[:k], 'sum': terminal.sum(axis=0), 'sum_sq': (terminal ** 2).sum(axis=0),
+                            'hist': np.stack([np.histogram(np.clip(terminal[:, j], bins[0], bins[-1]), bins=bins)[0] for j in range(len(mu))], axis=1)}
+    return summary
+
+def monte_carlo_var(weights_df, mean_returns, cov_matrix, returns_hist=None, method='cholesky', n_paths=MC_PATHS, horizons=MC_HORIZONS,
+                    confidence=MC_CONFIDENCE, chunk_size=MC_CHUNK_SIZE, seed=0, workers=1):
+    """VaR/CVaR Monte Carlo multi-horizons des allocations 'weights_df' (lignes = portefeuilles, colonnes = actifs de mean_returns).
+    method 'cholesky': rendements journaliers des actifs ~ N(mu, S); 'bootstrap': jours historiques tirés avec remise, standardisés
+    puis remis à l'échelle par la volatilité EWMA courante (returns_hist requis). Rendements bruts, poids rebalancés chaque jour:
+    seules les projections sur les portefeuilles sont tirées (N(W'mu, W'SW) via Cholesky, ou scénarios projetés), même loi.
+    Les trajectoires sont simulées par blocs de chunk_size (graines dérivées de 'seed': résultat identique quel que soit 'workers');
+    seule la queue (1 - confidence) x n_paths est conservée, donc VaR/CVaR sont exacts à mémoire bornée.
+    Retourne (tableau VaR/CVaR/moyenne/écart-type par portefeuille et horizon, distribution de la NAV finale à l'horizon max)."""
+    if weights_df is None or mean_returns is None or cov_matrix is None or n_paths < 1: return None, None
+    assets = list(mean_returns.index)
+    W = weights_df.reindex(columns=assets).fillna(0.0).to_numpy(dtype=float).T # actifs x portefeuilles
+    mu = mean_returns.to_numpy(dtype=float) @ W
+    horizons = tuple(sorted({int(h) for h in horizons if int(h) >= 1}))
+    chol = scenarios = None
+    if method == 'bootstrap':
+        if returns_hist is None or returns_hist.empty: return None, None
+        residuals, scale = _filtered_residuals(returns_hist.reindex(columns=assets))
+        scenarios = (residuals * scale) @ W
+    else:
+        S_p = W.T @ (covariance_operator(cov_matrix) @ W)
+        chol = np.linalg.cholesky(S_p + np.eye(len(S_p)) * max(np.trace(S_p) / len(S_p), 1e-18) * 1e-10) # Jitter: portefeuilles colinéaires
+
+    n_tail = int(np.ceil((1.0 - confidence) * n_paths))
+    bins = np.linspace(-MC_DISTRIBUTION_RANGE, MC_DISTRIBUTION_RANGE, MC_DISTRIBUTION_BINS + 1)
+    sizes = [chunk_size] * (n_paths // chunk_size) + ([n_paths % chunk_size] if n_paths % chunk_size else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(seed_k, size, horizons, mu, chol, scenarios, n_tail, bins) for seed_k, size in zip(seeds, sizes)]
+
+    merged = {h: {'tail': None, 'sum': 0.0, 'sum_sq': 0.0, 'hist': 0} for h in horizons}
+    def absorb(summary): # Fusion incrémentale: la mémoire ne dépend pas du nombre de blocs
+        for h, part in summary.items():
+            acc = merged[h]; tail = part['tail'] if acc['tail'] is None else np.concatenate([acc['tail'], part['tail']])
+            acc['tail'] = np.partition(tail, n_tail - 1, axis=0)[:n_tail]
+            acc['sum'] = acc['sum'] + part['sum']; acc['sum_sq'] = acc['sum_sq'] + part['sum_sq']; acc['hist'] = acc['hist'] + part['hist']
+    parallel_map(_monte_carlo_chunk, args, workers, consume=absorb)
+
+    var_label, cvar_label = f"VaR {confidence:.0%}", f"CVaR {confidence:.0%}"
+    rows = []
+    for h in horizons:
+        acc = merged[h]; mean = acc['sum'] / n_paths; std = np.sqrt(np.maximum(acc['sum_sq'] / n_paths - mean ** 2, 0.0))
+        for j, name in enumerate(weights_df.index):
+            rows.append({'Portfolio': name, 'Horizon (days)': h, var_label: acc['tail'][:, j].max(), cvar_label: acc['tail'][:, j].mean(), 'Mean': mean[j], 'Std': std[j]})
+    distribution = pd.DataFrame(merged[horizons[-1]]['hist'] / n_paths, index=100.0 * (1.0 + (bins[:-1] + bins[1:]) / 2), columns=weights_df.index)
+    distribution.index.name = 'Terminal NAV'
+    return pd.DataFrame(rows), distribution
+
+# --- Intervalles de confiance bootstrap (bootstrap stationnaire par blocs, tirages en lots d'indices) ---
+
+def stationary_bootstrap_indices(rng, n_resamples, n_obs, mean_block=BOOTSTRAP_BLOCK_LENGTH):
+    """Indices (tirages x jours) du bootstrap stationnaire de Politis-Romano: blocs de longueur géométrique (moyenne mean_block)
+    tirés sur la série circulaire; chaque jour ouvre un nouveau bloc avec probabilité 1 / mean_block."""
+    starts = rng.integers(0, n_obs, (n_resamples, n_obs))
+    new_block = rng.random((n_resamples, n_obs)) < 1.0 / mean_block; new_block[:, 0] = True
+    steps = np.arange(n_obs); block_start = np.maximum.accumulate(np.where(new_block, steps, 0), axis=1)
+    return (np.take_along_axis(starts, block_start, axis=1) + steps - block_start) % n_obs
+
+def simulation_statistics(samples, rf_daily, te_window=TE_WINDOW):
+    """Indicateurs de BOOTSTRAP_METRICS pour un lot de trajectoires (tirages x jours x [Portfolio, Benchmark]), comme calculate_indicators
+    (écart-type échantillon, VaR = quantile 1%) et la TE de la simulation (moyenne des TE glissantes sur te_window jours, ou TE globale)."""
+    std = samples.std(axis=1, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'): sharpe = np.where(std > 0, (samples.mean(axis=1) - rf_daily) / std * np.sqrt(TRADING_DAYS), np.nan)
+    var = np.quantile(samples, 0.01, axis=1)
+    active = samples[:, :, 0] - samples[:, :, 1]
+    if active.shape[1] >= te_window:
+        dev = active - active.mean(axis=1, keepdims=True) # Centrage: évite la cancellation des sommes glissantes
+        sums = [np.concatenate([np.zeros((len(dev), 1)), np.cumsum(x, axis=1)], axis=1) for x in (dev, dev ** 2)]
+        s1, s2 = (c[:, te_window:] - c[:, :-te_window] for c in sums)
+        te = np.sqrt(np.maximum(s2 - s1 ** 2 / te_window, 0.0) / (te_window - 1)).mean(axis=1)
+    else: te = active.std(axis=1, ddof=1)
+    return np.column_stack([std[:, 0] * np.sqrt(TRADING_DAYS), sharpe[:, 0], var[:, 0], std[:, 1] * np.sqrt(TRADING_DAYS), sharpe[:, 1], var[:, 1], te * np.sqrt(TRADING_DAYS)])
+
+def _bootstrap_chunk(seed, n_resamples, returns, rf_daily, mean_block):
+    """Statistiques d'un bloc de tirages (une seule indexation vectorisée de la matrice des rendements)."""
+    idx = stationary_bootstrap_indices(np.random.default_rng(seed), n_resamples, len(returns), mean_block)
+    return simulation_statistics(returns[idx], rf_daily)
+
+def bootstrap_confidence_intervals(stat_returns, n_resamples=BOOTSTRAP_RESAMPLES, confidence=BOOTSTRAP_CONFIDENCE, mean_block=BOOTSTRAP_BLOCK_LENGTH,
+                                   chunk_size=BOOTSTRAP_CHUNK_SIZE, seed=0, workers=1):
+    """Intervalles de confiance (percentiles) des indicateurs de simulation par bootstrap stationnaire des jours (Portfolio et Benchmark
+    tirés ensemble: corrélation et TE préservées). Tirages par blocs de chunk_size, répartis sur un pool de processus si workers > 1
+    (graines dérivées de 'seed': résultat identique quel que soit 'workers').
+    Retourne un DataFrame (Series, Metric, Estimate, Lower, Upper, Std Error) ou None si moins de 2 jours."""
+    if stat_returns is None or len(stat_returns) < 2 or n_resamples < 1: return None
+    returns = stat_returns[['Portfolio', 'Benchmark']].to_numpy(dtype=float); rf_daily = calculate_daily_rates()[1]
+    sizes = [chunk_size] * (n_resamples // chunk_size) + ([n_resamples % chunk_size] if n_resamples % chunk_size else [])
+    args = [(seed_k, size, returns, rf_daily, mean_block) for seed_k, size in zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes)]
+    stats = np.vstack(parallel_map(_bootstrap_chunk, args, workers))
+
+    alpha = (1.0 - confidence) / 2
+    lower, upper = np.nanquantile(stats, [alpha, 1.0 - alpha], axis=0)
+    return pd.DataFrame({'Series': [m[0] for m in BOOTSTRAP_METRICS], 'Metric': [m[1] for m in BOOTSTRAP_METRICS],
+                         'Estimate': simulation_statistics(returns[None], rf_daily)[0], 'Lower': lower, 'Upper': upper, 'Std Error': np.nanstd(stats, axis=0, ddof=1)})
+
+# --- Fonction Simulation Performance Spécifique ---
+def simulate_portfolio_performance(portfolio_weights_dict, returns_all, start_date):
+    """Calcule la performance simulée NETTE pour une allocation donnée (cas N=1 du simulateur batch)."""
+    if not portfolio_weights_dict or returns_all is None: return None, None
+    weights_df = pd.DataFrame([{str(t): w for t, w in portfolio_weights_dict.items()}])
+    navs, metrics = simulate_portfolios_batch(weights_df, returns_all, start_date)
+    if navs is None: return None, None
+    nav_portfolio_sim = navs.iloc[:, 0].rename("Simulated Portfolio (Net)")
+    return nav_portfolio_sim, metrics.iloc[0][['Volatilité', 'Sharpe', 'VaR 99%']].to_dict()
+
+
+# --- Analytique glissante (sommes courantes, O(1) par pas de temps) ---
+def _running_window_sums(A, window):
+    """Sommes par fenêtre glissante le long de l'axe 0: une somme courante par colonne, fenêtre = S[t] - S[t - window]."""
+    running = np.concatenate([np.zeros((1,) + A.shape[1:]), np.cumsum(A, axis=0)])
+    return running[window:] - running[:-window]
+
+def rolling_analytics(returns_df, bench_returns, window=ROLLING_WINDOW_DEFAULT):
+    """Vol, Sharpe, beta, corrélation et tracking error annualisés sur fenêtre glissante, pour chaque colonne de returns_df.
+    Les moments sont mis à jour par sommes courantes sur données centrées (comme Welford, évite la cancellation):
+    coût O(T x n) quelle que soit la fenêtre. Retourne {métrique: DataFrame dates x tickers}, NaN si la fenêtre est incomplète."""
+    if returns_df is None or returns_df.empty or window < 2 or len(returns_df) < window: return None
+    rf_daily = calculate_daily_rates()[1]
+    Y = returns_df.to_numpy(dtype=float); x = bench_returns.reindex(returns_df.index).fillna(0.0).to_numpy(dtype=float)
+    mask = np.isfinite(Y)
+    y_shift = np.where(mask, Y, 0.0).sum(axis=0) / np.maximum(mask.sum(axis=0), 1); x_shift = x.mean()
+    dy = np.where(mask, Y - y_shift, 0.0); dx = (x - x_shift)[:, None]
+    complete = _running_window_sums(mask.astype(float), window) == window
+    s_y, s_yy, s_xy = _running_window_sums(dy, window), _running_window_sums(dy ** 2, window), _running_window_sums(dy * dx, window)
+    s_x, s_xx = _running_window_sums(dx, window), _running_window_sums(dx ** 2, window)
+    var_y = np.maximum(s_yy - s_y ** 2 / window, 0.0) / (window - 1)
+    var_x = np.maximum(s_xx - s_x ** 2 / window, 0.0) / (window - 1)
+    cov_xy = (s_xy - s_x * s_y / window) / (window - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std_y = np.sqrt(var_y)
+        metrics = {'Volatilité': std_y * np.sqrt(TRADING_DAYS),
+                   'Sharpe': np.where(std_y > 0, (s_y / window + y_shift - rf_daily) / std_y * np.sqrt(TRADING_DAYS), np.nan),
+                   'Beta': np.where(var_x > 0, cov_xy / var_x, np.nan),
+                   'Correlation': np.where((var_x > 0) & (var_y > 0), cov_xy / np.sqrt(var_x * var_y), np.nan),
+                   'Tracking Error': np.sqrt(np.maximum(var_y + var_x - 2 * cov_xy, 0.0)) * np.sqrt(TRADING_DAYS)}
+    dates = returns_df.index[window - 1:]
+    return {name: pd.DataFrame(np.where(complete, values, np.nan), index=dates, columns=returns_df.columns) for name, values in metrics.items()}
+
+def rolling_inputs(portfolio_df, benchmark_df, returns_all):
+    """Rendements des tickers + 'Portfolio' (poids de la feuille, fixes) + 'Benchmark' sur tout l'historique, et rendements du benchmark."""
+    if portfolio_df is None or benchmark_df is None or returns_all is None or returns_all.empty: return None, None
+    cash_daily_365 = calculate_daily_rates()[0]
+    bench_returns = calculate_benchmark_returns(returns_all, get_tickers_by_class(benchmark_df, returns_all.columns), cash_daily_365).fillna(0)
+    weights = portfolio_df.set_index('BBG Ticker')['Weight']
+    _, aligned = align_returns_for_batch(returns_all, list(weights.index), returns_all.index.min())
+    universe = returns_all.copy()
+    universe['Portfolio'] = aligned @ weights.to_numpy(dtype=float); universe['Benchmark'] = bench_returns
+    return universe, bench_returns
+
+
+# --- Sommes préfixées des rendements (requêtes de fenêtre en O(1)) ---
+class ReturnStore:
+    """Sommes préfixées par colonne (tickers, CASH, 'Portfolio', 'Benchmark') des log-croissances, des rendements centrés,
+    de leurs carrés et des observations. Toute fenêtre (start, end] se lit en deux accès par colonne: P[j] - P[i].
+    La fenêtre court de la clôture de start à celle de end (performance = NAV(end) / NAV(start) - 1); NaN = jour sans rendement."""
+    def __init__(self, returns_df):
+        self.index, self.columns = returns_df.index, returns_df.columns
+        R = returns_df.to_numpy(dtype=float); valid = np.isfinite(R)
+        self._shift = np.where(valid, R, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1) # Centrage (comme rolling_analytics): évite la cancellation
+        dev = np.where(valid, R - self._shift, 0.0)
+        with np.errstate(divide='ignore'): log_growth = np.log1p(np.where(valid, R, 0.0))
+        self._prefix = {name: np.concatenate([np.zeros((1, R.shape[1])), np.cumsum(values, axis=0)])
+                        for name, values in (('log', log_growth), ('dev', dev), ('dev2', dev ** 2), ('count', valid.astype(float)))}
+
+    def _window(self, start=None, end=None):
+        """Sommes de chaque préfixe sur les dates start < d <= end (bornes None = début/fin de l'historique)."""
+        i = 0 if start is None else self.index.searchsorted(pd.Timestamp(start), 'right')
+        j = len(self.index) if end is None else max(i, self.index.searchsorted(pd.Timestamp(end), 'right'))
+        return {name: prefix[j] - prefix[i] for name, prefix in self._prefix.items()}
+
+    def cumulative_return(self, start=None, end=None):
+        """Performance de chaque colonne sur la fenêtre: exp(somme des log(1 + r)) - 1."""
+        return pd.Series(np.expm1(self._window(start, end)['log']), index=self.columns)
+
+    def window_stats(self, start=None, end=None):
+        """Performance, volatilité annualisée (écart-type échantillon, comme calculate_indicators) et observations par colonne."""
+        sums = self._window(start, end); n = sums['count']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vol = np.sqrt(np.maximum(sums['dev2'] - sums['dev'] ** 2 / n, 0.0) / (n - 1) * TRADING_DAYS)
+        return pd.DataFrame({'Performance': np.expm1(sums['log']), 'Volatilité': np.where(n >= 2, vol, np.nan), 'Observations': n.astype(int)}, index=self.columns)
+
+    def contribution(self, weights, start=None, end=None):
+        """Contribution buy & hold (base 100) de chaque ligne sur la fenêtre: poids initial x performance (0 hors historique)."""
+        weights = weights.groupby(level=0).sum()
+        return weights * self.cumulative_return(start, end).reindex(weights.index).fillna(0.0) * 100
+
+def build_return_store(returns_all, comparison=None):
+    """ReturnStore des actifs + CASH (taux journalier) et, si 'comparison' est fourni, du portefeuille (net) et du benchmark (brut) simulés."""
+    if returns_all is None or returns_all.empty: return None
+    columns = {CASH_TICKER_NAME: pd.Series(calculate_daily_rates()[0], index=returns_all.index)}
+    if comparison is not None and not comparison.empty:
+        nav_returns = comparison.pct_change().reindex(returns_all.index) # NaN avant le départ de la simulation
+        columns.update({'Portfolio': nav_returns['Votre Fonds (Net)'], 'Benchmark': nav_returns['Benchmark']})
+    return ReturnStore(returns_all.assign(**columns))
+
+def period_start(period, end_date, inception=START_DATE_SIMULATION):
+    """Date de base (exclue) d'une période de PERIOD_WINDOWS se terminant à end_date."""
+    if period == '1W': return end_date - pd.Timedelta(days=7)
+    if period == '1M': return end_date - pd.DateOffset(months=1)
+    if period == 'YTD': return pd.Timestamp(end_date.year - 1, 12, 31)
+    return inception
+
+
+# --- Attribution Brinson quotidienne (liaison de Carino, sommes préfixées) ---
+def _carino_factor(log_p, log_b):
+    """Coefficient de Carino (ln(1 + Rp) - ln(1 + Rb)) / (Rp - Rb), limite 1 / (1 + Rp) si Rp = Rb."""
+    r_p, r_b = np.expm1(log_p), np.expm1(log_b); diff = r_p - r_b; tiny = np.abs(diff) < 1e-12
+    with np.errstate(divide='ignore', invalid='ignore'): return np.where(tiny, np.exp(-log_p), (log_p - log_b) / np.where(tiny, 1.0, diff))
+
+class BrinsonAttribution:
+    """Effets Brinson-Fachler quotidiens par classe d'actif (allocation, sélection, interaction vs BENCHMARK_WEIGHTS), calculés en une passe
+    sur les matrices jours x classes, puis pondérés par le coefficient de Carino du jour et cumulés en sommes préfixées.
+    Une fenêtre (start, end] se lit en deux accès et se divise par le coefficient de la fenêtre: les effets liés somment
+    exactement à l'écart de performance géométriquement composé (portefeuille - benchmark)."""
+    def __init__(self, index, classes, wp, rp, wb, rb):
+        self.index, self.classes = index, pd.Index(classes, name='Asset Class')
+        r_p = (wp * rp).sum(axis=1); r_b = rb @ wb
+        effects = np.stack([(wp - wb) * (rb - r_b[:, None]), wb * (rp - rb), (wp - wb) * (rp - rb)], axis=2) # Jours x classes x effets
+        log_p, log_b = np.log1p(r_p), np.log1p(r_b)
+        self._prefix = np.concatenate([np.zeros((1,) + effects.shape[1:]), np.cumsum(effects * _carino_factor(log_p, log_b)[:, None, None], axis=0)])
+        self._log = np.concatenate([np.zeros((1, 2)), np.cumsum(np.column_stack([log_p, log_b]), axis=0)])
+
+    def _bounds(self, start=None, end=None):
+        """Positions (i, j) des préfixes pour les dates start < d <= end (comme ReturnStore)."""
+        i = 0 if start is None else self.index.searchsorted(pd.Timestamp(start), 'right')
+        j = len(self.index) if end is None else max(i, self.index.searchsorted(pd.Timestamp(end), 'right'))
+        return i, j
+
+    def returns(self, start=None, end=None):
+        """Performances brutes composées sur la fenêtre: 'Portfolio' (buy & hold), 'Benchmark' et 'Active'."""
+        i, j = self._bounds(start, end); r_p, r_b = np.expm1(self._log[j] - self._log[i])
+        return pd.Series({'Portfolio': r_p, 'Benchmark': r_b, 'Active': r_p - r_b})
+
+    def attribution(self, start=None, end=None):
+        """Effets liés par classe sur la fenêtre (colonnes ATTRIBUTION_EFFECTS + 'Total')."""
+        i, j = self._bounds(start, end); log_p, log_b = self._log[j] - self._log[i]
+        linked = (self._prefix[j] - self._prefix[i]) / _carino_factor(log_p, log_b)
+        return pd.DataFrame(linked, index=self.classes, columns=list(ATTRIBUTION_EFFECTS)).assign(Total=linked.sum(axis=1))
+
+    def cumulative(self, start=None, end=None):
+        """Effets liés cumulés de start à chaque date de la fenêtre (toutes classes), vectorisé sur les dates."""
+        i, j = self._bounds(start, end); logs = self._log[i + 1:j + 1] - self._log[i]
+        linked = (self._prefix[i + 1:j + 1] - self._prefix[i]).sum(axis=1) / _carino_factor(logs[:, 0], logs[:, 1])[:, None]
+        return pd.DataFrame(linked, index=self.index[i:j], columns=list(ATTRIBUTION_EFFECTS))
+
+def brinson_attribution(portfolio_df, benchmark_df, returns_all, start_date=START_DATE_SIMULATION):
+    """Attribution des jours après start_date. Portefeuille: quantités fixées au départ (dérive buy & hold, cash couru au taux cash),
+    poids de classe en début de jour; benchmark: poids de classe fixes, tickers équipondérés (comme calculate_benchmark_returns).
+    Classe détenue absente du benchmark: rendement de référence = benchmark total (effet porté par l'interaction). None si pas de données."""
+    if portfolio_df is None or benchmark_df is None or returns_all is None: return None
+    returns_sim = returns_all[returns_all.index > start_date]
+    if returns_sim.empty: notify_warning(f"No data since {start_date.strftime('%Y-%m-%d')}."); return None
+    cash_daily = calculate_daily_rates()[0]
+
+    weights = portfolio_df.groupby(portfolio_df['BBG Ticker'].astype(str))['Weight'].sum()
+    class_map = pd.Series(benchmark_df['Asset Class'].to_numpy(), index=benchmark_df['BBG Ticker'].astype(str)); class_map = class_map[~class_map.index.duplicated()]
+    is_cash = weights.index.str.lower() == CASH_TICKER_NAME.lower()
+    held_class = pd.Series(weights.index.map(class_map), index=weights.index).where(~is_cash, 'Cash').fillna('Unknown')
+    classes = list(BENCHMARK_WEIGHTS) + sorted(set(held_class) - set(BENCHMARK_WEIGHTS))
+
+    # Portefeuille: valeurs buy & hold (jours+1 x lignes) agrégées par classe via une matrice d'appartenance
+    missing = [t for t in weights.index[~is_cash] if t not in returns_sim.columns]
+    if missing: notify_warning(f"No price history for {', '.join(missing)}: counted at 0% return in the attribution.")
+    R = returns_sim.reindex(columns=weights.index).fillna(0.0).to_numpy(dtype=float, copy=True); R[:, is_cash] = cash_daily # Comme align_returns_for_batch
+    values = np.vstack([weights.to_numpy(dtype=float), cumulative_asset_values(R, weights.to_numpy(dtype=float))])
+    class_values = values @ (held_class.to_numpy()[:, None] == np.array(classes)[None, :]).astype(float)
+    start_values = class_values[:-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        wp = start_values / start_values.sum(axis=1, keepdims=True)
+        rp = class_values[1:] / start_values - 1.0
+
+    # Benchmark: rendements de classe (0 si aucun ticker disponible), référence = total pour les classes hors benchmark
+    tickers = get_tickers_by_class(benchmark_df, returns_sim.columns); class_keys = {'Action': 'action', 'Gov bond': 'bond', 'Commodities': 'commodity'}
+    wb = np.array([BENCHMARK_WEIGHTS.get(c, 0.0) for c in classes])
+    rb = np.column_stack([np.full(len(returns_sim), cash_daily) if c == 'Cash' else
+                          returns_sim[tickers[class_keys[c]]].mean(axis=1).fillna(0).to_numpy() if tickers.get(class_keys.get(c)) else np.zeros(len(returns_sim))
+                          for c in classes])
+    outside = ~np.isin(classes, list(BENCHMARK_WEIGHTS)); rb[:, outside] = (rb @ wb)[:, None]
+    rp = np.where(start_values != 0, rp, rb) # Classe non détenue: pas d'effet de sélection
+    return BrinsonAttribution(returns_sim.index, classes, wp, rp, wb, rb)
+
+# --- Pipeline complet et résultats précalculés ---
+def run_optimization(benchmark_df, returns_full, data_version=None, cov_method=COVARIANCE_METHOD):
+    """Étape optimisation seule (entrées mu/S, max Sharpe, simulation de l'optimum), calculable à la demande.
+    Retourne un dict aux clés de résultats 'mean_returns_opt', 'cov_matrix_opt', 'optimal_weights', 'optim_error', 'nav_opt_sim', 'indicators_opt_sim'."""
+    mean_returns_opt, cov_matrix_opt = optimization_inputs(benchmark_df, returns_full, cov_method)
+    if mean_returns_opt is None: notify_warning("No asset returns found for optimization data.")
+    optimal_weights, optim_error = run_max_sharpe(mean_returns_opt, cov_matrix_opt, data_version)
+    nav_opt_sim, indicators_opt_sim = simulate_portfolio_performance(optimal_weights['Weight'].to_dict(), returns_full, START_DATE_SIMULATION) if optimal_weights is not None else (None, None)
+    return {'mean_returns_opt': mean_returns_opt, 'cov_matrix_opt': cov_matrix_opt, 'optimal_weights': optimal_weights, 'optim_error': optim_error,
+            'nav_opt_sim': nav_opt_sim, 'indicators_opt_sim': indicators_opt_sim}
+
+def run_pipeline(source=None, with_frontier=False, cov_method=COVARIANCE_METHOD, with_optimization=True):
+    """Exécute toute la chaîne de calcul et retourne un dict de résultats.
+    'error' contient le message d'échec critique (None sinon); 'notices' la liste des (niveau, message) émis.
+    with_optimization=False: ni optimisation ni frontière ('optimized' à False), à calculer ensuite avec run_optimization."""
+    results = {'error': None, 'computed_at': datetime.now(), 'cov_method': cov_method, 'optimized': with_optimization}
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', EngineMessage)
+        _run_pipeline_steps(results, source, with_frontier and with_optimization, cov_method, with_optimization)
+    results['notices'] = [(w.category.level, str(w.message)) for w in caught if issubclass(w.category, EngineMessage)]
+    return results
+
+def _run_pipeline_steps(results, source, with_frontier, cov_method, with_optimization=True):
+    """Étapes de run_pipeline (remplit 'results' au fur et à mesure)."""
+    benchmark_df, prices_df, portfolio_df, data_version = load_data(source)
+    results.update(benchmark_df=benchmark_df, portfolio_df=portfolio_df, data_version=data_version)
+    if benchmark_df is None or prices_df is None or portfolio_df is None: results['error'] = "Critical data loading failed."; return
+    prices_hist, returns_all = convert_to_eur(process_prices(prices_df, data_version)[0], benchmark_df, data_version)
+    results.update(prices_hist=prices_hist, returns_all=returns_all)
+    if prices_hist is None or returns_all is None: results['error'] = "Failed to process price data."; return
+    results['currencies'] = detect_currencies(benchmark_df, prices_hist.columns)
+
+    indicators_full, corr_matrix, bench_indicators_full, asset_map, *_ = calculate_full_period_indicators(benchmark_df, prices_hist, returns_all, data_version, cov_method, optimize=False)
+    results.update(indicators_full=indicators_full, corr_matrix=corr_matrix, bench_indicators_full=bench_indicators_full, asset_map=asset_map)
+    if indicators_full is None: results['error'] = "Failed to calculate full period indicators."; return
+
+    holdings_values, holdings_class = calculate_holdings_drift(portfolio_df, benchmark_df, prices_hist)
+    results['active_weight_df'] = calculate_active_weights(portfolio_df, benchmark_df, prices_hist, holdings=(holdings_values, holdings_class))
+    results['holdings_values'] = holdings_values
+    results['holdings_weights'] = drift_weights(holdings_values) if holdings_values is not None else None
+    comparison, sim_ind, te_series, avg_te, contribution_by_class, sim_returns = calculate_simulation_performance(portfolio_df, benchmark_df, returns_all, START_DATE_SIMULATION)
+    results.update(comparison=comparison, sim_ind=sim_ind, te_series=te_series, avg_te=avg_te, contribution_by_class=contribution_by_class, sim_returns=sim_returns)
+    results['drawdown_series'], results['drawdown_summary'] = calculate_drawdowns(comparison.rename(columns={'Votre Fonds (Net)': 'Portfolio (Net)'})) if comparison is not None else (None, None)
+    rolling_returns, rolling_bench = rolling_inputs(portfolio_df, benchmark_df, returns_all)
+    results['rolling'] = rolling_analytics(rolling_returns, rolling_bench, ROLLING_WINDOW_DEFAULT)
+    if with_optimization: results.update(run_optimization(benchmark_df, returns_all, data_version, cov_method))
+    results['frontier'] = compute_efficient_frontier(results['mean_returns_opt'], results['cov_matrix_opt']) if with_frontier else None
+
+def save_results(results):
+    """Écrit les résultats dans le snapshot de leur version de données et met à jour le pointeur RESULTS."""
+    data_version = results.get('data_version')
+    if not data_version or results.get('error'): return None
+    path = os.path.join(SNAPSHOT_DIR, data_version, 'results.pkl')
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pd.to_pickle(results, path + '.tmp'); os.replace(path + '.tmp', path)
+        with open(os.path.join(SNAPSHOT_DIR, 'RESULTS.tmp'), 'w') as f: f.write(data_version)
+        os.replace(os.path.join(SNAPSHOT_DIR, 'RESULTS.tmp'), os.path.join(SNAPSHOT_DIR, 'RESULTS'))
+    except OSError: return None
+    return path
+
+def load_latest_results(max_age_seconds=RESULTS_MAX_AGE):
+    """Derniers résultats précalculés s'ils existent et datent de moins de max_age_seconds (None sinon)."""
+    data_version = latest_snapshot_hash('RESULTS')
+    if not data_version: return None
+    path = os.path.join(SNAPSHOT_DIR, data_version, 'results.pkl')
+    try:
+        if max_age_seconds is not None and datetime.now().timestamp() - os.path.getmtime(path) > max_age_seconds: return None
+        return pd.read_pickle(path)
+    except Exception: return None
+
+def freeze(obj):
+    """Version partageable entre sessions d'un résultat, sans copie: dicts en MappingProxyType, listes/tuples en tuples,
+    tableaux NumPy non modifiables. Les DataFrame/Series pandas sont partagés tels quels: le copy-on-write (pandas >= 3, cf. requirements.txt)
+    isole les objets qui en dérivent, mais une modification en place de l'objet partagé reste visible de toutes les sessions: ne jamais les modifier en place."""
+    if isinstance(obj, dict): return types.MappingProxyType({key: freeze(value) for key, value in obj.items()})
+    if isinstance(obj, (list, tuple)) and not hasattr(obj, '_fields'): return tuple(freeze(value) for value in obj)
+    if isinstance(obj, np.ndarray): obj.flags.writeable = False
+    return obj
+
+def main(argv=None):
+    """Point d'entrée CLI: précalcule tous les résultats sur disque pour l'interface."""
+    global SNAPSHOT_DIR
+    parser = argparse.ArgumentParser(description="M2 MBFA Terminal - moteur de calcul")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    precompute = subparsers.add_parser('precompute', help="Charge les données, calcule tout et écrit les résultats sur disque.")
+    precompute.add_argument('--source', default=None, help="URL ou fichier du classeur (défaut: DASHBOARD_EXCEL_URL / Google Sheets)")
+    precompute.add_argument('--snapshot-dir', default=None, help="Dossier des snapshots et résultats (défaut: DASHBOARD_SNAPSHOT_DIR)")
+    precompute.add_argument('--frontier', action='store_true', help="Calcule aussi la frontière efficiente")
+    precompute.add_argument('--covariance', choices=list(COVARIANCE_METHODS), default=COVARIANCE_METHOD, help="Estimateur de covariance de l'optimiseur")
+    args = parser.parse_args(argv)
+
+    if args.snapshot_dir: SNAPSHOT_DIR = args.snapshot_dir
+    results = run_pipeline(args.source, with_frontier=args.frontier, cov_method=args.covariance)
+    for level, message in results['notices']: print(f"[{level.upper()}] {message}", file=sys.stderr)
+    if results['error']: print(f"[ERROR] {results['error']}", file=sys.stderr); return 1
+    path = save_results(results)
+    if path is None: print("[ERROR] Could not write results.", file=sys.stderr); return 1
+    print(f"Results for data version {results['data_version'][:12]} written to {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+EQUITIES = [f"EQ{i} Equity" for i in range(8)]
+BONDS = [f"BD{i} Govt" for i in range(3)]
+COMMODITIES = [f"CM{i} Comdty" for i in range(2)]
+FX_TICKER = 'EURUSD Curncy'
+CASH_TICKER = 'CASH EUR'
+
+
+def write_workbook(path, n_days=300, seed=0):
+    """Classeur au format de la source (Benchmark, Historique Prix, Portefeuille), cash coté compris."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end='2026-01-15', periods=n_days)
+    assets = EQUITIES + BONDS + COMMODITIES
+    vols = np.array([0.012] * len(EQUITIES) + [0.004] * len(BONDS) + [0.015] * len(COMMODITIES))
+    prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0.0003, vols, size=(n_days, len(assets))), axis=0)), index=dates, columns=assets)
+    prices[FX_TICKER] = 1.1 * np.exp(np.cumsum(rng.normal(0.0, 0.005, n_days)))
+    prices[CASH_TICKER] = 100.0 # Colonne cash cotée: tous les tickers du portefeuille ont un prix
+    classes = ['Action'] * len(EQUITIES) + ['Gov bond'] * len(BONDS) + ['Commodities'] * len(COMMODITIES)
+    benchmark = pd.DataFrame({'Name': assets, 'BBG Ticker': assets, 'Asset Class': classes})
+
+    columns = list(prices.columns)
+    rows = [['junk'] + [''] * len(columns)] * 3 + [['Unnamed'] + columns] + [['x'] + ['PX_LAST'] * len(columns)] + [['Dates'] + [''] * len(columns)]
+    rows += [[date] + list(row) for date, row in zip(prices.index, prices.to_numpy())]
+
+    held = assets[:11] + [CASH_TICKER]
+    portfolio = pd.DataFrame({'A': '', 'B': '', 'Ticker': held, 'D': '', 'E': '', 'Weight': 100.0 / len(held)})
+    with pd.ExcelWriter(path) as writer:
+        benchmark.to_excel(writer, sheet_name='Benchmark', index=False)
+        pd.DataFrame(rows).to_excel(writer, sheet_name='Historique Prix', index=False, header=False)
+        pd.DataFrame([['title']]).to_excel(writer, sheet_name='Portefeuille', index=False, header=False)
+        portfolio.to_excel(writer, sheet_name='Portefeuille', index=False, startrow=1)
+    return str(path)
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    """Snapshots isolés dans tmp_path (SNAPSHOT_DIR est lu à l'import depuis DASHBOARD_SNAPSHOT_DIR)."""
+    import engine
+    path = str(tmp_path / 'snapshots')
+    monkeypatch.setenv('DASHBOARD_SNAPSHOT_DIR', path)
+    monkeypatch.setattr(engine, 'SNAPSHOT_DIR', path)
+    return path
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    return write_workbook(tmp_path / 'workbook.xlsx')
@@ -0,0 +1,15 @@
+import os
+
+import engine
+from conftest import ROOT
+
+
+def test_dashboard_runs_on_local_workbook(workbook, snapshot_dir, monkeypatch):
+    from streamlit.testing.v1 import AppTest
+    monkeypatch.setattr(engine, 'EXCEL_URL', workbook)
+    app = AppTest.from_file(os.path.join(ROOT, 'dashboard.py'), default_timeout=300).run()
+    assert not app.exception, [e.value for e in app.exception]
+    for tab in ('HOLDINGS', 'ANALYTICS', 'OPTIMIZATION', 'MONITOR'): # Seul l'onglet ouvert est calculé: les parcourir tous
+        app.session_state['main_tab'] = tab
+        app.run()
+        assert not app.exception, (tab, [e.value for e in app.exception])
@@ -0,0 +1,284 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import engine
+
+
+def test_load_data_single_download(workbook, snapshot_dir, monkeypatch):
+    calls = []
+    fetch = engine.fetch_workbook_bytes
+    monkeypatch.setattr(engine, 'fetch_workbook_bytes', lambda source: calls.append(source) or fetch(source))
+    benchmark_df, prices_df, portfolio_df, data_version = engine.load_data(workbook)
+    assert calls == [workbook]
+    assert {'BBG Ticker', 'Asset Class'} <= set(benchmark_df.columns)
+    assert isinstance(prices_df.index, pd.DatetimeIndex) and 'EURUSD Curncy' in prices_df.columns
+    assert portfolio_df['Weight'].sum() == pytest.approx(1.0)
+    assert len(data_version) == 64 and engine.latest_snapshot_hash() == data_version
+
+
+def test_snapshot_round_trip(workbook, snapshot_dir, monkeypatch):
+    frames = engine.load_data(workbook)
+    for original, stored in zip(frames[:3], engine.read_snapshot(frames[3])):
+        pd.testing.assert_frame_equal(original, stored)
+    monkeypatch.setattr(engine, 'parse_workbook', lambda content: pytest.fail("snapshot not reused"))
+    reloaded = engine.load_data(workbook)
+    assert reloaded[3] == frames[3]
+    for original, stored in zip(frames[:3], reloaded[:3]):
+        pd.testing.assert_frame_equal(original, stored)
+
+
+def test_fallback_to_last_good_snapshot(workbook, snapshot_dir, tmp_path):
+    frames = engine.load_data(workbook)
+    with pytest.warns(engine.EngineMessage, match='last good snapshot'):
+        fallback = engine.load_data(str(tmp_path / 'missing.xlsx'))
+    assert fallback[3] == frames[3]
+    for original, stored in zip(frames[:3], fallback[:3]):
+        pd.testing.assert_frame_equal(original, stored)
+
+
+def test_missing_source_without_snapshot(snapshot_dir, tmp_path):
+    with pytest.warns(engine.EngineError, match='Error loading data'):
+        assert engine.load_data(str(tmp_path / 'missing.xlsx')) == (None, None, None, None)
+
+
+def raw_prices(n_days=60, seed=1):
+    """Prix bruts avec trous, un ticker coté en cours de route et un ticker vide au début."""
+    rng = np.random.default_rng(seed)
+    prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.01, (n_days, 4)), axis=0)),
+                          index=pd.bdate_range('2025-01-01', periods=n_days), columns=['A', 'B', 'LATE', 'EMPTY'])
+    prices.iloc[[5, 6, 20, 50], 1] = np.nan # Trous isolés
+    prices.iloc[:10, 2] = np.nan # NaN en tête
+    prices.iloc[:48, 3] = np.nan # Vide sur tout l'ancien historique
+    return prices
+
+
+def test_incremental_refresh_matches_full_rebuild():
+    prices = raw_prices(); prices['NEW'] = prices['A'] * 1.5 # Nouveau ticker
+    old = prices.iloc[:45].drop(columns='NEW')
+    prev_hist, prev_returns = engine._clean_prices_full(old)
+    hist, returns = engine.update_prices_incremental(prices, old, prev_hist, prev_returns)
+    full_hist, full_returns = engine._clean_prices_full(prices)
+    pd.testing.assert_frame_equal(hist, full_hist, check_freq=False)
+    pd.testing.assert_frame_equal(returns, full_returns, check_freq=False)
+
+
+def test_incremental_refresh_rejects_revised_history():
+    prices = raw_prices(); old = prices.iloc[:45]
+    prev_hist, prev_returns = engine._clean_prices_full(old)
+    revised = prices.copy(); revised.iloc[30, 0] *= 1.01
+    assert engine.update_prices_incremental(revised, old, prev_hist, prev_returns) is None
+    assert engine.update_prices_incremental(prices.drop(columns='B'), old, prev_hist, prev_returns) is None
+
+
+def test_nav_from_returns_matches_daily_loop():
+    rng = np.random.default_rng(2)
+    gross = rng.normal(0.0003, 0.01, 80); fees = rng.uniform(0, 1e-4, 80)
+    for fee in (2.7e-5, fees):
+        expected = [100.0] # Boucle jour par jour d'origine: le premier jour vaut 100
+        for day in range(1, len(gross)): expected.append(expected[-1] * (1 + gross[day]) * (1 - np.broadcast_to(fee, gross.shape)[day]))
+        np.testing.assert_allclose(engine.nav_from_returns(gross, fee), expected, rtol=1e-12)
+    matrix = rng.normal(0.0, 0.01, (80, 3))
+    np.testing.assert_allclose(engine.nav_from_returns(matrix, 2.7e-5)[:, 1], engine.nav_from_returns(matrix[:, 1], 2.7e-5), rtol=1e-12)
+    cash = engine.accrued_cash_values(50.0, 4e-5, 10)
+    np.testing.assert_allclose(cash[1:] / cash[:-1], 1 + 4e-5); assert cash[0] == 50.0
+
+
+def square_or_fail(x):
+    if x < 0: raise ValueError(f"negative input {x}")
+    return x * x
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parallel_map_order_and_worker_errors(workers, monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+    assert engine.parallel_map(square_or_fail, [(x,) for x in range(6)], workers) == [x * x for x in range(6)]
+    consumed = []
+    assert engine.parallel_map(square_or_fail, [(x,) for x in range(3)], workers, consume=consumed.append) is None
+    assert consumed == [0, 1, 4]
+    with pytest.raises(ValueError, match='negative'): # Erreur du worker propagée, pas de repli séquentiel silencieux
+        engine.parallel_map(square_or_fail, [(1,), (-1,)], workers)
+
+
+def test_run_pipeline_on_local_workbook(workbook, snapshot_dir):
+    results = engine.run_pipeline(workbook, with_frontier=True)
+    assert results['error'] is None, results['notices']
+    assert results['comparison'] is not None and results['sim_ind'] is not None and results['frontier'] is not None
+    assert engine.save_results(results) is not None
+    assert engine.load_latest_results()['data_version'] == results['data_version']
+
+
+def test_rolling_analytics_matches_pandas_rolling():
+    rng = np.random.default_rng(3); window = 20
+    returns = pd.DataFrame(rng.normal(0.0004, 0.01, (120, 3)), index=pd.bdate_range('2025-01-01', periods=120), columns=['A', 'B', 'LATE'])
+    returns.iloc[:30, 2] = np.nan # Fenêtres incomplètes -> NaN, comme pandas
+    bench = pd.Series(rng.normal(0.0003, 0.008, 120), index=returns.index)
+    result = engine.rolling_analytics(returns, bench, window)
+    rolling, annual = returns.rolling(window), np.sqrt(engine.TRADING_DAYS)
+    expected = {'Volatilité': rolling.std() * annual,
+                'Sharpe': (rolling.mean() - engine.calculate_daily_rates()[1]) / rolling.std() * annual,
+                'Beta': rolling.cov(bench) / bench.rolling(window).var().to_numpy()[:, None],
+                'Correlation': rolling.corr(bench),
+                'Tracking Error': returns.sub(bench, axis=0).rolling(window).std() * annual}
+    for name, frame in expected.items():
+        pd.testing.assert_frame_equal(result[name], frame.iloc[window - 1:], check_freq=False, rtol=1e-9, atol=1e-12, obj=name)
+
+
+def monte_carlo_inputs():
+    rng = np.random.default_rng(4); assets = ['A', 'B', 'C']
+    returns = pd.DataFrame(rng.normal(0.0003, 0.01, (250, 3)), index=pd.bdate_range('2025-01-01', periods=250), columns=assets)
+    weights = pd.DataFrame([[0.5, 0.3, 0.2], [0.2, 0.2, 0.6]], index=['P1', 'P2'], columns=assets)
+    return weights, returns.mean(), returns.cov(), returns
+
+
+@pytest.mark.parametrize('method', ['cholesky', 'bootstrap'])
+def test_monte_carlo_var_independent_of_workers(method, monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+    weights, mu, cov, returns = monte_carlo_inputs()
+    kwargs = dict(returns_hist=returns, method=method, n_paths=3000, horizons=(1, 5), chunk_size=1000, seed=7)
+    table_1, distribution_1 = engine.monte_carlo_var(weights, mu, cov, workers=1, **kwargs)
+    table_2, distribution_2 = engine.monte_carlo_var(weights, mu, cov, workers=2, **kwargs)
+    pd.testing.assert_frame_equal(table_1, table_2)
+    pd.testing.assert_frame_equal(distribution_1, distribution_2)
+
+
+def test_monte_carlo_var_matches_full_simulation():
+    weights, mu, cov, _ = monte_carlo_inputs()
+    n_paths, chunk_size, confidence = 2500, 1000, 0.95
+    table, _ = engine.monte_carlo_var(weights, mu, cov, n_paths=n_paths, horizons=(10,), confidence=confidence, chunk_size=chunk_size, seed=3)
+    # Simulation complète avec les mêmes graines: toutes les trajectoires conservées (n_tail = taille du bloc)
+    W = weights.to_numpy().T; S_p = W.T @ cov.to_numpy() @ W
+    chol = np.linalg.cholesky(S_p + np.eye(2) * np.trace(S_p) / 2 * 1e-10); bins = np.linspace(-1, 1, 11)
+    sizes = [1000, 1000, 500]
+    terminal = np.concatenate([engine._monte_carlo_chunk(seed, size, (10,), mu.to_numpy() @ W, chol, None, size, bins)[10]['tail']
+                               for seed, size in zip(np.random.SeedSequence(3).spawn(len(sizes)), sizes)])
+    var = np.quantile(terminal, 1 - confidence, axis=0, method='inverted_cdf')
+    np.testing.assert_allclose(table['VaR 95%'], var, rtol=1e-12)
+    np.testing.assert_allclose(table['CVaR 95%'], [terminal[terminal[:, j] <= var[j], j].mean() for j in range(2)], rtol=1e-12)
+    np.testing.assert_allclose(table['Mean'], terminal.mean(axis=0), rtol=1e-10)
+
+
+def test_return_store_window_matches_compounded_returns():
+    rng = np.random.default_rng(5)
+    returns = pd.DataFrame(rng.normal(0.0003, 0.01, (90, 3)), index=pd.bdate_range('2025-01-01', periods=90), columns=['A', 'B', 'LATE'])
+    returns.iloc[:25, 2] = np.nan # Ticker coté en cours de route
+    store = engine.ReturnStore(returns)
+    for start, end in ((None, None), (returns.index[9], returns.index[59]), (returns.index[14], returns.index[39])):
+        window = returns[(returns.index > (start or returns.index[0] - pd.Timedelta(days=1))) & (returns.index <= (end or returns.index[-1]))]
+        pd.testing.assert_series_equal(store.cumulative_return(start, end), (1 + window).prod() - 1, rtol=1e-12)
+        stats = store.window_stats(start, end)
+        pd.testing.assert_series_equal(stats['Volatilité'], window.std() * np.sqrt(engine.TRADING_DAYS), rtol=1e-10, check_names=False)
+        assert stats['Observations'].tolist() == window.count().tolist()
+
+
+def test_what_if_edits_match_fresh_batch_simulation():
+    rng = np.random.default_rng(6); assets = ['A', 'B', 'C', engine.CASH_TICKER_NAME]
+    returns = pd.DataFrame(rng.normal(0.0004, 0.01, (120, 3)), index=pd.bdate_range('2025-09-01', periods=120), columns=assets[:3])
+    bench = pd.Series(rng.normal(0.0003, 0.008, 120), index=returns.index)
+    start = returns.index[40]
+    model = engine.WhatIfPortfolio(pd.Series([0.3, 0.3, 0.3, 0.1], index=assets), returns, start, bench)
+    for asset, weight in (('A', 0.5), ('C', 0.05), (engine.CASH_TICKER_NAME, 0.25), ('A', 0.2)): model.set_weight(asset, weight)
+    navs, metrics = engine.simulate_portfolios_batch(pd.DataFrame([model.weights], columns=assets), returns, start, bench)
+    result = model.metrics()
+    np.testing.assert_allclose(model.nav().to_numpy(), navs.iloc[:, 0].to_numpy(), rtol=1e-12)
+    assert result['NAV'] == pytest.approx(navs.iloc[-1, 0], rel=1e-12)
+    for name in ('Volatilité', 'Sharpe', 'Tracking Error', 'Performance'):
+        assert result[name] == pytest.approx(metrics.iloc[0][name], rel=1e-9), name
+
+
+def test_convert_prices_to_eur_divides_by_eurusd():
+    dates = pd.bdate_range('2025-01-01', periods=4)
+    prices = pd.DataFrame({'EQ': [100.0, 101, 102, 103], 'OIL': [70.0, 71, 72, 73], 'EURUSD Curncy': [1.10, 1.12, np.nan, 1.05]}, index=dates)
+    benchmark = pd.DataFrame({'BBG Ticker': ['EQ', 'OIL'], 'Asset Class': ['Action', 'Commodities']})
+    currencies = engine.detect_currencies(benchmark, prices.columns)
+    assert currencies.to_dict() == {'EQ': 'EUR', 'OIL': 'USD', 'EURUSD Curncy': 'EUR'}
+    converted = engine.convert_prices_to_eur(prices, currencies)
+    # EURUSD = USD pour 1 EUR: 70 USD à 1.10 valent 63.64 EUR; fixing manquant -> prix laissé en devise locale
+    np.testing.assert_allclose(converted['OIL'], [70 / 1.10, 71 / 1.12, 72.0, 73 / 1.05])
+    pd.testing.assert_frame_equal(converted[['EQ', 'EURUSD Curncy']], prices[['EQ', 'EURUSD Curncy']])
+
+
+def test_brinson_linked_effects_sum_to_active_return(workbook, snapshot_dir):
+    results = engine.run_pipeline(workbook, with_optimization=False)
+    attribution = engine.brinson_attribution(results['portfolio_df'], results['benchmark_df'], results['returns_all'])
+    dates = attribution.index
+    for start, end in ((None, None), (dates[5], dates[30])):
+        assert attribution.attribution(start, end)['Total'].sum() == pytest.approx(attribution.returns(start, end)['Active'], abs=1e-12)
+    assert attribution.cumulative().iloc[-1].sum() == pytest.approx(attribution.returns()['Active'], abs=1e-12)
+
+
+def test_brinson_attribution_missing_ticker(workbook, snapshot_dir):
+    results = engine.run_pipeline(workbook, with_optimization=False)
+    portfolio = pd.concat([results['portfolio_df'], pd.DataFrame({'BBG Ticker': ['UNPRICED Equity'], 'Weight': [0.0]})], ignore_index=True)
+    portfolio.loc[0, 'Weight'] -= 0.02; portfolio.loc[len(portfolio) - 1, 'Weight'] = 0.02
+    with pytest.warns(engine.EngineMessage, match='UNPRICED Equity'):
+        attribution = engine.brinson_attribution(portfolio, results['benchmark_df'], results['returns_all'])
+    assert np.isfinite(attribution.attribution().to_numpy(dtype=float)).all()
+    assert np.isfinite(attribution.returns().to_numpy(dtype=float)).all()
+
+
+def test_bootstrap_intervals_independent_of_workers(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+    rng = np.random.default_rng(8)
+    sim_returns = pd.DataFrame(rng.normal(0.0004, 0.01, (120, 2)), index=pd.bdate_range('2025-10-07', periods=120), columns=['Portfolio', 'Benchmark'])
+    kwargs = dict(n_resamples=600, chunk_size=200, seed=11)
+    intervals = engine.bootstrap_confidence_intervals(sim_returns, workers=1, **kwargs)
+    pd.testing.assert_frame_equal(intervals, engine.bootstrap_confidence_intervals(sim_returns, workers=2, **kwargs))
+    vol = intervals.set_index(['Series', 'Metric']).loc[('Portfolio', 'Volatilité')]
+    assert vol['Estimate'] == pytest.approx(sim_returns['Portfolio'].std() * np.sqrt(engine.TRADING_DAYS), rel=1e-12)
+    assert (intervals['Lower'] <= intervals['Upper']).all()
+
+
+def allocator_inputs(n_assets=24, seed=9):
+    """mu/S d'un univers à trois facteurs plus une colonne cash à variance nulle."""
+    rng = np.random.default_rng(seed); n_days = 400
+    factors = rng.normal(0, 0.008, (n_days, 3)); loadings = rng.uniform(0.2, 1.2, (3, n_assets))
+    returns = pd.DataFrame(factors @ loadings + rng.normal(0.0003, rng.uniform(0.003, 0.015, n_assets), (n_days, n_assets)),
+                           columns=[f"A{i}" for i in range(n_assets)])
+    returns[engine.CASH_TICKER_NAME] = 0.0
+    return returns.mean(), returns
+
+
+def slsqp_reference(objective, n_assets, cap):
+    from scipy.optimize import minimize
+    result = minimize(objective, np.full(n_assets, 1.0 / n_assets), method='SLSQP', bounds=[(0.0, cap)] * n_assets,
+                      constraints=[{'type': 'eq', 'fun': lambda w: w.sum() - 1.0}], options={'ftol': 1e-15, 'maxiter': 1000})
+    assert result.success, result.message
+    return result.x
+
+
+@pytest.mark.parametrize('cov_method', ['sample', 'factor'])
+@pytest.mark.parametrize('key', list(engine.ALLOCATORS))
+def test_allocators_respect_budget_and_cap(key, cov_method):
+    mu, returns = allocator_inputs()
+    S = engine.covariance_operator(engine.estimate_covariance(returns, cov_method))
+    weights = engine.ALLOCATORS[key][1](mu.to_numpy(), S, engine.ASSET_WEIGHT_LIMIT)
+    assert weights.sum() == pytest.approx(1.0, abs=1e-9)
+    assert weights.min() >= -1e-12 and weights.max() <= engine.ASSET_WEIGHT_LIMIT + 1e-9
+
+
+@pytest.mark.parametrize('cap', [1.0, 0.06]) # 6%: plafond atteint par les actifs les moins volatils
+def test_equal_risk_contributions(cap):
+    mu, returns = allocator_inputs()
+    S = returns.cov().to_numpy(); risky = np.diag(S) > 0
+    weights = engine.allocate_equal_risk(mu.to_numpy(), S, cap)
+    contributions = engine.risk_contributions(weights, S)[risky]
+    free = weights[risky] < cap - 1e-9 # Lignes au plafond exclues: les autres se partagent le risque à parts égales
+    assert free.sum() >= 2 and weights[~risky].sum() == 0
+    np.testing.assert_allclose(contributions[free], contributions[free].mean(), rtol=1e-9)
+
+
+def test_min_variance_and_max_diversification_match_slsqp():
+    mu, returns = allocator_inputs(); cap = engine.ASSET_WEIGHT_LIMIT
+    S = returns.cov().to_numpy(); risky = np.diag(S) > 0; S_risky = S[np.ix_(risky, risky)]; sigma = np.sqrt(np.diag(S_risky))
+    min_variance = engine.allocate_min_variance(mu.to_numpy(), S, cap)
+    reference = slsqp_reference(lambda w: w @ S @ w * 1e4, len(S), cap)
+    assert min_variance @ S @ min_variance <= reference @ S @ reference * (1 + 1e-8)
+    np.testing.assert_allclose(min_variance, reference, atol=1e-6)
+    def ratio(w): return w @ sigma / np.sqrt(w @ S_risky @ w)
+    max_diversification = engine.allocate_max_diversification(mu.to_numpy(), S, cap)[risky]
+    reference = slsqp_reference(lambda w: -ratio(w), len(S_risky), cap)
+    assert ratio(max_diversification) >= ratio(reference) * (1 - 1e-9)
+    np.testing.assert_allclose(max_diversification, reference, atol=1e-5)